@@ -0,0 +1,171 @@
+import math
+from collections import Counter, defaultdict
+from decimal import Decimal
+from django.db.models import Avg, Count, DecimalField, F, FloatField, IntegerField, Max, Min, Q, Sum, Value
+from django.db.models import ExpressionWrapper, Window
+from django.db.models.functions import Ceil, Coalesce, Greatest, RowNumber, TruncMonth
+from .models import Company, Department, Employee, PayrollSummary
+from .sharding import DIRECTORY, company_shards, fan_out, is_sharded
+
+DEFAULT_PERCENTILES = (50, 90)
+
+
+def _salary_aggregates(prefix=""):
+    salary = f"{prefix}salary"
+    return {
+        "headcount": Count(f"{prefix}id"),
+        "salary_total": Coalesce(Sum(salary), Value(Decimal("0")), output_field=DecimalField()),
+        "salary_avg": Avg(salary),
+        "salary_min": Min(salary),
+        "salary_max": Max(salary),
+    }
+
+
+def _rank(percentile, group_size):
+    # nearest-rank method, the same arithmetic is done in SQL by salary_percentiles()
+    return max(math.ceil(group_size * (percentile / 100.0)), 1)
+
+
+# nearest-rank salary percentiles of every group in a single query: the employees are
+# numbered by salary inside their group with window functions and only the rows sitting
+# at one of the requested ranks are returned. Returns {group id: {percentile: salary}}
+def salary_percentiles(group_field, percentiles):
+    ranked = Employee.objects.annotate(
+        position=Window(RowNumber(), partition_by=[F(group_field)], order_by=[F("salary").asc(), F("id").asc()]),
+        group_size=Window(Count("id"), partition_by=[F(group_field)]),
+    )
+    condition = Q()
+    for percentile in percentiles:
+        rank = Greatest(
+            Ceil(ExpressionWrapper(F("group_size") * Value(percentile / 100.0), output_field=FloatField())),
+            Value(1),
+            output_field=IntegerField(),
+        )
+        condition |= Q(position=rank)
+
+    result = defaultdict(dict)
+    for group, position, group_size, salary in ranked.filter(condition).values_list(
+        group_field, "position", "group_size", "salary"
+    ):
+        for percentile in percentiles:
+            if _rank(percentile, group_size) == position:
+                result[group][str(percentile)] = salary
+    return result
+
+
+def company_salary_stats(percentiles):
+    companies = list(
+        Company.objects.values("id", "name").annotate(**_salary_aggregates("employee__")).order_by("id")
+    )
+    by_company = salary_percentiles("company_id", percentiles) if percentiles else {}
+    for company in companies:
+        company["salary_percentiles"] = by_company.get(company["id"], {})
+    return companies
+
+
+def department_salary_stats(percentiles):
+    departments = list(
+        Department.objects.values("id", "name", "company").annotate(**_salary_aggregates("employee__")).order_by("id")
+    )
+    by_department = salary_percentiles("department_id", percentiles) if percentiles else {}
+    for department in departments:
+        department["salary_percentiles"] = by_department.get(department["id"], {})
+    return departments
+
+
+def hiring_histogram():
+    return list(
+        Employee.objects.annotate(month=TruncMonth("date_hired"))
+        .values("month")
+        .annotate(hires=Count("id"))
+        .order_by("month")
+    )
+
+
+# company and department stats read from the materialized PayrollSummary rows,
+# so the cost depends on the number of departments rather than employees
+def summary_salary_stats():
+    totals = {
+        "headcount": Sum("headcount"),
+        "salary_total": Sum("salary_total"),
+        "salary_min": Min("salary_min"),
+        "salary_max": Max("salary_max"),
+    }
+    companies = list(
+        PayrollSummary.objects.values("company").annotate(name=F("company__name"), **totals).order_by("company")
+    )
+    departments = list(
+        PayrollSummary.objects.values("department").annotate(
+            name=F("department__name"), company=F("department__company"), **totals
+        ).order_by("department")
+    )
+    for group, key in ((companies, "company"), (departments, "department")):
+        for row in group:
+            row["id"] = row.pop(key)
+            row["salary_avg"] = row["salary_total"] / row["headcount"] if row["headcount"] else None
+    return companies, departments
+
+
+# load() -> (companies, departments, hiring histogram) run on every shard at once and
+# merged: a company is reported by the shard holding it (the others only have a copy or
+# nothing), departments are on one shard each and the monthly hires add up
+def across_shards(load):
+    if not is_sharded():
+        return load()
+    placement = company_shards()
+    companies, departments, hiring = [], [], Counter()
+    for alias, (shard_companies, shard_departments, shard_hiring) in fan_out(lambda alias: (alias, load())):
+        companies += [company for company in shard_companies if placement.get(company["id"], DIRECTORY) == alias]
+        departments += shard_departments
+        for row in shard_hiring:
+            hiring[row["month"]] += row["hires"]
+    return (
+        sorted(companies, key=lambda company: company["id"]),
+        sorted(departments, key=lambda department: department["id"]),
+        [{"month": month, "hires": hires} for month, hires in sorted(hiring.items())],
+    )
+
+
+# recompute the summary rows of the given (company id, department id) pairs
+def refresh_payroll_summary(groups):
+    for company_id, department_id in set(groups):
+        employees = Employee.objects.filter(company_id=company_id, department_id=department_id)
+        totals = employees.aggregate(
+            headcount=Count("id"),
+            salary_total=Sum("salary"),
+            salary_min=Min("salary"),
+            salary_max=Max("salary"),
+        )
+        if totals["headcount"]:
+            PayrollSummary.objects.update_or_create(
+                company_id=company_id, department_id=department_id, defaults=totals
+            )
+        else:
+            # also keeps cascaded company / department deletes from recreating rows
+            PayrollSummary.objects.filter(company_id=company_id, department_id=department_id).delete()
+
+
+# rebuild the whole summary table from a single grouped query
+def rebuild_payroll_summary():
+    rows = (
+        Employee.objects.values("company", "department")
+        .annotate(
+            headcount=Count("id"),
+            salary_total=Sum("salary"),
+            salary_min=Min("salary"),
+            salary_max=Max("salary"),
+        )
+        .order_by()
+    )
+    PayrollSummary.objects.all().delete()
+    return PayrollSummary.objects.bulk_create(
+        PayrollSummary(
+            company_id=row["company"],
+            department_id=row["department"],
+            headcount=row["headcount"],
+            salary_total=row["salary_total"],
+            salary_min=row["salary_min"],
+            salary_max=row["salary_max"],
+        )
+        for row in rows
+    )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApisConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'APIs'
+
+    def ready(self):
+        # metrics instruments every database connection as it is opened, from the first one
+        from . import metrics, signals  # noqa: F401
@@ -0,0 +1,209 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import AuditRecord, Company, Department, Employee
+
+logger = logging.getLogger(__name__)
+
+# Append-only history of the companies, departments and employees. A save or delete
+# only takes a snapshot of the row in memory; once its transaction commits the record
+# joins the process buffer, which is written with one bulk_create when it holds
+# AUDIT_BUFFER_SIZE records (by default 1: every record is written on commit), or with
+# a larger buffer at the end of the first request finishing AUDIT_FLUSH_SECONDS after
+# the oldest one was buffered, before the history is read and at exit. The field-level
+# diffs are computed while flushing, against the stored record preceding each one by
+# recorded_at, so the flushes of several processes may arrive in any order. Buffered
+# records are lost if the process is killed, buffering is an opt-in trade-off.
+
+MODEL_NAMES = {Company: "company", Department: "department", Employee: "employee"}
+UNTRACKED = {"id", "creation_time", "last_updated"}
+
+
+def tracked_fields(model):
+    return [field.name for field in model._meta.concrete_fields if field.name not in UNTRACKED]
+
+
+# JSON state of a row, formatted like the API does (decimals with their places, ISO
+# dates, related objects by primary key), keep in line with migration 0008
+def snapshot(instance):
+    state = {}
+    for name in tracked_fields(type(instance)):
+        field = instance._meta.get_field(name)
+        value = field.to_python(field.value_from_object(instance))
+        if value is not None and isinstance(field, models.DecimalField):
+            value = str(value.quantize(Decimal(1).scaleb(-field.decimal_places)))
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        state[name] = value
+    return state
+
+
+def diff(previous, state):
+    previous = previous or {}
+    return {
+        field: [previous.get(field), value]
+        for field, value in state.items()
+        if field not in previous or previous[field] != value
+    }
+
+
+class AuditBuffer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # one flush at a time so the diffs of a row are computed in order
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._oldest = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def add(self, records):
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(records)
+            full = len(self._pending) >= settings.AUDIT_BUFFER_SIZE
+        if full:
+            self.flush()
+
+    def due(self):
+        with self._lock:
+            return bool(self._pending) and time.monotonic() - self._oldest >= settings.AUDIT_FLUSH_SECONDS
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+    # writes the buffered records, returns how many were written
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if not records:
+                return 0
+            try:
+                return write(records)
+            except Exception:
+                logger.exception("could not write %s audit records", len(records))
+                with self._lock:
+                    self._pending[:0] = records
+                    self._oldest = time.monotonic()
+                return 0
+
+
+buffer = AuditBuffer()
+atexit.register(buffer.flush)
+
+
+# the stored records of the rows in the batch, in (recorded_at, id) order, from the one
+# preceding the oldest buffered record of the row on: usually that single record, more
+# when another process already flushed changes made after the buffered ones
+def _stored_timelines(records, using):
+    starts = {}
+    for record in records:
+        key = (record.model, record.object_id)
+        starts[key] = min(starts.get(key, record.recorded_at), record.recorded_at)
+    stored = AuditRecord.objects.using(using)
+    before = Q()
+    for (model, object_id), at in starts.items():
+        before |= Q(model=model, object_id=object_id, recorded_at__lt=at)
+    previous = stored.filter(before).values("model", "object_id").annotate(last=Max("recorded_at"))
+    for row in previous:
+        starts[(row["model"], row["object_id"])] = row["last"]
+
+    condition = Q()
+    for (model, object_id), at in starts.items():
+        condition |= Q(model=model, object_id=object_id, recorded_at__gte=at)
+    timelines = defaultdict(list)
+    for record in stored.filter(condition).order_by("recorded_at", "id"):
+        timelines[(record.model, record.object_id)].append(record)
+    return timelines
+
+
+# the diffs are computed along the recorded_at order, whatever order the records are
+# flushed in: a stored record following a buffered one gets its diff computed again
+def write(records):
+    # the previous states are read where the records are written, a replica may lag behind
+    using = router.db_for_write(AuditRecord)
+    timelines = _stored_timelines(records, using)
+    buffered = defaultdict(list)
+    for record in records:
+        buffered[(record.model, record.object_id)].append(record)
+
+    written, revised = [], []
+    for key, pending in buffered.items():
+        # at the same instant the stored records come first, the buffered ones keep their order
+        timeline = sorted(
+            [(record.recorded_at, False, number, record) for number, record in enumerate(timelines[key])]
+            + [(record.recorded_at, True, number, record) for number, record in enumerate(pending)],
+            key=lambda entry: entry[:3],
+        )
+        state, reordered = None, False
+        for _, is_buffered, _, record in timeline:
+            if record.action != AuditRecord.Action.DELETED and (is_buffered or reordered):
+                changes = diff(state, record.state)
+                if is_buffered and record.action == AuditRecord.Action.UPDATED and not changes:
+                    # a save that changed nothing is not part of the history
+                    continue
+                if not is_buffered and changes != record.changes:
+                    revised.append(record)
+                record.changes = changes
+            if is_buffered:
+                written.append(record)
+                reordered = True
+            state = record.state
+    AuditRecord.objects.using(using).bulk_create(written, batch_size=settings.AUDIT_BUFFER_SIZE)
+    if revised:
+        AuditRecord.objects.using(using).bulk_update(revised, ["changes"], batch_size=settings.AUDIT_BUFFER_SIZE)
+    return len(written)
+
+
+# buffers the records of saved / deleted rows once the current transaction commits
+def record(instances, action):
+    instances = list(instances)
+    if not settings.AUDIT_ENABLED or not instances:
+        return
+    now = timezone.now()
+    records = [
+        AuditRecord(
+            model=MODEL_NAMES[type(instance)],
+            object_id=instance.pk,
+            action=action,
+            recorded_at=now if action == AuditRecord.Action.DELETED else instance.last_updated or now,
+            state=snapshot(instance),
+        )
+        for instance in instances
+    ]
+    using = router.db_for_write(type(instances[0]), instance=instances[0])
+    transaction.on_commit(lambda: buffer.add(records), using=using)
+
+
+# records of one row, only the ones changing one of fields when given
+def history(model, pk, fields=None, since=None, until=None):
+    records = AuditRecord.objects.filter(model=MODEL_NAMES[model], object_id=pk)
+    if fields:
+        records = records.filter(changes__has_any_keys=fields)
+    if since is not None:
+        records = records.filter(recorded_at__gte=since)
+    if until is not None:
+        records = records.filter(recorded_at__lte=until)
+    return records
+
+
+# the latest record of a row at the given date, None when it did not exist yet
+def as_of(model, pk, at):
+    return (
+        AuditRecord.objects.filter(model=MODEL_NAMES[model], object_id=pk, recorded_at__lte=at)
+        .order_by("-recorded_at", "-id")
+        .first()
+    )
@@ -0,0 +1,271 @@
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from . import audit, events, search, sharding
+from .cache import invalidate_many
+from .models import Company, Department
+from .routers import is_sharded_model
+from .serializers import CompanySerializer, DepartmentBatchSerializer
+
+# Batch partial updates and upserts of companies and departments. Every item is
+# validated first, field by field with the resource serializer and with one query per
+# batch for the existence and uniqueness checks, then the whole batch is written in
+# one transaction: bulk_update for the items with an id and bulk_create (an upsert on
+# the natural key when the model has one) for the others. Bulk writes send no
+# signals, so the response cache, the search index, the change feed and the audit
+# history are refreshed here. When the rows are spread over shards the batch is split
+# per shard, see ShardedBatchWrite.
+
+MODES = ("atomic", "best_effort")
+
+
+class BatchWrite:
+    model = None
+    serializer_class = None
+    # upsert the items without an id on these fields, None to always insert them
+    unique_fields = None
+
+    def __init__(self, items):
+        self.items = items
+        self.results = [None] * len(items)
+        self.updates = {}
+        self.creates = {}
+        self.upserts = set()
+        self.changed = set()
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result is not None and result["status"] == "error"]
+
+    def reject(self, index, errors):
+        self.updates.pop(index, None)
+        self.creates.pop(index, None)
+        self.results[index] = {"index": index, "status": "error", "errors": errors}
+
+    def pending(self):
+        return {**self.updates, **self.creates}
+
+    def validate(self):
+        ids = {}
+        for index, item in enumerate(self.items):
+            if not isinstance(item, dict):
+                self.reject(index, {"non_field_errors": ["Expected an object."]})
+            elif item.get("id") is not None:
+                try:
+                    ids[index] = int(item["id"])
+                except (TypeError, ValueError):
+                    self.reject(index, {"id": ["A valid integer is required."]})
+
+        existing = self.model.objects.select_for_update().in_bulk(set(ids.values()))
+        seen = set()
+        for index, item in enumerate(self.items):
+            if self.results[index] is not None:
+                continue
+            instance = None
+            if index in ids:
+                instance = existing.get(ids[index])
+                if instance is None:
+                    self.reject(index, {"id": ["Not found."]})
+                    continue
+                if instance.pk in seen:
+                    self.reject(index, {"id": ["Appears more than once in the batch."]})
+                    continue
+                seen.add(instance.pk)
+            serializer = self.serializer_class(instance, data=item, partial=instance is not None)
+            if not serializer.is_valid():
+                self.reject(index, serializer.errors)
+            elif instance is None:
+                self.creates[index] = self.model(**serializer.validated_data)
+            else:
+                for field, value in serializer.validated_data.items():
+                    setattr(instance, field, value)
+                self.changed.update(serializer.validated_data)
+                self.updates[index] = instance
+        self.validate_batch()
+
+    # checks spanning the whole batch, one query each
+    def validate_batch(self):
+        pass
+
+    def create(self, instances):
+        if self.unique_fields is None:
+            return self.model.objects.bulk_create(instances)
+        return self.model.objects.bulk_create(
+            instances,
+            update_conflicts=True,
+            unique_fields=self.unique_fields,
+            update_fields=self.upsert_fields(),
+        )
+
+    def upsert_fields(self):
+        excluded = {"id", "creation_time", *self.unique_fields}
+        return [field.name for field in self.model._meta.concrete_fields if field.name not in excluded]
+
+    def save(self):
+        batch_size = settings.BATCH_WRITE_CHUNK_SIZE
+        if self.updates:
+            now = timezone.now()
+            for instance in self.updates.values():
+                instance.last_updated = now
+            fields = sorted(self.changed | {"last_updated"})
+            self.model.objects.bulk_update(self.updates.values(), fields, batch_size=batch_size)
+        if self.creates:
+            self.create(list(self.creates.values()))
+
+        for index, instance in self.updates.items():
+            self.results[index] = {"index": index, "id": instance.pk, "status": "updated"}
+        for index, instance in self.creates.items():
+            status = "updated" if index in self.upserts else "created"
+            self.results[index] = {"index": index, "id": instance.pk, "status": status}
+
+        events.publish_many_on_commit(self.updates.values(), "updated")
+        for index, instance in self.creates.items():
+            events.publish_on_commit(instance, "updated" if index in self.upserts else "created")
+        audit.record(self.updates.values(), "updated")
+        audit.record([instance for index, instance in self.creates.items() if index in self.upserts], "updated")
+        audit.record([instance for index, instance in self.creates.items() if index not in self.upserts], "created")
+
+        written = list(self.pending().values())
+        pks = [instance.pk for instance in written]
+        transaction.on_commit(lambda: invalidate_many(self.model, pks), using=router.db_for_write(self.model))
+        for start in range(0, len(written), batch_size):
+            search.index_objects(written[start:start + batch_size], router.db_for_write(self.model))
+
+    def skip(self):
+        for index in self.pending():
+            self.results[index] = {"index": index, "status": "skipped"}
+
+    # validates the batch and writes it in one transaction, in atomic mode nothing is
+    # written when an item is invalid. Returns the per item results
+    def run(self, mode="atomic"):
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            self.validate()
+            if mode == "atomic" and self.errors:
+                self.skip()
+            else:
+                self.save()
+        return self.results
+
+
+class ShardedBatchWrite:
+    # a batch of rows kept on the shards of their companies: the items are grouped per
+    # shard, every group is validated in a transaction of its shard, then all of them are
+    # written (or, in atomic mode with an invalid item anywhere, skipped). The
+    # transactions are committed one shard after the other
+
+    def __init__(self, batch_class, items):
+        self.batch_class = batch_class
+        self.items = items
+        self.groups = {}
+
+    @property
+    def errors(self):
+        return [error for _, batch in self.groups.values() for error in batch.errors]
+
+    # {shard: item indexes}, an item goes to the shard of its row or of its new company.
+    # Items whose shard is unknown go to default, where they fail validation as usual
+    def split(self):
+        ids = {}
+        for index, item in enumerate(self.items):
+            if isinstance(item, dict) and item.get("id") is not None:
+                try:
+                    ids[index] = int(item["id"])
+                except (TypeError, ValueError):
+                    pass
+        located = sharding.locate_many(self.batch_class.model, ids.values())
+        companies = {
+            index: located.get(ids[index]) if index in ids else item.get("company") if isinstance(item, dict) else None
+            for index, item in enumerate(self.items)
+        }
+        placement = sharding.company_shards([company for company in companies.values() if company is not None], True)
+        groups = {}
+        for index, company in companies.items():
+            alias = placement.get(sharding.as_company_id(company), sharding.DIRECTORY)
+            groups.setdefault(alias, []).append(index)
+        return groups
+
+    def run(self, mode="atomic"):
+        results = [None] * len(self.items)
+        with ExitStack() as stack:
+            for alias, indexes in self.split().items():
+                batch = self.batch_class([self.items[index] for index in indexes])
+                self.groups[alias] = (indexes, batch)
+                stack.enter_context(transaction.atomic(using=alias))
+                with sharding.use_shard(alias):
+                    batch.validate()
+            failed = mode == "atomic" and bool(self.errors)
+            for alias, (indexes, batch) in self.groups.items():
+                with sharding.use_shard(alias):
+                    if failed:
+                        batch.skip()
+                    else:
+                        batch.save()
+                for index, result in zip(indexes, batch.results):
+                    results[index] = {**result, "index": index}
+        return results
+
+
+class CompanyBatchWrite(BatchWrite):
+    model = Company
+    serializer_class = CompanySerializer
+
+    # bulk writes send no post_save, place the new companies and refresh the shard copies
+    def save(self):
+        super().save()
+        sharding.place_companies(self.creates.values())
+        sharding.sync_companies(self.updates.values())
+
+
+class DepartmentBatchWrite(BatchWrite):
+    model = Department
+    serializer_class = DepartmentBatchSerializer
+    unique_fields = ["company", "name"]
+
+    def validate_batch(self):
+        company_ids = {department.company_id for department in self.pending().values()}
+        known = set(Company.objects.filter(pk__in=company_ids).values_list("pk", flat=True))
+        for index, department in self.pending().items():
+            if department.company_id not in known:
+                self.reject(index, {"company": [f'Invalid pk "{department.company_id}" - object does not exist.']})
+        if sharding.is_sharded():
+            # a department stays on the shard it was validated on
+            alias = sharding.current_shard() or sharding.DIRECTORY
+            placement = sharding.company_shards(company_ids)
+            for index, department in self.pending().items():
+                if placement.get(department.company_id, sharding.DIRECTORY) != alias:
+                    self.reject(
+                        index, {"company": ["A department cannot be moved to a company kept on another database."]}
+                    )
+
+        # (company, name) stays unique within the batch and against the other rows, a
+        # new item matching an existing department updates it
+        keys = {}
+        for index, department in self.pending().items():
+            key = (department.company_id, department.name)
+            if key in keys:
+                self.reject(index, {"non_field_errors": ["The fields company, name must make a unique set."]})
+            else:
+                keys[key] = index
+        taken = (
+            Department.objects.filter(
+                company_id__in={company_id for company_id, _ in keys}, name__in={name for _, name in keys}
+            )
+            .exclude(pk__in=[department.pk for department in self.updates.values()])
+            .values_list("company_id", "name")
+        )
+        for key in taken:
+            index = keys.get(key)
+            if index in self.updates:
+                self.reject(index, {"non_field_errors": ["The fields company, name must make a unique set."]})
+            elif index in self.creates:
+                self.upserts.add(index)
+
+
+BATCH_WRITES = {Company: CompanyBatchWrite, Department: DepartmentBatchWrite}
+
+
+def batch_write(model, items):
+    if sharding.is_sharded() and is_sharded_model(model):
+        return ShardedBatchWrite(BATCH_WRITES[model], items)
+    return BATCH_WRITES[model](items)
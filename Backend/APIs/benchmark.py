@@ -0,0 +1,191 @@
+import json
+import math
+import re
+import statistics
+import time
+import uuid
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+from django.test import Client
+
+# Scripted API scenarios and the statistics of the benchmark_api management command.
+# A transport sends the requests either through the Django test client (in process,
+# against the configured database) or over HTTP to a running server.
+
+SERVER_TIMING_QUERIES = re.compile(r'db;desc="(\d+) queries"')
+
+
+class TestClientTransport:
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        response = self.client.generic(
+            method, path, json.dumps(data) if data is not None else "", content_type="application/json"
+        )
+        return response.status_code, response.headers, response.content
+
+
+class HttpTransport:
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def request(self, method, path, data=None):
+        headers = {"Content-Type": "application/json"}
+        # session authenticated unsafe requests need the CSRF token set by the login
+        csrf_token = next((cookie.value for cookie in self.cookies if cookie.name == "csrftoken"), None)
+        if csrf_token:
+            headers["X-CSRFToken"] = csrf_token
+            headers["Referer"] = self.base_url
+        body = json.dumps(data).encode() if data is not None else None
+        request = Request(urljoin(self.base_url, path), data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.headers, response.read()
+        except HTTPError as error:
+            return error.code, error.headers, error.read()
+
+
+class Scenarios:
+    # every scenario is a method returning (method, path, data) for one timed request,
+    # the fixtures they need are created through the API by setup()
+
+    def __init__(self, transport, username, password):
+        self.transport = transport
+        self.username = username
+        self.password = password
+        self.run = uuid.uuid4().hex[:8]
+        self.counter = 0
+
+    def call(self, method, path, data=None):
+        status, _, content = self.transport.request(method, path, data)
+        if status >= 400:
+            raise RuntimeError(f"{method} {path} failed during setup with {status}: {content[:200]!r}")
+        return json.loads(content) if content else None
+
+    def setup(self):
+        self.call("POST", "/api/login/", {"username": self.username, "password": self.password})
+        self.company = self.call("POST", "/api/company/", {
+            "name": f"Benchmark {self.run}", "address": "Benchmark street", "email": "benchmark@example.com",
+        })
+        self.department = self.call("POST", "/api/department/", {
+            "name": f"Benchmark {self.run}", "description": "Benchmark", "company": self.company["id"],
+        })
+
+    def next_name(self):
+        self.counter += 1
+        return f"bench-{self.run}-{self.counter}"
+
+    def login(self):
+        return "POST", "/api/login/", {"username": self.username, "password": self.password}
+
+    def registration(self):
+        username = self.next_name()
+        return "POST", "/api/register/", {
+            "username": username, "email": f"{username}@example.com",
+            "password": "benchmark-password", "password_confirmation": "benchmark-password",
+            "first_name": "Bench", "last_name": "Mark", "phone_number": "0100", "address": "Street",
+            "company": self.company["id"], "department": self.department["id"],
+            "date_hired": "2024-01-01", "salary": "1000.00",
+        }
+
+    def company_list(self):
+        return "GET", "/api/company/", None
+
+    def company_detail(self):
+        return "GET", f"/api/company/{self.company['id']}/", None
+
+    def department_list(self):
+        return "GET", "/api/department/", None
+
+    def department_detail(self):
+        return "GET", f"/api/department/{self.department['id']}/", None
+
+    def employee_list(self):
+        return "GET", "/api/employee/", None
+
+    def company_update(self):
+        return "PUT", f"/api/company/{self.company['id']}/", {
+            "name": self.next_name(), "address": "Benchmark street", "email": "benchmark@example.com",
+        }
+
+    def company_delete(self):
+        # the company to delete is created untimed, right before the timed DELETE
+        company = self.call("POST", "/api/company/", {
+            "name": self.next_name(), "address": "Benchmark street", "email": "benchmark@example.com",
+        })
+        return "DELETE", f"/api/company/{company['id']}/", None
+
+    # removes the benchmark company with its departments and registered employees
+    def teardown(self):
+        self.call("DELETE", f"/api/company/{self.company['id']}/")
+
+
+SCENARIOS = (
+    "login", "registration", "company_list", "company_detail", "department_list",
+    "department_detail", "employee_list", "company_update", "company_delete",
+)
+
+
+def percentile(values, percent):
+    # nearest-rank percentile of a non empty list
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * percent / 100), 1) - 1]
+
+
+def run_scenario(scenarios, name, requests, warmup):
+    build = getattr(scenarios, name)
+    latencies = []
+    queries = []
+    errors = 0
+    elapsed = 0.0
+    for iteration in range(warmup + requests):
+        method, path, data = build()
+        started = time.perf_counter()
+        status, headers, _ = scenarios.transport.request(method, path, data)
+        latency = time.perf_counter() - started
+        if iteration < warmup:
+            continue
+        elapsed += latency
+        latencies.append(latency * 1000)
+        errors += status >= 400
+        # reported by APIs.middleware.MetricsMiddleware for sampled requests
+        match = SERVER_TIMING_QUERIES.search(headers.get("Server-Timing", "") or "")
+        if match:
+            queries.append(int(match.group(1)))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "requests_per_second": round(requests / elapsed, 2) if elapsed else None,
+        "queries_per_request": round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+# regressions of a run against a baseline run, a scenario regresses when its p95 latency
+# grew or its throughput dropped by more than threshold percent
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + threshold / 100):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if (
+            current["requests_per_second"] and previous["requests_per_second"]
+            and current["requests_per_second"] < previous["requests_per_second"] * (1 - threshold / 100)
+        ):
+            regressions.append(
+                f"{name}: {previous['requests_per_second']} -> {current['requests_per_second']} requests/sec"
+            )
+    return regressions
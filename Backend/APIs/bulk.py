@@ -0,0 +1,161 @@
+import csv
+import json
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from . import audit, events, search, sharding
+from .analytics import refresh_payroll_summary
+from .hashing import hash_passwords
+from .models import Company, Department, Employee
+from .serializers import BulkEmployeeRowSerializer
+
+CSV_CONTENT_TYPE = "text/csv"
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+
+
+# stands in for a row holding bytes that are not UTF-8, validate_chunk reports it as a row error
+UNDECODABLE_ROW = object()
+
+
+# lazily turn the raw request body into row dicts without loading it in memory,
+# undecodable NDJSON lines are passed through as strings so the row serializer reports them.
+# invalid UTF-8 is carried through as surrogates so the CSV reader still splits the rows
+def iter_rows(stream, content_type):
+    lines = (line.decode("utf-8", "surrogateescape") for line in stream)
+    if content_type == CSV_CONTENT_TYPE:
+        rows = csv.DictReader(lines)
+    else:
+        rows = _iter_json_lines(lines)
+    for row in rows:
+        yield row if _is_utf8(row) else UNDECODABLE_ROW
+
+
+def _iter_json_lines(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def _is_utf8(row):
+    try:
+        json.dumps(row, ensure_ascii=False).encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def iter_chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+# validate one chunk of employees, returns (accepted rows, per row errors).
+# uniqueness and foreign keys are checked with one query each for the whole chunk
+def validate_chunk(rows, first_row):
+    errors = []
+    valid = []
+    for number, row in enumerate(rows, start=first_row):
+        if row is UNDECODABLE_ROW:
+            errors.append({"row": number, "errors": {"non_field_errors": ["The row is not valid UTF-8."]}})
+            continue
+        serializer = BulkEmployeeRowSerializer(data=row)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            data["username"] = User.normalize_username(data["username"])
+            valid.append((number, data))
+        else:
+            errors.append({"row": number, "errors": serializer.errors})
+
+    taken = set(User.objects.filter(
+        username__in=[data["username"] for _, data in valid]
+    ).values_list("username", flat=True))
+    companies = set(Company.objects.filter(
+        pk__in={data["company"] for _, data in valid}
+    ).values_list("pk", flat=True))
+    # a department is looked up on the shard of the row's company, all shards at once
+    placement = sharding.company_shards(companies)
+    wanted = {}
+    for _, data in valid:
+        wanted.setdefault(placement.get(data["company"], sharding.DIRECTORY), set()).add(data["department"])
+    departments = dict(zip(wanted, sharding.fan_out(
+        lambda alias: set(Department.objects.filter(pk__in=wanted[alias]).values_list("pk", flat=True)), wanted
+    )))
+
+    accepted = []
+    for number, data in valid:
+        row_errors = {}
+        if data["username"] in taken:
+            row_errors["username"] = [User._meta.get_field("username").error_messages["unique"]]
+        if data["company"] not in companies:
+            row_errors["company"] = [f'Invalid pk "{data["company"]}" - object does not exist.']
+        if data["department"] not in departments.get(placement.get(data["company"], sharding.DIRECTORY), ()):
+            row_errors["department"] = [f'Invalid pk "{data["department"]}" - object does not exist.']
+        if row_errors:
+            errors.append({"row": number, "errors": row_errors})
+        else:
+            # remember the username so duplicates inside the same upload are rejected too
+            taken.add(data["username"])
+            accepted.append(data)
+
+    errors.sort(key=lambda error: error["row"])
+    return accepted, errors
+
+
+# insert validated rows with their password hashes, two bulk INSERTs in one transaction
+# (one more per shard holding some of the companies)
+def insert_chunk(accepted, hashes):
+    placement = sharding.company_shards({data["company"] for data in accepted}, for_write=True)
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(
+                username=data["username"],
+                email=User.objects.normalize_email(data.get("email", "")),
+                password=password_hash,
+            )
+            for data, password_hash in zip(accepted, hashes)
+        ])
+        groups = {}
+        for data, user in zip(accepted, users):
+            groups.setdefault(placement.get(data["company"], sharding.DIRECTORY), []).append((data, user))
+        for alias, rows in groups.items():
+            with sharding.use_shard(alias), transaction.atomic(using=alias, savepoint=False):
+                _insert_employees(alias, rows)
+
+
+def _insert_employees(alias, rows):
+    sharding.copy_users([user for _, user in rows], alias)
+    employees = Employee.objects.bulk_create([
+        Employee(
+            user=user,
+            first_name=data["first_name"],
+            last_name=data["last_name"],
+            phone_number=data["phone_number"],
+            address=data["address"],
+            company_id=data["company"],
+            department_id=data["department"],
+            date_hired=data["date_hired"],
+            salary=data["salary"],
+        )
+        for data, user in rows
+    ])
+    # bulk_create sends no signals, index, announce and audit the new employees and
+    # refresh the touched summary rows once per chunk
+    search.index_objects(employees, alias)
+    events.publish_many_on_commit(employees, "created")
+    audit.record(employees, "created")
+    if settings.PAYROLL_SUMMARY_ENABLED:
+        refresh_payroll_summary((data["company"], data["department"]) for data, _ in rows)
+
+
+# validate and register one chunk of employees, returns (created count, per row errors)
+def register_chunk(rows, first_row):
+    accepted, errors = validate_chunk(rows, first_row)
+    if accepted:
+        insert_chunk(accepted, hash_passwords([data["password"] for data in accepted]))
+    return len(accepted), errors
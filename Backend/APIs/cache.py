@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class CacheStats:
+    # hit / miss counters of the read-through cache for the current process
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+# details are keyed by a per row version, read before the row is loaded: a request that
+# loaded the row before a write committed stores it under the version the write replaced,
+# where no later request looks. Versions are seeded from the clock like the generations
+def _version_key(model, pk):
+    return f"api:{model._meta.model_name}:{pk}:version"
+
+
+def detail_key(model, pk):
+    version = get_cache().get_or_set(_version_key(model, pk), time.time_ns, None)
+    return f"api:{model._meta.model_name}:{pk}:{version}"
+
+
+# list pages are keyed by a per model generation so a single write invalidates
+# every cached page at once. Generations are seeded from the clock so a culled
+# generation key never resurrects pages cached under an older value
+def _generation_key(model):
+    return f"api:{model._meta.model_name}:list:generation"
+
+
+def _generation(model):
+    return get_cache().get_or_set(_generation_key(model), time.time_ns, None)
+
+
+def list_key(model, request):
+    # the full url is part of the key because cursors and next/previous links depend on it
+    digest = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f"api:{model._meta.model_name}:list:{_generation(model)}:{digest}"
+
+
+# cache get that feeds the hit / miss counters, returns None on a miss
+def lookup(key):
+    value = get_cache().get(key, _MISSING)
+    stats.record(hit=value is not _MISSING)
+    return None if value is _MISSING else value
+
+
+def store(key, value):
+    get_cache().set(key, value, settings.API_CACHE_TIMEOUT)
+
+
+# read-through lookup, compute() is only called (and its result stored) on a miss
+def cached(key, compute):
+    value = lookup(key)
+    if value is None:
+        value = compute()
+        store(key, value)
+    return value
+
+
+# drop every cached list page of a model, e.g. after a bulk_create that sent no signals
+def invalidate_lists(model):
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(model))
+    except ValueError:
+        cache.set(_generation_key(model), time.time_ns(), None)
+
+
+# drop the cached detail of one row and every cached list page of its model
+def invalidate(model, pk):
+    invalidate_many(model, [pk])
+
+
+# same as invalidate() for the rows written by one bulk operation, the new versions come
+# from the clock so they never go back to one a request may still be about to store under
+def invalidate_many(model, pks):
+    get_cache().set_many(dict.fromkeys([_version_key(model, pk) for pk in pks], time.time_ns()), None)
+    invalidate_lists(model)
@@ -0,0 +1,98 @@
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from .cache import lookup, store
+from .routers import read_from_default
+from .sharding import fan_out, spans_shards
+
+# HTTP validators (ETag, Last-Modified) of the API resources, built from the
+# last_updated columns so that they are computed without serializing anything.
+# related names the relations whose last_updated also affects the representation,
+# e.g. the company / department names embedded in an employee.
+
+
+def _validators(prefix, timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    etag = quote_etag("-".join([prefix] + [str(int(timestamp.timestamp() * 1_000_000)) for timestamp in timestamps]))
+    last_modified = int(max(timestamps).timestamp()) if timestamps else None
+    return etag, last_modified
+
+
+def detail_validators(queryset, pk, related=()):
+    fields = ["last_updated"] + [f"{name}__last_updated" for name in related]
+    row = queryset.filter(pk=pk).values_list(*fields).first()
+    if row is None:
+        raise Http404
+    return _validators(f"{queryset.model._meta.model_name}-{pk}", row)
+
+
+def instance_validators(instance):
+    return _validators(f"{instance._meta.model_name}-{instance.pk}", [instance.last_updated])
+
+
+# a list changes whenever a row is created (count / max), updated (max) or deleted (count).
+# Only the ETag follows the deletions, so lists get no Last-Modified: an If-Modified-Since
+# alone would be answered 304 after a row was deleted
+def list_validators(queryset, related=()):
+    aggregates = {"count": Count("pk"), "last_updated": Max("last_updated")}
+    for name in related:
+        aggregates[name] = Max(f"{name}__last_updated")
+    if spans_shards(queryset):
+        # the rows of every shard: counts add up, the newest timestamp wins
+        shards = fan_out(lambda alias: queryset.order_by().aggregate(**aggregates))
+        values = {name: max((row[name] for row in shards if row[name] is not None), default=None) for name in aggregates}
+        values["count"] = sum(row["count"] for row in shards)
+    else:
+        values = queryset.order_by().aggregate(**aggregates)
+    count = values.pop("count")
+    etag, _ = _validators(f"{queryset.model._meta.model_name}-list-{count}", values.values())
+    return etag, None
+
+
+def add_validator_headers(response, validators):
+    etag, last_modified = validators
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+# the 304 / 412 response when the request preconditions (If-None-Match, If-Modified-Since,
+# If-Match, If-Unmodified-Since) say so, None when the request should go ahead
+def precondition_response(request, validators):
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None and response.status_code == 304:
+        add_validator_headers(response, validators)
+    return response
+
+
+# conditional GET backed by the read-through cache. The cache entry holds the validators
+# next to the data, on a miss the validators are loaded first so a matching client gets
+# its 304 before anything is serialized. Misses read default, not a replica: a lagging
+# replica would fill the entry of the new version with the row as it was before the write
+def conditional_cached_response(request, key, load_validators, load_data):
+    entry = lookup(key)
+    if entry is None:
+        with read_from_default():
+            validators = load_validators()
+            not_modified = precondition_response(request, validators)
+            if not_modified is not None:
+                return not_modified
+            entry = {"validators": validators, "data": load_data()}
+        store(key, entry)
+    else:
+        not_modified = precondition_response(request, entry["validators"])
+        if not_modified is not None:
+            return not_modified
+    return add_validator_headers(Response(entry["data"]), entry["validators"])
+
+
+# same as conditional_cached_response for the endpoints that are not cached
+def conditional_response(request, validators, load_data):
+    not_modified = precondition_response(request, validators)
+    if not_modified is not None:
+        return not_modified
+    return add_validator_headers(Response(load_data()), validators)
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.db import router, transaction
+from .models import Company, Department, Employee
+from .serializers import CompanySerializer, DepartmentSerializer, EmployeeSerializer
+
+# In process fan-out of the create / update / delete events of companies, departments
+# and employees to the /api/events/ Server-Sent Events streams. Events are published
+# when the writing transaction commits (from any thread), numbered, kept in a bounded
+# history so a reconnecting client resumes after its Last-Event-ID, and pushed to
+# every subscriber's queue on the subscriber's own event loop. A subscriber that lets
+# EVENT_CLIENT_QUEUE_SIZE events pile up is disconnected, it resumes on reconnect.
+# Every process has its own broker: run the feed in a single ASGI process.
+
+SERIALIZERS = {Company: CompanySerializer, Department: DepartmentSerializer, Employee: EmployeeSerializer}
+MODEL_NAMES = {model: model._meta.model_name for model in SERIALIZERS}
+
+
+class Event:
+    __slots__ = ("id", "model", "action", "pk", "data")
+
+    def __init__(self, id, model, action, pk, data):
+        self.id = id
+        self.model = model
+        self.action = action
+        self.pk = pk
+        self.data = data
+
+    # one Server-Sent Events message, the event name is the model name
+    def encode(self):
+        payload = json.dumps({"action": self.action, "pk": self.pk, "data": self.data}, default=str)
+        return f"id: {self.id}\nevent: {self.model}\ndata: {payload}\n\n"
+
+
+class Subscription:
+
+    def __init__(self, loop, queue, models, limit):
+        self.loop = loop
+        self.queue = queue
+        self.models = models
+        self.limit = limit
+        self.overflowed = False
+
+    # runs on the subscriber's loop, None tells the stream to end
+    def deliver(self, event):
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.limit:
+            self.overflowed = True
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+
+class Broker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=settings.EVENT_HISTORY_SIZE)
+        # ids keep growing across restarts, so an id of a previous process is
+        # recognized as too old to resume from
+        self._last_id = time.time_ns() // 1000
+
+    def publish(self, model, action, pk, data=None):
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, model, action, pk, data)
+            self._history.append(event)
+            subscribers = [subscription for subscription in self._subscribers if model in subscription.models]
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # the loop of a client that went away without unsubscribing is closed
+                self.unsubscribe(subscription)
+        return event
+
+    # registers a subscriber, returns (subscription, the events it missed since
+    # last_event_id, id of the latest event). The missed events are None when they are
+    # no longer in the history
+    def subscribe(self, loop, queue, models, last_event_id=None):
+        subscription = Subscription(loop, queue, models, settings.EVENT_CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if last_event_id is None or last_event_id >= self._last_id:
+                return subscription, [], self._last_id
+            if not self._history or self._history[0].id > last_event_id + 1:
+                return subscription, None, self._last_id
+            missed = [event for event in self._history if event.id > last_event_id and event.model in models]
+            return subscription, missed, self._last_id
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broker = Broker()
+
+
+def publish_on_commit(instance, action):
+    model = MODEL_NAMES[type(instance)]
+    data = None if action == "deleted" else SERIALIZERS[type(instance)](instance).data
+    pk = instance.pk
+    # the rows of a company on a shard are committed by the shard's transaction
+    using = router.db_for_write(type(instance), instance=instance)
+    transaction.on_commit(lambda: broker.publish(model, action, pk, data), using=using)
+
+
+# same for the rows written by one bulk operation, which sends no signals
+def publish_many_on_commit(instances, action):
+    for instance in instances:
+        publish_on_commit(instance, action)
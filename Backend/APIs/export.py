@@ -0,0 +1,154 @@
+import csv
+import datetime
+import decimal
+import heapq
+import json
+from itertools import islice
+from operator import itemgetter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router
+from django.db.models import Max
+from .models import Company, Department, Employee
+from .routers import current_shard, is_sharded_model, shard_aliases
+
+# Streaming exports of whole tables. Rows are read with values_list() joins through
+# .iterator() so only one chunk is held in memory at a time, whatever the table size.
+# The departments and employees kept on shards are read from every shard and merged.
+# Under ASGI the stream is consumed with astream(), one sync_to_async call per chunk, as
+# Django would otherwise turn a sync iterator into a list before sending anything.
+
+EXPORTS = {
+    "employees": (Employee, (
+        ("id", "id"),
+        ("username", "user__username"),
+        ("email", "user__email"),
+        ("first_name", "first_name"),
+        ("last_name", "last_name"),
+        ("phone_number", "phone_number"),
+        ("address", "address"),
+        ("company", "company_id"),
+        ("company_name", "company__name"),
+        ("department", "department_id"),
+        ("department_name", "department__name"),
+        ("date_hired", "date_hired"),
+        ("salary", "salary"),
+        ("creation_time", "creation_time"),
+        ("last_updated", "last_updated"),
+    )),
+    "companies": (Company, (
+        ("id", "id"),
+        ("name", "name"),
+        ("address", "address"),
+        ("email", "email"),
+        ("creation_time", "creation_time"),
+        ("last_updated", "last_updated"),
+    )),
+    "departments": (Department, (
+        ("id", "id"),
+        ("name", "name"),
+        ("description", "description"),
+        ("company", "company_id"),
+        ("company_name", "company__name"),
+        ("creation_time", "creation_time"),
+        ("last_updated", "last_updated"),
+    )),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "columnar": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+# same text as the API responses: ISO 8601 with a Z suffix for UTC, decimals as strings
+def format_value(value):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class Export:
+    # one export window (since - overlap, watermark] of a resource, the watermark is the
+    # newest last_updated at the time the export starts and is the next run's since.
+    # last_updated is set when a row is saved, not when its transaction commits, so a row
+    # committed after an export can be older than that export's watermark: every window
+    # starts EXPORT_SINCE_OVERLAP seconds before since to pick these rows up, the rows of
+    # the overlap are sent again and are meant to be upserted by id. Deleted rows are not
+    # in an export, their deletions are in the audit history
+
+    def __init__(self, resource, since=None):
+        self.model, columns = EXPORTS[resource]
+        self.names = [name for name, _ in columns]
+        self.lookups = [lookup for _, lookup in columns]
+        # resolve the databases now, while the request's replica routing is active
+        databases = [router.db_for_read(self.model)]
+        if is_sharded_model(self.model) and current_shard() is None:
+            databases += shard_aliases()
+        querysets = [self.model.objects.using(database) for database in databases]
+        if since is not None:
+            start = since - datetime.timedelta(seconds=settings.EXPORT_SINCE_OVERLAP)
+            querysets = [queryset.filter(last_updated__gt=start) for queryset in querysets]
+        watermarks = [queryset.aggregate(watermark=Max("last_updated"))["watermark"] for queryset in querysets]
+        self.watermark = max((watermark for watermark in watermarks if watermark is not None), default=None)
+        if self.watermark is not None and since is not None:
+            # only rows of the overlap were found, the next export keeps the same starting point
+            self.watermark = max(self.watermark, since)
+        if self.watermark is not None:
+            querysets = [queryset.filter(last_updated__lte=self.watermark) for queryset in querysets]
+        self.querysets = [queryset.order_by("last_updated", "id") for queryset in querysets]
+
+    def rows(self, chunk_size):
+        if self.watermark is None:
+            return iter(())
+        shards = [queryset.values_list(*self.lookups).iterator(chunk_size=chunk_size) for queryset in self.querysets]
+        # every database returns its rows in (last_updated, id) order, keep that order overall
+        rows = heapq.merge(*shards, key=itemgetter(self.lookups.index("last_updated"), self.lookups.index("id")))
+        return ([format_value(value) for value in row] for row in rows)
+
+    def csv(self, chunk_size):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.names)
+        for row in self.rows(chunk_size):
+            yield writer.writerow(row)
+
+    def ndjson(self, chunk_size):
+        for row in self.rows(chunk_size):
+            yield json.dumps(dict(zip(self.names, row)), ensure_ascii=False) + "\n"
+
+    # every chunk of rows is written column by column: a "# chunk N" line followed by one
+    # CSV line per column holding the column name and that column's values
+    def columnar(self, chunk_size):
+        writer = csv.writer(_Echo())
+        rows = self.rows(chunk_size)
+        number = 0
+        while chunk := list(islice(rows, chunk_size)):
+            yield f"# chunk {number}\n"
+            for name, values in zip(self.names, zip(*chunk)):
+                yield writer.writerow([name, *values])
+            number += 1
+
+    def stream(self, output_format, chunk_size):
+        return getattr(self, output_format)(chunk_size)
+
+    async def astream(self, output_format, chunk_size):
+        parts = self.stream(output_format, chunk_size)
+        # thread sensitive: the generator and its database cursors stay on one thread
+        next_chunk = sync_to_async(lambda: "".join(islice(parts, chunk_size)), thread_sensitive=True)
+        try:
+            while chunk := await next_chunk():
+                yield chunk
+        finally:
+            await sync_to_async(parts.close, thread_sensitive=True)()
+
+
+class _Echo:
+    # file-like object for csv.writer that hands the formatted line back instead of storing it
+    def write(self, value):
+        return value
@@ -0,0 +1,126 @@
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.staticfiles import views as staticfiles_views
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views import View
+from .storage import compressed_variants
+
+# Serving of the React build: the SPA shell (templates/index.html) for every frontend
+# route and the static assets collected by APIs.storage, with the precompressed
+# variant the client accepts. Fingerprinted files are cached for a year, the rest
+# (and the shell) is revalidated with its ETag / Last-Modified.
+
+# preferred first, with the suffix of the precompressed files
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# content hash in the file name, from the build (main.90679472.js) or from collectstatic
+FINGERPRINT = re.compile(r"\.[0-9a-f]{8,}\.")
+STATIC_ASSET = re.compile(r"(?<=[\"'(])/static/([^\"'()?#]+)")
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _fingerprinted_url(match):
+    try:
+        return staticfiles_storage.url(match.group(1))
+    except ValueError:
+        # not collected (yet), keep the build's own URL
+        return match.group(0)
+
+
+# rendered shell and its compressed variants, once per process (once per version of the
+# template with DEBUG, which passes its modification time)
+@lru_cache(maxsize=1)
+def get_shell(modified=None):
+    body = STATIC_ASSET.sub(_fingerprinted_url, render_to_string("index.html")).encode()
+    codings = {suffix: coding for coding, suffix in ENCODINGS}
+    variants = {codings[suffix]: variant for suffix, variant in compressed_variants(body).items()}
+    variants["identity"] = body
+    return variants, f'"{hashlib.md5(body).hexdigest()}"'
+
+
+class SPAShellView(View):
+
+    # every frontend route gets the same shell, re-rendered with DEBUG when the build changes
+    def get(self, request, *args, **kwargs):
+        if settings.DEBUG:
+            variants, etag = get_shell(os.stat(get_template("index.html").origin.name).st_mtime_ns)
+        else:
+            variants, etag = get_shell()
+        accepted = accepted_encodings(request)
+        coding = next((coding for coding, _ in ENCODINGS if coding in accepted and coding in variants), "identity")
+
+        response = HttpResponse(variants[coding], content_type="text/html; charset=utf-8")
+        if coding != "identity":
+            response.headers["Content-Encoding"] = coding
+        response.headers["ETag"] = etag
+        # new deployments reference new assets, always revalidate the shell
+        response.headers["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return get_conditional_response(request, etag=etag, response=response)
+
+
+def serve_static(request, path):
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path) if settings.STATIC_ROOT else None
+    except SuspiciousFileOperation:
+        raise Http404
+    if full_path is None or not os.path.isfile(full_path):
+        if settings.DEBUG:
+            # not collected, served from the app and STATICFILES_DIRS directories
+            return staticfiles_views.serve(request, path, insecure=True)
+        raise Http404
+
+    accepted = accepted_encodings(request)
+    coding, served_path = None, full_path
+    for candidate, suffix in ENCODINGS:
+        if candidate in accepted and os.path.isfile(full_path + suffix):
+            coding, served_path = candidate, full_path + suffix
+            break
+
+    stat = os.stat(served_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    content_type, _ = mimetypes.guess_type(full_path)
+    # named after the asset, not the .br / .gz file it is read from
+    response = FileResponse(
+        open(served_path, "rb"), content_type=content_type or "application/octet-stream",
+        filename=os.path.basename(full_path),
+    )
+    if coding:
+        response.headers["Content-Encoding"] = coding
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    if FINGERPRINT.search(os.path.basename(path)):
+        response.headers["Cache-Control"] = f"public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers["Cache-Control"] = "public, no-cache"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+    if conditional is not response:
+        response.close()
+    return conditional
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BCryptSHA256PasswordHasher,
+    PBKDF2PasswordHasher,
+)
+
+# Password hashers whose cost is read from the settings. They keep the algorithm
+# names of the Django hashers they extend, so existing hashes keep verifying and
+# Django rehashes a password on the next successful login whenever its stored
+# cost differs from the configured one (see PASSWORD_HASHER_PROFILE in settings).
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST or Argon2PasswordHasher.time_cost
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST or Argon2PasswordHasher.memory_cost
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM or Argon2PasswordHasher.parallelism
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    rounds = settings.PASSWORD_BCRYPT_ROUNDS or BCryptSHA256PasswordHasher.rounds
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework.exceptions import Throttled
+from .metrics import registry as metrics_registry
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+class HashingBusy(Throttled):
+    default_detail = "Too many password checks in progress."
+
+    def __init__(self):
+        super().__init__(wait=settings.PASSWORD_HASHING_RETRY_AFTER)
+
+
+# returns the process wide pool used for password hashing, created on first use
+def get_hashing_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS,
+                thread_name_prefix="password-hashing",
+            )
+    return _executor
+
+
+# hash many raw passwords at once, hashlib releases the GIL while running the
+# key derivation so the work is spread over all the pool threads / cores
+def hash_passwords(passwords):
+    return list(get_hashing_executor().map(make_password, passwords))
+
+
+# check a raw password against a stored hash without saving anything, returns
+# (valid, needs rehash) where needs rehash is Django's own verdict that the hash
+# was made by a non preferred hasher or with an outdated cost
+def verify_password(password, encoded):
+    outdated = []
+    valid = check_password(password, encoded, setter=lambda raw_password: outdated.append(True))
+    return valid, bool(outdated)
+
+
+# await fn(*args) on the hashing pool, for the async views
+async def run_hashing(fn, *args):
+    return await asyncio.wrap_future(get_hashing_executor().submit(fn, *args))
+
+
+# caps the password hashing requests of this process in flight at once (waiting for
+# the pool or hashing) to PASSWORD_HASHING_MAX_IN_FLIGHT, raising HashingBusy (429
+# with Retry-After) instead of queueing more work. Never blocks, so the async views use it too
+@contextmanager
+def hashing_slot():
+    global _slots
+    with _executor_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_MAX_IN_FLIGHT)
+    if not _slots.acquire(blocking=False):
+        metrics_registry.record_throttled("password_hashing")
+        raise HashingBusy()
+    try:
+        yield
+    finally:
+        _slots.release()
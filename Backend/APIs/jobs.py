@@ -0,0 +1,109 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Company, Department, DeletionJob, Employee
+from .sharding import delete_user_copies, locate, shard_of, use_shard
+
+logger = logging.getLogger(__name__)
+
+# Background cascade deletes. A request only records a DeletionJob, the worker
+# (manage.py run_deletion_worker) then removes the employees with their users, the
+# departments and finally the company / department itself in bounded batches, one
+# short transaction per batch, recording its progress on the job row as it goes.
+# Every step only deletes what is still there, so a job interrupted by a crashed
+# worker is simply picked up again once it is considered stale. The employees and
+# departments are deleted on the shard of the company (see APIs.sharding).
+
+ACTIVE = (DeletionJob.Status.PENDING, DeletionJob.Status.RUNNING)
+
+
+# database holding the employees and departments of the target
+def _shard(target_type, target_id):
+    if target_type == DeletionJob.Target.COMPANY:
+        return shard_of(target_id, for_write=True)
+    return locate(Department, for_write=True, pk=target_id)
+
+
+def _querysets(target_type, target_id):
+    if target_type == DeletionJob.Target.COMPANY:
+        return (
+            # employees of other companies placed in one of its departments go too
+            Employee.objects.filter(Q(company_id=target_id) | Q(department__company_id=target_id)),
+            Department.objects.filter(company_id=target_id),
+            Company.objects.filter(pk=target_id),
+        )
+    return (
+        Employee.objects.filter(department_id=target_id),
+        Department.objects.none(),
+        Department.objects.filter(pk=target_id),
+    )
+
+
+# record a deletion job for a company or department, or return the one already scheduled
+def schedule_deletion(target):
+    target_type = target._meta.model_name
+    job = DeletionJob.objects.filter(target_type=target_type, target_id=target.pk, status__in=ACTIVE).first()
+    if job is not None:
+        return job
+    with use_shard(_shard(target_type, target.pk)):
+        employees, departments, _ = _querysets(target_type, target.pk)
+        total = employees.count() * 2 + departments.count() + 1
+    return DeletionJob.objects.create(target_type=target_type, target_id=target.pk, total=total)
+
+
+# take the oldest pending (or stale running) job, safe with several workers
+def claim_next_job():
+    stale = timezone.now() - timedelta(seconds=settings.DELETION_JOB_STALE_SECONDS)
+    candidates = DeletionJob.objects.filter(
+        Q(status=DeletionJob.Status.PENDING) | Q(status=DeletionJob.Status.RUNNING, last_updated__lt=stale)
+    ).order_by("creation_time")
+    for job in candidates[:10]:
+        claimed = DeletionJob.objects.filter(
+            pk=job.pk, status=job.status, last_updated=job.last_updated
+        ).update(status=DeletionJob.Status.RUNNING, last_updated=timezone.now())
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _progress(job, count):
+    DeletionJob.objects.filter(pk=job.pk).update(deleted=F("deleted") + count, last_updated=timezone.now())
+
+
+def _finish(job, status, error=""):
+    DeletionJob.objects.filter(pk=job.pk).update(
+        status=status, error=error, last_updated=timezone.now(), finished_time=timezone.now()
+    )
+
+
+def run_job(job, batch_size=None):
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    employees, departments, target = _querysets(job.target_type, job.target_id)
+    try:
+        alias = _shard(job.target_type, job.target_id)
+        with use_shard(alias):
+            while batch := list(employees.values_list("pk", "user_id")[:batch_size]):
+                user_ids = [user_id for _, user_id in batch]
+                with transaction.atomic(), transaction.atomic(using=alias, savepoint=False):
+                    Employee.objects.filter(pk__in=[pk for pk, _ in batch]).delete()
+                    delete_user_copies(alias, user_ids)
+                    User.objects.filter(pk__in=user_ids).delete()
+                _progress(job, len(batch) * 2)
+
+            while batch := list(departments.values_list("pk", flat=True)[:batch_size]):
+                Department.objects.filter(pk__in=batch).delete()
+                _progress(job, len(batch))
+
+            target.delete()
+        _progress(job, 1)
+    except Exception as error:
+        logger.exception("deletion job %s failed", job.pk)
+        _finish(job, DeletionJob.Status.FAILED, error=str(error))
+        return False
+    _finish(job, DeletionJob.Status.DONE)
+    return True
@@ -0,0 +1,109 @@
+import json
+import platform
+from datetime import datetime, timezone
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from APIs.models import Company, Department, Employee
+from APIs.benchmark import SCENARIOS, HttpTransport, Scenarios, TestClientTransport, compare, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the scripted API scenarios (login, registration, list, detail, update, delete) and report "
+        "p50/p95/p99 latency, requests/sec and queries per request. Use --output to save the results as "
+        "JSON and --baseline to fail when a scenario regressed by more than --threshold percent"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target", default="testclient",
+            help='"testclient" to run in process in a rolled back transaction, or the base url of a running server',
+        )
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated scenario names")
+        parser.add_argument("--requests", type=int, default=50, help="timed requests per scenario")
+        parser.add_argument("--warmup", type=int, default=3, help="untimed requests per scenario")
+        parser.add_argument("--username", help="employee to log in as against a running server")
+        parser.add_argument("--password")
+        parser.add_argument("--output", help="file to write the JSON results to")
+        parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+        parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+
+    def handle(self, *args, **options):
+        names = [name for name in options["scenarios"].split(",") if name]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        in_process = options["target"] == "testclient"
+        if in_process:
+            results = self.run_in_process(names, options)
+        else:
+            if not options["username"] or not options["password"]:
+                raise CommandError("--username and --password are required against a running server")
+            transport = HttpTransport(options["target"])
+            results = self.run(transport, options["username"], options["password"], names, options)
+
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                regressions = compare(results, json.load(baseline), options["threshold"])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regression above {options['threshold']}%"))
+
+    # in process runs leave no trace, the benchmark user and all the writes are rolled back
+    def run_in_process(self, names, options):
+        # the login scenario would otherwise run into the rate limits
+        with override_settings(ALLOWED_HOSTS=["*"], THROTTLE_RATES={}), transaction.atomic():
+            company = Company.objects.create(name="Benchmark", address="Benchmark street", email="benchmark@example.com")
+            department = Department.objects.create(name="Benchmark", description="Benchmark", company=company)
+            Employee.objects.create(
+                user=User.objects.create_user("benchmark-api", password="benchmark-password"),
+                first_name="Bench", last_name="Mark", phone_number="0100", address="Street",
+                company=company, department=department, date_hired="2024-01-01", salary="1000.00",
+            )
+            results = self.run(TestClientTransport(), "benchmark-api", "benchmark-password", names, options)
+            transaction.set_rollback(True)
+        return results
+
+    def run(self, transport, username, password, names, options):
+        scenarios = Scenarios(transport, username, password)
+        try:
+            scenarios.setup()
+        except RuntimeError as error:
+            raise CommandError(str(error))
+        results = {
+            "meta": {
+                "target": options["target"],
+                "requests": options["requests"],
+                "warmup": options["warmup"],
+                "started": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+            },
+            "scenarios": {},
+        }
+        try:
+            for name in names:
+                results["scenarios"][name] = run_scenario(scenarios, name, options["requests"], options["warmup"])
+        finally:
+            scenarios.teardown()
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'scenario':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'queries':>8} {'errors':>7}"
+        )
+        for name, result in results["scenarios"].items():
+            queries = result["queries_per_request"]
+            self.stdout.write(
+                f"{name:<20} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                f"{result['requests_per_second'] or 0:>9.1f} {'-' if queries is None else queries:>8} "
+                f"{result['errors']:>7}"
+            )
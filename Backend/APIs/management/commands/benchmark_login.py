@@ -0,0 +1,33 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from APIs.hashing import verify_password
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure logins/sec of the password verification step for a range of hashing "
+        "pool sizes, using the configured hasher profile and cost"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", default="1,2,4,8", help="comma separated pool sizes to try")
+        parser.add_argument("--logins", type=int, default=64, help="password checks per pool size")
+
+    def handle(self, *args, **options):
+        workers = [int(count) for count in options["workers"].split(",")]
+        logins = options["logins"]
+        encoded = make_password("benchmark-password")
+
+        self.stdout.write(f"hasher profile: {settings.PASSWORD_HASHER_PROFILE} ({encoded.split('$')[0]})")
+        self.stdout.write(f"{'workers':>8} {'logins/sec':>12} {'ms/login':>10}")
+        for count in workers:
+            with ThreadPoolExecutor(max_workers=count) as pool:
+                started = time.perf_counter()
+                results = list(pool.map(verify_password, ["benchmark-password"] * logins, [encoded] * logins))
+                elapsed = time.perf_counter() - started
+            if not all(valid for valid, _ in results):
+                raise CommandError("password verification failed")
+            self.stdout.write(f"{count:>8} {logins / elapsed:>12.1f} {elapsed / logins * 1000:>10.2f}")
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from APIs.models import Company, Department
+from APIs.renderers import FastJSONRenderer
+from APIs.serializers import DepartmentSerializer, department_values
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/sec of the ModelSerializer + JSONRenderer path with the .values() fast path + "
+        "FastJSONRenderer when rendering a list of departments (rows are created in a rolled back transaction)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5, help="runs per path, the best one is reported")
+
+    def best_of(self, repeat, render):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, content
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with transaction.atomic():
+            company = Company.objects.create(name="Benchmark", address="Benchmark street", email="benchmark@example.com")
+            Department.objects.bulk_create(
+                [Department(name=f"Department {i}", description="Benchmark", company=company) for i in range(rows)],
+                batch_size=1000,
+            )
+            queryset = Department.objects.filter(company=company).order_by("id")
+
+            legacy_time, legacy = self.best_of(
+                options["repeat"], lambda: JSONRenderer().render(DepartmentSerializer(queryset, many=True).data)
+            )
+            fast_time, fast = self.best_of(
+                options["repeat"], lambda: FastJSONRenderer().render(department_values.many(department_values.values(queryset)))
+            )
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'path':<28} {'rows/sec':>12} {'seconds':>9}")
+        self.stdout.write(f"{'ModelSerializer':<28} {rows / legacy_time:>12.0f} {legacy_time:>9.3f}")
+        self.stdout.write(f"{'values() fast path':<28} {rows / fast_time:>12.0f} {fast_time:>9.3f}")
+        self.stdout.write(f"speedup x{legacy_time / fast_time:.1f}, identical output: {legacy == fast}")
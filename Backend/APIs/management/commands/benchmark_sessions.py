@@ -0,0 +1,77 @@
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from APIs.benchmark import percentile
+from APIs.models import Company, Department, Employee
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per request overhead of the session backends and the bearer token "
+        "authentication on a minimal authenticated endpoint, in process and rolled back"
+    )
+
+    PATH = "/api/cache/stats/"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes", default=",".join([*settings.SESSION_ENGINES, "token"]),
+            help="comma separated session backends (SESSION_ENGINES keys) and / or token",
+        )
+        parser.add_argument("--requests", type=int, default=200, help="timed requests per mode")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options["modes"].split(",") if mode.strip()]
+        unknown = [mode for mode in modes if mode != "token" and mode not in settings.SESSION_ENGINES]
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(unknown)}")
+
+        self.stdout.write(f"{'mode':<16} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'queries':>8}")
+        with override_settings(ALLOWED_HOSTS=["*"], THROTTLE_RATES={}), transaction.atomic():
+            company = Company.objects.create(name="Benchmark", address="Benchmark street", email="benchmark@example.com")
+            department = Department.objects.create(name="Benchmark", description="Benchmark", company=company)
+            Employee.objects.create(
+                user=User.objects.create_user("benchmark-sessions", password="benchmark-password"),
+                first_name="Bench", last_name="Mark", phone_number="0100", address="Street",
+                company=company, department=department, date_hired="2024-01-01", salary="1000.00",
+            )
+            for mode in modes:
+                self.report(mode, *self.measure(mode, options["requests"]))
+            transaction.set_rollback(True)
+
+    def measure(self, mode, requests):
+        engine = settings.SESSION_ENGINES.get(mode, settings.SESSION_ENGINE)
+        with override_settings(SESSION_ENGINE=engine):
+            client = Client()
+            credentials = {"username": "benchmark-sessions", "password": "benchmark-password"}
+            headers = {}
+            if mode == "token":
+                response = client.post("/api/token/", credentials, content_type="application/json")
+                headers["HTTP_AUTHORIZATION"] = f"Bearer {response.json().get('access')}"
+                client.cookies.clear()
+            else:
+                response = client.post("/api/login/", credentials, content_type="application/json")
+            if response.status_code != 200:
+                raise CommandError(f"{mode}: login failed with {response.status_code}")
+
+            client.get(self.PATH, **headers)
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    response = client.get(self.PATH, **headers)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f"{mode}: {self.PATH} answered {response.status_code}")
+        return timings, len(queries) / requests
+
+    def report(self, mode, timings, queries):
+        self.stdout.write(
+            f"{mode:<16} {percentile(timings, 50):>9.3f} {percentile(timings, 95):>9.3f} "
+            f"{statistics.fmean(timings):>9.3f} {queries:>8.1f}"
+        )
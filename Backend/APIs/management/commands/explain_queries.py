@@ -0,0 +1,106 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from APIs.models import Company, Department, Employee
+from APIs.views import employee_login_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        "Call every read endpoint of the API inside a rolled back transaction, run EXPLAIN on "
+        "each SELECT it issues and report the full table scans and temporary sorts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true", help="print every query plan")
+
+    def endpoints(self):
+        company = Company.objects.values_list("pk", flat=True).first() or 1
+        department = Department.objects.values_list("pk", flat=True).first() or 1
+        employee = Employee.objects.values_list("pk", flat=True).first() or 1
+        return [
+            ("create_list_company", "/api/company/"),
+            ("company_details", f"/api/company/{company}/"),
+            ("list_create_department", "/api/department/"),
+            ("department_details", f"/api/department/{department}/"),
+            ("list_employee", "/api/employee/"),
+            ("list_employee (filtered)", f"/api/employee/?company={company}&hired_after=2000-01-01"),
+            ("employee_details", f"/api/employee/{employee}/"),
+            ("analytics", "/api/analytics/"),
+        ]
+
+    # session lookups embed the current time so they never repeat verbatim
+    def is_session_query(self, sql):
+        return 'FROM "django_session"' in sql
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f"EXPLAIN {sql}")
+            return [str(row[0]) for row in cursor.fetchall()]
+
+    def problems(self, plan, tables):
+        found = []
+        for line in plan:
+            if connection.vendor == "sqlite":
+                # "SCAN table" reads every row, "SCAN table USING INDEX" walks an index in order,
+                # scans of subqueries / window wrappers are not reported
+                scanned = line.split()[1] if line.startswith("SCAN ") else None
+                if scanned in tables and " USING " not in line:
+                    found.append(f"full table scan: {line}")
+                elif "TEMP B-TREE" in line:
+                    found.append(f"temporary sort: {line}")
+            elif "Seq Scan" in line:
+                found.append(f"full table scan: {line.strip()}")
+        return found
+
+    def report(self, name, statements, verbose):
+        tables = set(connection.introspection.table_names())
+        selects = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+        problems = []
+        for sql in selects:
+            plan = self.explain(sql)
+            if verbose:
+                self.stdout.write(f"  {sql}\n    " + "\n    ".join(plan))
+            problems += self.problems(plan, tables)
+        style = self.style.WARNING if problems else self.style.SUCCESS
+        self.stdout.write(style(f"{name}: {len(selects)} select(s), {len(problems)} problem(s)"))
+        for problem in problems:
+            self.stdout.write(f"    {problem}")
+        return len(problems)
+
+    def handle(self, *args, **options):
+        verbose = options["verbose_plans"]
+        total = 0
+        # a dummy cache so the read-through cache cannot hide the queries
+        dummy_cache = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(ALLOWED_HOSTS=["*"], CACHES=dummy_cache), transaction.atomic():
+            user = User.objects.create_user("explain-queries")
+            client = Client()
+            client.force_login(user)
+            # the session and user lookups done by the authentication are the same for
+            # every call, record them on an endpoint without queries of its own to skip them
+            with CaptureQueriesContext(connection) as context:
+                client.get("/api/cache/stats/")
+            authentication = {
+                query["sql"] for query in context.captured_queries if not self.is_session_query(query["sql"])
+            }
+
+            for name, path in self.endpoints():
+                with CaptureQueriesContext(connection) as context:
+                    client.get(path)
+                statements = [
+                    query["sql"] for query in context.captured_queries
+                    if query["sql"] not in authentication and not self.is_session_query(query["sql"])
+                ]
+                total += self.report(name, statements, verbose)
+
+            login_sql = str(employee_login_queryset().filter(user=user).query)
+            total += self.report("employee_login_view", [login_sql], verbose)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{total} problem(s) found")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from APIs.sharding import move_company, shard_of
+
+
+class Command(BaseCommand):
+    help = "Move the departments, employees and payroll summary rows of a company to another shard"
+
+    def add_arguments(self, parser):
+        parser.add_argument("company_id", type=int)
+        parser.add_argument("shard", help="target database alias, e.g. shard2 or default")
+        parser.add_argument("--batch-size", type=int, default=1000, help="rows copied per statement")
+        parser.add_argument(
+            "--grace", type=float, default=5,
+            help="seconds given to the writes already in progress once the company is locked",
+        )
+
+    def handle(self, *args, **options):
+        company_id, target = options["company_id"], options["shard"]
+        source = shard_of(company_id)
+        try:
+            moved = move_company(company_id, target, batch_size=options["batch_size"], grace=options["grace"])
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} rows of company {company_id} from {source} to {target}"))
@@ -0,0 +1,41 @@
+import time
+from importlib import import_module
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions from the database in small batches, so the session "
+        "table is never locked for long. With --interval it keeps purging periodically"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="sessions deleted per statement")
+        parser.add_argument("--pause", type=float, default=0.0, help="seconds to wait between two batches")
+        parser.add_argument("--interval", type=float, default=0.0, help="purge again every INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not issubclass(store, DatabaseSessionStore):
+            # cache entries and signed cookies expire on their own
+            self.stdout.write(f"{settings.SESSION_ENGINE} keeps no session rows, nothing to purge")
+            return
+        model = store.get_model_class()
+        while True:
+            purged = self.purge(model, options["batch_size"], options["pause"])
+            self.stdout.write(f"purged {purged} expired sessions")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
+
+    def purge(self, model, batch_size, pause):
+        expired = model.objects.filter(expire_date__lt=timezone.now())
+        purged = 0
+        while keys := list(expired.values_list("session_key", flat=True)[:batch_size]):
+            purged += model.objects.filter(session_key__in=keys).delete()[0]
+            if pause:
+                time.sleep(pause)
+        return purged
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from APIs.search import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from the companies, departments and employees"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="documents written per statement")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} documents"))
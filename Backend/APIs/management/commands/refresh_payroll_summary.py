@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from APIs.analytics import rebuild_payroll_summary
+from APIs.sharding import shards, use_shard
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized payroll summary table from the employees"
+
+    def handle(self, *args, **options):
+        rows = 0
+        # every shard summarizes its own employees
+        for alias in shards():
+            with use_shard(alias), transaction.atomic(using=alias):
+                rows += len(rebuild_payroll_summary())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} payroll summary rows"))
@@ -0,0 +1,26 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from APIs.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Process the background company / department deletion jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="exit when no job is left instead of polling")
+        parser.add_argument("--batch-size", type=int, help="rows deleted per transaction")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(settings.DELETION_WORKER_POLL_SECONDS)
+                continue
+            self.stdout.write(f"deleting {job.target_type} {job.target_id} (job {job.pk})")
+            if run_job(job, batch_size=options["batch_size"]):
+                self.stdout.write(self.style.SUCCESS(f"job {job.pk} done"))
+            else:
+                self.stdout.write(self.style.ERROR(f"job {job.pk} failed"))
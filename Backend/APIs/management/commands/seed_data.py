@@ -0,0 +1,106 @@
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from random import Random
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from APIs import audit, search, sharding
+from APIs.analytics import rebuild_payroll_summary
+from APIs.cache import invalidate_lists
+from APIs.models import Company, Department, Employee
+
+
+class Command(BaseCommand):
+    help = "Seed companies, departments and employees quickly with bulk_create, for benchmarks and load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--companies", type=int, default=10)
+        parser.add_argument("--departments", type=int, default=5, help="departments per company")
+        parser.add_argument("--employees", type=int, default=20, help="employees per department")
+        parser.add_argument("--password", default="benchmark-password", help="password of every seeded user")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0, help="random seed for salaries and hire dates")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        random = Random(options["seed"])
+        run = uuid.uuid4().hex[:8]
+        # every seeded user shares one hash, hashing once per user would dominate the run
+        password = make_password(options["password"])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            companies = Company.objects.bulk_create([
+                Company(name=f"Company {run}-{i}", address=f"{i} Main Street", email=f"company{i}@{run}.example.com")
+                for i in range(options["companies"])
+            ], batch_size=batch_size)
+            # bulk_create sends no signals
+            sharding.place_companies(companies)
+            placement = sharding.company_shards([company.pk for company in companies])
+            self.index(companies, batch_size)
+
+            departments, users = [], []
+            for alias in sharding.shards():
+                placed = [company for company in companies if placement.get(company.pk, sharding.DIRECTORY) == alias]
+                if not placed:
+                    continue
+                # the departments and employees are created on the shard of their company
+                with sharding.use_shard(alias), transaction.atomic(using=alias):
+                    shard_departments, shard_users = self.seed_shard(
+                        alias, placed, run, len(users), password, random, options
+                    )
+                departments += shard_departments
+                users += shard_users
+        invalidate_lists(Company)
+        invalidate_lists(Department)
+        audit.buffer.flush()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(companies)} companies, {len(departments)} departments and {len(users)} employees "
+            f"in {elapsed:.2f}s (usernames seed-{run}-N, password {options['password']!r})"
+        ))
+
+    def index(self, objects, batch_size):
+        for start in range(0, len(objects), batch_size):
+            search.index_objects(objects[start:start + batch_size])
+        audit.record(objects, "created")
+
+    # departments and employees of companies sharing a shard, the users are numbered from first
+    def seed_shard(self, alias, companies, run, first, password, random, options):
+        batch_size = options["batch_size"]
+        departments = Department.objects.bulk_create([
+            Department(name=f"Department {j}", description=f"Department {j} of {company.name}", company=company)
+            for company in companies
+            for j in range(options["departments"])
+        ], batch_size=batch_size)
+
+        slots = [department for department in departments for _ in range(options["employees"])]
+        users = User.objects.bulk_create([
+            User(username=f"seed-{run}-{i}", email=f"seed-{run}-{i}@example.com", password=password)
+            for i in range(first, first + len(slots))
+        ], batch_size=batch_size)
+        sharding.copy_users(users, alias)
+        employees = Employee.objects.bulk_create([
+            Employee(
+                user=user,
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                phone_number=f"0100{i:07d}"[:15],
+                address=f"{i} Side Street",
+                company_id=department.company_id,
+                department=department,
+                date_hired=date(2015, 1, 1) + timedelta(days=random.randrange(3650)),
+                salary=Decimal(random.randrange(300000, 2000000)) / 100,
+            )
+            for i, (user, department) in enumerate(zip(users, slots), start=first)
+        ], batch_size=batch_size)
+        for objects in (departments, employees):
+            self.index(objects, batch_size)
+        if settings.PAYROLL_SUMMARY_ENABLED:
+            rebuild_payroll_summary()
+        return departments, users
@@ -0,0 +1,184 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .cache import stats as cache_stats
+
+logger = logging.getLogger(__name__)
+
+# upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# metrics of the request being handled, None when the request is not sampled
+current_request = ContextVar("current_request_metrics", default=None)
+
+
+class RequestMetrics:
+    # timings of a single sampled request
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.slow_queries = 0
+        self.serialization_time = 0.0
+
+    # django.db execute wrapper, times every query and logs the slow ones
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            slow = elapsed * 1000 >= settings.METRICS_SLOW_QUERY_MS
+            # the queries of one request may run on several threads (sync_to_async, shard fan-out)
+            with self._lock:
+                self.queries += 1
+                self.query_time += elapsed
+                self.slow_queries += slow
+            if slow:
+                logger.warning(
+                    "slow query (%.1f ms) on %s: %s",
+                    elapsed * 1000, context["connection"].alias, sql,
+                )
+
+    def server_timing(self, total):
+        return ", ".join([
+            f"db;desc=\"{self.queries} queries\";dur={self.query_time * 1000:.1f}",
+            f"serialize;dur={self.serialization_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+
+class RouteMetrics:
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.latency_sum = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.slow_queries = 0
+        self.serialization_time = 0.0
+
+
+class MetricsRegistry:
+    # per route aggregates of the sampled requests of this process
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteMetrics)
+        self._throttled = defaultdict(int)
+
+    def record(self, route, latency, request_metrics):
+        with self._lock:
+            metrics = self._routes[route]
+            metrics.count += 1
+            metrics.latency_sum += latency
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    metrics.buckets[index] += 1
+            metrics.queries += request_metrics.queries
+            metrics.query_time += request_metrics.query_time
+            metrics.slow_queries += request_metrics.slow_queries
+            metrics.serialization_time += request_metrics.serialization_time
+
+    # requests refused by a rate limit or the password hashing cap
+    def record_throttled(self, scope):
+        with self._lock:
+            self._throttled[scope] += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._throttled.clear()
+
+    # Prometheus text exposition format 0.0.4
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP api_request_duration_seconds Latency of the sampled API requests.",
+                "# TYPE api_request_duration_seconds histogram",
+            ]
+            for route, metrics in routes:
+                for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                    lines.append(f'api_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {count}')
+                lines.append(f'api_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {metrics.count}')
+                lines.append(f'api_request_duration_seconds_sum{{route="{route}"}} {metrics.latency_sum}')
+                lines.append(f'api_request_duration_seconds_count{{route="{route}"}} {metrics.count}')
+            counters = (
+                ("api_db_queries_total", "SQL queries run by the sampled requests.", "queries"),
+                ("api_db_query_seconds_total", "Time spent in SQL queries.", "query_time"),
+                ("api_slow_queries_total", "Queries slower than METRICS_SLOW_QUERY_MS.", "slow_queries"),
+                ("api_serialization_seconds_total", "Time spent rendering response bodies.", "serialization_time"),
+            )
+            for name, description, attribute in counters:
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+                lines += [f'{name}{{route="{route}"}} {getattr(metrics, attribute)}' for route, metrics in routes]
+            lines += [
+                "# HELP api_throttled_requests_total Requests refused with 429 by rate limit scope.",
+                "# TYPE api_throttled_requests_total counter",
+            ]
+            lines += [f'api_throttled_requests_total{{scope="{scope}"}} {count}' for scope, count in sorted(self._throttled.items())]
+        cache = cache_stats.snapshot()
+        lines += [
+            "# HELP api_cache_requests_total Read-through cache lookups by result.",
+            "# TYPE api_cache_requests_total counter",
+            f'api_cache_requests_total{{result="hit"}} {cache["hits"]}',
+            f'api_cache_requests_total{{result="miss"}} {cache["misses"]}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def sampled():
+    return settings.METRICS_SAMPLE_RATE >= 1 or random.random() < settings.METRICS_SAMPLE_RATE
+
+
+# query timer installed on every database connection when it is opened, on whichever
+# thread (APIs.apps imports this module before any is). It counts into the metrics of the request of the current context, which the
+# sync_to_async threads of the async views and the shard fan-out threads inherit
+def record_query(execute, sql, params, many, context):
+    request_metrics = current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    return request_metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.url_name or match.view_name if match else "unmatched"
+
+
+def finish(request, response, request_metrics):
+    latency = time.perf_counter() - request_metrics.started
+    registry.record(route_name(request), latency, request_metrics)
+    response.headers["Server-Timing"] = request_metrics.server_timing(latency)
+    return response
+
+
+# times a render() call of a DRF renderer into the current request metrics
+class timed_serialization:
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        request_metrics = current_request.get()
+        if request_metrics is not None:
+            request_metrics.serialization_time += time.perf_counter() - self.started
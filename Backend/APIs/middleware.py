@@ -0,0 +1,66 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from . import metrics
+from .routers import read_from_replicas
+
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReadReplicaMiddleware:
+    # route the queries of read only requests to the read replicas (see APIs.routers)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in READ_ONLY_METHODS:
+            return self.get_response(request)
+        with read_from_replicas():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in READ_ONLY_METHODS:
+            return await self.get_response(request)
+        with read_from_replicas():
+            return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    # records latency, SQL query count / time and serialization time of a sample of the
+    # requests per route (see APIs.metrics) and reports them in a Server-Timing header
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.sampled():
+            return self.get_response(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        return metrics.finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        if not metrics.sampled():
+            return await self.get_response(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        return metrics.finish(request, response, request_metrics)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['creation_time', 'id'], name='company_creation_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['creation_time', 'id'], name='department_creation_id_idx'),
+        ),
+    ]
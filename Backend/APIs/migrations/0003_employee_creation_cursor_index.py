@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0002_creation_time_cursor_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['creation_time', 'id'], name='employee_creation_id_idx'),
+        ),
+    ]
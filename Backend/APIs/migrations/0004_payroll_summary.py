@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0003_employee_creation_cursor_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('headcount', models.PositiveIntegerField(default=0)),
+                ('salary_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('salary_min', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('salary_max', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='APIs.company')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='APIs.department')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'department'), name='payroll_summary_company_department_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+# Department names become unique per company. The oldest department of a duplicated
+# name keeps it, the others are renamed "<name> (2)", "<name> (3)", ... (shortened to
+# fit the 30 characters of the column) so no employee or summary row has to move.
+
+
+def rename_duplicate_departments(apps, schema_editor):
+    Department = apps.get_model('APIs', 'Department')
+    departments = Department.objects.using(schema_editor.connection.alias)
+    duplicates = departments.values('company_id', 'name').annotate(count=Count('id')).filter(count__gt=1)
+    for duplicate in list(duplicates):
+        taken = set(departments.filter(company_id=duplicate['company_id']).values_list('name', flat=True))
+        renamed = departments.filter(company_id=duplicate['company_id'], name=duplicate['name']).order_by('creation_time', 'id')[1:]
+        number = 1
+        for department in list(renamed):
+            name = department.name
+            while name in taken:
+                number += 1
+                suffix = f' ({number})'
+                name = department.name[:30 - len(suffix)] + suffix
+            taken.add(name)
+            departments.filter(pk=department.pk).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0004_payroll_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['name'], name='company_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['last_updated'], name='company_last_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['last_updated'], name='department_last_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['last_updated'], name='employee_last_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['last_name', 'first_name'], name='employee_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['date_hired'], name='employee_date_hired_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['company', 'date_hired'], name='employee_company_hired_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['department', 'date_hired'], name='employee_department_hired_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['salary'], name='employee_salary_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['company', 'salary'], name='employee_company_salary_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['department', 'salary'], name='employee_department_salary_idx'),
+        ),
+        migrations.RunPython(rename_duplicate_departments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='department',
+            constraint=models.UniqueConstraint(fields=('company', 'name'), name='department_company_name_uniq'),
+        ),
+    ]
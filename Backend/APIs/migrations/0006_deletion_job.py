@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0005_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('company', 'Company'), ('department', 'Department')], max_length=10)),
+                ('target_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('finished_time', models.DateTimeField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'creation_time'], name='deletionjob_status_idx'), models.Index(fields=['target_type', 'target_id'], name='deletionjob_target_idx')],
+            },
+        ),
+    ]
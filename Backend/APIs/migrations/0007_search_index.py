@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# FTS5 index behind /api/search/, see APIs/search.py. The rowid of a document is
+# pk * 4 + 1 for companies, + 2 for departments and + 3 for employees. Only
+# created on SQLite, other databases are searched without an index.
+
+CREATE = [
+    """CREATE VIRTUAL TABLE apis_search USING fts5(
+        title, detail, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    "CREATE VIRTUAL TABLE apis_search_vocabulary USING fts5vocab(apis_search, 'row')",
+    'INSERT INTO apis_search(rowid, title, detail) SELECT id * 4 + 1, name, address FROM "APIs_company"',
+    'INSERT INTO apis_search(rowid, title, detail) SELECT id * 4 + 2, name, description FROM "APIs_department"',
+    """INSERT INTO apis_search(rowid, title, detail)
+        SELECT employee.id * 4 + 3, employee.first_name || ' ' || employee.last_name,
+               account.email || ' ' || employee.phone_number
+        FROM "APIs_employee" employee JOIN auth_user account ON account.id = employee.user_id""",
+]
+
+DROP = [
+    "DROP TABLE apis_search_vocabulary",
+    "DROP TABLE apis_search",
+]
+
+
+def run(statements):
+    def forwards(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return forwards
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0006_deletion_job'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
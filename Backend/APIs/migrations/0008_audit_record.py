@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+from decimal import Decimal
+from django.db import migrations, models
+
+# Starts the audit history (see APIs/audit.py) with a "snapshot" record of every
+# existing company, department and employee, dated at its last update, so the state
+# of rows older than the history can be looked up too. The state is built like
+# APIs.audit.snapshot does.
+
+UNTRACKED = {'id', 'creation_time', 'last_updated'}
+
+
+def snapshot(instance):
+    state = {}
+    for field in instance._meta.concrete_fields:
+        if field.name in UNTRACKED:
+            continue
+        value = field.to_python(field.value_from_object(instance))
+        if value is not None and isinstance(field, models.DecimalField):
+            value = str(value.quantize(Decimal(1).scaleb(-field.decimal_places)))
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        state[field.name] = value
+    return state
+
+
+def record_snapshots(apps, schema_editor):
+    AuditRecord = apps.get_model('APIs', 'AuditRecord')
+    using = schema_editor.connection.alias
+    for model_name in ('company', 'department', 'employee'):
+        model = apps.get_model('APIs', model_name)
+        batch = []
+        for instance in model.objects.using(using).order_by('pk').iterator(chunk_size=1000):
+            batch.append(AuditRecord(
+                model=model_name,
+                object_id=instance.pk,
+                action='snapshot',
+                recorded_at=instance.last_updated,
+                state=snapshot(instance),
+            ))
+            if len(batch) == 1000:
+                AuditRecord.objects.using(using).bulk_create(batch)
+                batch = []
+        AuditRecord.objects.using(using).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('snapshot', 'Snapshot')], max_length=10)),
+                ('recorded_at', models.DateTimeField()),
+                ('state', models.JSONField()),
+                ('changes', models.JSONField(default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id', 'recorded_at', 'id'], name='auditrecord_object_time_idx')],
+            },
+        ),
+        migrations.RunPython(record_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIs', '0008_audit_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyShard',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='APIs.company')),
+                ('alias', models.CharField(max_length=30)),
+                ('moving', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['alias'], name='companyshard_alias_idx')],
+            },
+        ),
+    ]
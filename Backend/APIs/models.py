@@ -10,6 +10,13 @@ class Company(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_time', 'id'], name='company_creation_id_idx'),
+            models.Index(fields=['name'], name='company_name_idx'),
+            models.Index(fields=['last_updated'], name='company_last_updated_idx'),
+        ]
+
 
 class Department(models.Model):
     name = models.CharField(max_length=30)
@@ -18,6 +25,16 @@ class Department(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_time', 'id'], name='department_creation_id_idx'),
+            models.Index(fields=['last_updated'], name='department_last_updated_idx'),
+        ]
+        constraints = [
+            # also serves the (company, name) lookups
+            models.UniqueConstraint(fields=['company', 'name'], name='department_company_name_uniq'),
+        ]
+
 class Employee(models.Model):
     first_name = models.CharField(max_length=30)
     last_name = models.CharField(max_length=30)
@@ -30,3 +47,111 @@ class Employee(models.Model):
     salary = models.DecimalField(max_digits=10, decimal_places=2)
     creation_time = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creation_time', 'id'], name='employee_creation_id_idx'),
+            models.Index(fields=['last_updated'], name='employee_last_updated_idx'),
+            models.Index(fields=['last_name', 'first_name'], name='employee_name_idx'),
+            # hire date range filters and the monthly hiring histogram
+            models.Index(fields=['date_hired'], name='employee_date_hired_idx'),
+            models.Index(fields=['company', 'date_hired'], name='employee_company_hired_idx'),
+            models.Index(fields=['department', 'date_hired'], name='employee_department_hired_idx'),
+            # salary ordering and the per company / department salary statistics,
+            # the composite ones cover the grouped aggregates without reading the rows
+            models.Index(fields=['salary'], name='employee_salary_idx'),
+            models.Index(fields=['company', 'salary'], name='employee_company_salary_idx'),
+            models.Index(fields=['department', 'salary'], name='employee_department_salary_idx'),
+        ]
+
+
+class PayrollSummary(models.Model):
+    # materialized headcount and salary totals of the employees of one (company, department)
+    # pair, refreshed from the Employee signals when settings.PAYROLL_SUMMARY_ENABLED is on
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE)
+    headcount = models.PositiveIntegerField(default=0)
+    salary_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    salary_min = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    salary_max = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'department'], name='payroll_summary_company_department_uniq'),
+        ]
+
+
+class DeletionJob(models.Model):
+    # a company or department deleted in the background, in batches, by the
+    # run_deletion_worker management command (see APIs.jobs)
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    class Target(models.TextChoices):
+        COMPANY = 'company'
+        DEPARTMENT = 'department'
+
+    target_type = models.CharField(max_length=10, choices=Target.choices)
+    target_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # rows to delete (employees, their users, departments and the target) and rows deleted so far
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    creation_time = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+    finished_time = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'creation_time'], name='deletionjob_status_idx'),
+            models.Index(fields=['target_type', 'target_id'], name='deletionjob_target_idx'),
+        ]
+
+
+class AuditRecord(models.Model):
+    # append-only history of the companies, departments and employees, written in batches
+    # by APIs.audit. state holds every tracked field after the change (before it for a
+    # deletion) so the state at any date is the one of a single record, changes the
+    # field-level diff {field: [old, new]} against the previous record of the same row
+
+    class Action(models.TextChoices):
+        CREATED = 'created'
+        UPDATED = 'updated'
+        DELETED = 'deleted'
+        # state of the rows that existed when the audit history was introduced
+        SNAPSHOT = 'snapshot'
+
+    model = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=Action.choices)
+    # when the change happened (last_updated of the row), not when it was written
+    recorded_at = models.DateTimeField()
+    state = models.JSONField()
+    changes = models.JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            # history of one row and its latest record before a date, a single index seek
+            models.Index(fields=['model', 'object_id', 'recorded_at', 'id'], name='auditrecord_object_time_idx'),
+        ]
+
+
+class CompanyShard(models.Model):
+    # shard map: the database (alias in settings.DATABASES) holding the departments,
+    # employees and payroll summary rows of a company, companies without a row are on
+    # default. Kept on default, see APIs.sharding
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True)
+    alias = models.CharField(max_length=30)
+    # set by "manage.py move_company" while the rows are copied, writes are refused meanwhile
+    moving = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['alias'], name='companyshard_alias_idx'),
+        ]
@@ -0,0 +1,108 @@
+import heapq
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from .sharding import fan_out, spans_shards
+
+
+class CreationTimeCursorPagination(CursorPagination):
+    # keyset pagination over (creation_time, id) so that every page is a single
+    # index seek no matter how deep the client has scrolled, unlike OFFSET paging.
+    # The id tie-breaker keeps the ordering stable for rows created in the same instant.
+    ordering = ('creation_time', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.sharded = spans_shards(queryset)
+        if not self.sharded:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_shards(queryset, request)
+
+    # the sharded pages have positions of their own, a cursor of the other mode (or a made up
+    # one) is refused with a 404 instead of failing the query
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is not None and cursor.position is not None and self.parse_position(cursor.position) is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    # (creation_time, id) of a sharded position "<iso creation_time>|<id>", (creation_time,
+    # None) of the creation_time DRF keeps in its own cursors, None when it is neither
+    def parse_position(self, position):
+        if self.sharded:
+            position, separator, pk = position.rpartition('|')
+            if not separator or not pk.isdigit():
+                return None
+        else:
+            pk = None
+        try:
+            creation_time = parse_datetime(position)
+        except ValueError:
+            return None
+        return None if creation_time is None else (creation_time, pk)
+
+    # the same pages over the rows of every shard: each shard returns its next page_size + 1
+    # rows after the cursor, with a seek on (creation_time, id), and the pages are merged.
+    # The cursor holds the (creation_time, id) of the row it starts after
+    def paginate_shards(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor.reverse)
+        if self.cursor and self.cursor.position:
+            creation_time, pk = self.parse_position(self.cursor.position)
+            if self.reverse:
+                queryset = queryset.filter(Q(creation_time__lt=creation_time) | Q(creation_time=creation_time, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(creation_time__gt=creation_time) | Q(creation_time=creation_time, id__gt=pk))
+        ordering = ('-creation_time', '-id') if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)[:self.page_size + 1]
+
+        # a clone per shard, an evaluated queryset keeps its rows
+        pages = fan_out(lambda alias: list(queryset.all()))
+        rows = list(heapq.merge(*pages, key=self.position_key, reverse=self.reverse))[:self.page_size + 1]
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    @staticmethod
+    def position_key(row):
+        if isinstance(row, dict):
+            return row['creation_time'], row['id']
+        return row.creation_time, row.id
+
+    def shard_cursor_link(self, row, reverse):
+        creation_time, pk = self.position_key(row)
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=f'{creation_time.isoformat()}|{pk}'))
+
+    def get_next_link(self):
+        if not self.sharded:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.shard_cursor_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.sharded:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.shard_cursor_link(self.page[0], reverse=True)
+
+
+class AuditCursorPagination(CursorPagination):
+    # the history of a row in the order of the changes, walks the (model, object_id,
+    # recorded_at, id) index of the audit records
+    ordering = ('recorded_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
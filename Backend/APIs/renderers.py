@@ -0,0 +1,43 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from .metrics import timed_serialization
+
+try:
+    import orjson
+except ImportError:  # optional, FastJSONRenderer falls back to the standard json module
+    orjson = None
+
+
+class TimedJSONRenderer(JSONRenderer):
+    # JSONRenderer that reports its rendering time to the request metrics
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed_serialization():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(TimedJSONRenderer):
+    # renders with orjson when it is installed (see the Pipfile), like JSONRenderer with the
+    # default compact / unicode / strict settings: values orjson would format differently
+    # (datetimes, decimals, ...) are handed to DRF's own encoder through default=.
+    # Floats never reach default=, so two differences remain: exponents are written without
+    # "+" (1e16 where JSONRenderer writes 1e+16, the same number) and NaN / Infinity become
+    # null where JSONRenderer refuses them. The API renders decimals as strings, the only
+    # floats it sends are ratios such as a deletion job's progress
+
+    OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or self.get_indent(accepted_media_type or "", renderer_context or {})
+            or not api_settings.COMPACT_JSON
+            or not api_settings.UNICODE_JSON
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        with timed_serialization():
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.OPTIONS)
+            # same escaping of the javascript line terminators as JSONRenderer
+            return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
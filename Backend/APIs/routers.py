@@ -0,0 +1,118 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+# set for the duration of a read only (GET / HEAD / OPTIONS) request by ReadReplicaMiddleware
+_reading_from_replicas = ContextVar("reading_from_replicas", default=False)
+
+# database of the company whose rows are being read / written, set with use_shard()
+_current_shard = ContextVar("current_shard", default=None)
+
+# models whose rows live on the shard of their company, see APIs.sharding
+SHARDED_MODELS = {"department", "employee", "payrollsummary"}
+
+
+@contextmanager
+def read_from_replicas():
+    token = _reading_from_replicas.set(True)
+    try:
+        yield
+    finally:
+        _reading_from_replicas.reset(token)
+
+
+# back to default for the reads that must see the writes just made, inside a read only request
+@contextmanager
+def read_from_default():
+    token = _reading_from_replicas.set(False)
+    try:
+        yield
+    finally:
+        _reading_from_replicas.reset(token)
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+def is_sharded_model(model):
+    return model._meta.app_label == "APIs" and model._meta.model_name in SHARDED_MODELS
+
+
+def replica_aliases():
+    return settings.REPLICA_DATABASES
+
+
+def shard_aliases():
+    return settings.SHARD_DATABASES
+
+
+class ShardRouter:
+    # sends the departments, employees and payroll summary rows to the shard selected with
+    # use_shard(), or to the database an instance was loaded from. Everything else, and the
+    # rows of the companies kept on default, is left to the next router
+
+    def _shard(self, model, hints):
+        if not is_sharded_model(model):
+            return None
+        alias = _current_shard.get()
+        if alias is None:
+            instance = hints.get("instance")
+            alias = instance._state.db if instance is not None else None
+        return alias if alias in shard_aliases() else None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # every shard has the whole schema, the company and user tables hold copies. Matched
+        # by name so the spare shards of the test runs are migrated before being enabled
+        return True if db.startswith("shard") else None
+
+
+# read right after they are written by another request: the session and user of a fresh
+# login, the job a 202 points to, the history of a change just made
+READ_AFTER_WRITE_APPS = {"auth", "sessions"}
+READ_AFTER_WRITE_MODELS = {"deletionjob", "auditrecord", "companyshard"}
+
+
+def is_read_after_write(model):
+    return model._meta.app_label in READ_AFTER_WRITE_APPS or (
+        model._meta.app_label == "APIs" and model._meta.model_name in READ_AFTER_WRITE_MODELS
+    )
+
+
+class ReadReplicaRouter:
+    # sends the reads of read only requests to a random replica, everything else
+    # (writes, reads inside POST / PUT / DELETE requests, management commands, the models
+    # a lagging replica would serve stale) uses default
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if replicas and _reading_from_replicas.get() and not is_read_after_write(model):
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of default, they are never migrated directly
+        return db == "default"
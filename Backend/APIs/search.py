@@ -0,0 +1,187 @@
+import difflib
+import re
+from django.db import connections, router, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Concat
+from .models import Company, Department, Employee
+from .sharding import shards, use_shard
+
+# Search index over companies, departments and employees.
+# On SQLite the documents live in the FTS5 table created by migration 0007, kept in
+# sync by the signals in signals.py (and by insert_chunk for bulk registrations).
+# Its rowid encodes the object: pk * 4 + kind code, so a document is replaced or
+# removed by primary key without scanning. Other databases fall back to a plain
+# icontains lookup on the models. The index stays on default with the companies when the
+# departments and employees are spread over shards (see APIs.sharding).
+
+TABLE = "apis_search"
+VOCABULARY_TABLE = "apis_search_vocabulary"
+KINDS = {"company": 1, "department": 2, "employee": 3}
+KIND_NAMES = {code: kind for kind, code in KINDS.items()}
+MODELS = {Company: "company", Department: "department", Employee: "employee"}
+TITLE_WEIGHT, DETAIL_WEIGHT = 10.0, 1.0
+TOKEN = re.compile(r"\w+")
+
+# a misspelled term is compared against the indexed terms sharing its first two
+# letters and of a similar length, and replaced by the closest ones
+TYPO_MIN_LENGTH = 3
+TYPO_CANDIDATES = 3
+TYPO_CUTOFF = 0.75
+
+
+def is_indexed(using):
+    return connections[using].vendor == "sqlite"
+
+
+def rowid(kind, pk):
+    return pk * 4 + KINDS[kind]
+
+
+# (title, detail) of the document of an object, keep in line with migration 0007
+def document(instance):
+    if isinstance(instance, Company):
+        return instance.name, instance.address
+    if isinstance(instance, Department):
+        return instance.name, instance.description
+    return f"{instance.first_name} {instance.last_name}", f"{instance.user.email} {instance.phone_number}"
+
+
+# using is the database the objects were written to: when it is a shard the documents
+# are written once its transaction commits, a rolled back write leaves none behind
+def index_objects(objects, using=None):
+    objects = list(objects)
+    if not objects:
+        return
+    if using not in (None, router.db_for_write(Company)):
+        transaction.on_commit(lambda: index_objects(objects), using=using)
+        return
+    using = router.db_for_write(Company)
+    if not is_indexed(using):
+        return
+    kind = MODELS[type(objects[0])]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {TABLE}(rowid, title, detail) VALUES (%s, %s, %s)",
+            [(rowid(kind, instance.pk), *document(instance)) for instance in objects],
+        )
+
+
+def remove_objects(model, pks, using=None):
+    if using not in (None, router.db_for_write(Company)):
+        transaction.on_commit(lambda: remove_objects(model, pks), using=using)
+        return
+    using = router.db_for_write(Company)
+    if not is_indexed(using):
+        return
+    kind = MODELS[model]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(rowid(kind, pk),) for pk in pks])
+
+
+def rebuild(batch_size=1000):
+    using = router.db_for_write(Company)
+    if not is_indexed(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    indexed = _index_queryset(Company.objects.all(), batch_size)
+    for alias in shards():
+        with use_shard(alias):
+            for queryset in (Department.objects.all(), Employee.objects.select_related("user")):
+                indexed += _index_queryset(queryset, batch_size)
+    return indexed
+
+
+def _index_queryset(queryset, batch_size):
+    indexed = 0
+    batch = []
+    for instance in queryset.iterator(chunk_size=batch_size):
+        batch.append(instance)
+        if len(batch) == batch_size:
+            index_objects(batch)
+            indexed, batch = indexed + len(batch), []
+    index_objects(batch)
+    return indexed + len(batch)
+
+
+def terms(query):
+    return TOKEN.findall(query.lower())
+
+
+def _match_expression(alternatives):
+    # every term must match, each as a prefix or as one of its corrections
+    return " AND ".join(
+        "(" + " OR ".join([f'"{term}"*'] + [f'"{word}"' for word in corrections]) + ")"
+        for term, corrections in alternatives
+    )
+
+
+def _corrections(cursor, term):
+    if len(term) < TYPO_MIN_LENGTH:
+        return []
+    cursor.execute(
+        f"SELECT term FROM {VOCABULARY_TABLE} WHERE term >= %s AND term < %s AND length(term) BETWEEN %s AND %s",
+        [term[:2], term[:1] + chr(ord(term[1]) + 1), len(term) - 2, len(term) + 2],
+    )
+    return difflib.get_close_matches(term, [row[0] for row in cursor.fetchall()], TYPO_CANDIDATES, TYPO_CUTOFF)
+
+
+# ranked search, returns (results, corrected) with at most limit results after offset;
+# corrected tells whether misspelled terms had to be replaced to find anything
+def search(query, kinds=None, limit=20, offset=0):
+    words = terms(query)
+    if not words:
+        return [], False
+    using = router.db_for_read(Company)
+    if not is_indexed(using):
+        return _search_models(words, kinds, limit, offset), False
+
+    kind_filter = ""
+    if kinds:
+        kind_filter = f"AND (rowid & 3) IN ({', '.join(str(KINDS[kind]) for kind in kinds)})"
+    with connections[using].cursor() as cursor:
+        expression = _match_expression((word, []) for word in words)
+        cursor.execute(f"SELECT 1 FROM {TABLE} WHERE {TABLE} MATCH %s {kind_filter} LIMIT 1", [expression])
+        corrected = cursor.fetchone() is None
+        if corrected:
+            expression = _match_expression((word, _corrections(cursor, word)) for word in words)
+        cursor.execute(
+            f"SELECT rowid, title, detail, bm25({TABLE}, {TITLE_WEIGHT}, {DETAIL_WEIGHT}) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s {kind_filter} ORDER BY score, rowid LIMIT %s OFFSET %s",
+            [expression, limit, offset],
+        )
+        rows = cursor.fetchall()
+    results = [
+        {"type": KIND_NAMES[row & 3], "id": row >> 2, "title": title, "detail": detail, "score": round(-score, 6)}
+        for row, title, detail, score in rows
+    ]
+    return results, corrected
+
+
+# unindexed fallback for databases without FTS5, every term has to appear somewhere
+def _search_models(words, kinds, limit, offset):
+    sources = {
+        "company": (Company.objects.all(), ("name", "address"), "name", "address"),
+        "department": (Department.objects.all(), ("name", "description"), "name", "description"),
+        "employee": (
+            Employee.objects.annotate(
+                title=Concat("first_name", Value(" "), "last_name"),
+                detail=Concat("user__email", Value(" "), "phone_number"),
+            ),
+            ("first_name", "last_name", "user__email", "phone_number"),
+            "title",
+            "detail",
+        ),
+    }
+    results = []
+    for kind, (queryset, fields, title, detail) in sources.items():
+        if kinds and kind not in kinds:
+            continue
+        for word in words:
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{f"{field}__icontains": word})
+            queryset = queryset.filter(condition)
+        for pk, title_value, detail_value in queryset.order_by("pk").values_list("pk", title, detail)[:offset + limit]:
+            results.append({"type": kind, "id": pk, "title": title_value, "detail": detail_value, "score": 0.0})
+    return results[offset:offset + limit]
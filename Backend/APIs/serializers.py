@@ -1,6 +1,12 @@
-from rest_framework import serializers
+from functools import cached_property
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework.relations import PrimaryKeyRelatedField
 from django.contrib.auth.models import User
-from .models import Company, Department, Employee
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from .models import Company, Department, Employee, DeletionJob, AuditRecord
 
 
 
@@ -36,9 +42,248 @@ class DepartmentSerializer(serializers.ModelSerializer):
         model = Department
         fields = '__all__'
 
+class DepartmentBatchSerializer(DepartmentSerializer):
+    # item of a batch write, the company and the (company, name) uniqueness are
+    # checked once for the whole batch by APIs.batch instead of once per item
+    company = serializers.IntegerField(source='company_id')
+
+    class Meta(DepartmentSerializer.Meta):
+        validators = []
+
 class EmployeeSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
 
     class Meta:
         model = Employee
         fields = '__all__'
+
+
+class ValuesReadSerializer:
+    # read only fast path of a ModelSerializer for the list / detail GETs: rows come from
+    # .values() and are converted field by field with the serializer's own fields, so the
+    # output is identical while no model instance or per row serializer is ever built.
+    # Dotted sources ('company.name') become joined lookups ('company__name').
+
+    # fields whose to_representation returns the value fetched by .values() unchanged
+    IDENTITY_FIELDS = (
+        serializers.CharField, serializers.EmailField, serializers.IntegerField, PrimaryKeyRelatedField,
+    )
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def columns(self):
+        return [
+            (name, field.source.replace('.', '__'), field)
+            for name, field in self.serializer_class().fields.items()
+            if not field.write_only
+        ]
+
+    # DateTimeField.to_representation resolves the current timezone for every value,
+    # the ISO 8601 case is done here with the timezone looked up once per call
+    def _datetime_converter(self, field, current_timezone):
+        if getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != ISO_8601 or hasattr(field, 'timezone'):
+            return field.to_representation
+
+        def convert(value):
+            if current_timezone is None or timezone.is_naive(value):
+                return field.to_representation(value)
+            value = value.astimezone(current_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    def converters(self):
+        current_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        converters = []
+        for name, lookup, field in self.columns:
+            if type(field) in self.IDENTITY_FIELDS:
+                convert = None
+            elif type(field) is serializers.DateTimeField:
+                convert = self._datetime_converter(field, current_timezone)
+            else:
+                convert = field.to_representation
+            converters.append((name, lookup, convert))
+        return converters
+
+    def values(self, queryset):
+        return queryset.values(*[lookup for _, lookup, _ in self.columns])
+
+    def to_representation(self, row, converters=None):
+        return {
+            name: row[lookup] if convert is None or row[lookup] is None else convert(row[lookup])
+            for name, lookup, convert in converters or self.converters()
+        }
+
+    def many(self, rows):
+        converters = self.converters()
+        return [self.to_representation(row, converters) for row in rows]
+
+
+class EmployeeReadSerializer(serializers.ModelSerializer):
+    # read only representation of an employee with the names of its user, company and
+    # department. Served through employee_values
+    username = serializers.CharField(source='user.username', read_only=True)
+    email = serializers.EmailField(source='user.email', read_only=True)
+    company_name = serializers.CharField(source='company.name', read_only=True)
+    department_name = serializers.CharField(source='department.name', read_only=True)
+
+    class Meta:
+        model = Employee
+        fields = (
+            'id', 'user', 'username', 'email', 'first_name', 'last_name', 'phone_number',
+            'address', 'company', 'company_name', 'department', 'department_name',
+            'date_hired', 'salary', 'creation_time', 'last_updated',
+        )
+        read_only_fields = fields
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DeletionJob
+        fields = '__all__'
+
+    def get_progress(self, job):
+        return min(job.deleted / job.total, 1.0) if job.total else 1.0
+
+
+class AuditRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditRecord
+        fields = ('id', 'action', 'recorded_at', 'state', 'changes')
+
+
+class AuditHistoryQuerySerializer(serializers.Serializer):
+    # query string of the history endpoints, ?fields=salary,department keeps the records
+    # changing one of these fields, ?since= / ?until= bound the dates
+    fields = serializers.CharField(required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate_fields(self, value):
+        fields = sorted({item.strip() for item in value.split(',') if item.strip()})
+        tracked = self.context['tracked_fields']
+        unknown = [field for field in fields if field not in tracked]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown field {', '.join(unknown)}, expected {', '.join(tracked)}")
+        return fields
+
+
+class AsOfQuerySerializer(serializers.Serializer):
+    # ?at= of the as-of endpoints
+    at = serializers.DateTimeField()
+
+
+class EmployeeFilterSerializer(serializers.Serializer):
+    # query string filters of the employee list endpoint
+    company = serializers.IntegerField(required=False)
+    department = serializers.IntegerField(required=False)
+    hired_after = serializers.DateField(required=False)
+    hired_before = serializers.DateField(required=False)
+
+    LOOKUPS = {
+        'company': 'company_id',
+        'department': 'department_id',
+        'hired_after': 'date_hired__gte',
+        'hired_before': 'date_hired__lte',
+    }
+
+    def lookups(self):
+        return {self.LOOKUPS[name]: value for name, value in self.validated_data.items()}
+
+
+class SalaryStatsSerializer(serializers.Serializer):
+    headcount = serializers.IntegerField()
+    salary_total = serializers.DecimalField(max_digits=None, decimal_places=2)
+    salary_avg = serializers.DecimalField(max_digits=None, decimal_places=2, allow_null=True)
+    salary_min = serializers.DecimalField(max_digits=None, decimal_places=2, allow_null=True)
+    salary_max = serializers.DecimalField(max_digits=None, decimal_places=2, allow_null=True)
+    salary_percentiles = serializers.DictField(
+        child=serializers.DecimalField(max_digits=None, decimal_places=2), required=False
+    )
+
+
+class CompanyAnalyticsSerializer(SalaryStatsSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class DepartmentAnalyticsSerializer(SalaryStatsSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    company = serializers.IntegerField()
+
+
+class HiringMonthSerializer(serializers.Serializer):
+    month = serializers.DateField(format='%Y-%m')
+    hires = serializers.IntegerField()
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    # query string of the analytics endpoint, ?percentiles=50,90,99 and ?source=live|summary
+    percentiles = serializers.CharField(required=False)
+    source = serializers.ChoiceField(choices=('live', 'summary'), default='live')
+
+    def validate_percentiles(self, value):
+        try:
+            percentiles = sorted({float(item) for item in value.split(',') if item.strip()})
+        except ValueError:
+            raise serializers.ValidationError("Percentiles must be a comma separated list of numbers")
+        if any(not 0 < percentile <= 100 for percentile in percentiles):
+            raise serializers.ValidationError("Percentiles must be between 0 (exclusive) and 100")
+        return [int(percentile) if percentile.is_integer() else percentile for percentile in percentiles]
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    # query string of the search endpoint, ?q= plus optional ?type=employee,company and ?page=
+    KINDS = ('company', 'department', 'employee')
+
+    q = serializers.CharField(max_length=200)
+    type = serializers.CharField(required=False)
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=lambda: api_settings.PAGE_SIZE)
+
+    def validate_type(self, value):
+        kinds = sorted({item.strip() for item in value.split(',') if item.strip()})
+        unknown = [kind for kind in kinds if kind not in self.KINDS]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown type {', '.join(unknown)}, expected {', '.join(self.KINDS)}")
+        return kinds
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    # query string of the export endpoint, ?output= because DRF reserves ?format=
+    resource = serializers.ChoiceField(choices=('employees', 'companies', 'departments'), default='employees')
+    output = serializers.ChoiceField(choices=('csv', 'ndjson', 'columnar'), default='csv')
+    since = serializers.DateTimeField(required=False)
+
+
+class BulkEmployeeRowSerializer(serializers.ModelSerializer):
+    # one row of a bulk registration upload, validated without touching the database.
+    # username uniqueness and the company / department keys are checked per chunk by APIs.bulk
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(max_length=254, required=False, allow_blank=True)
+    password = serializers.CharField(max_length=128, write_only=True)
+    password_confirmation = serializers.CharField(write_only=True)
+    company = serializers.IntegerField()
+    department = serializers.IntegerField()
+
+    class Meta:
+        model = Employee
+        fields = (
+            'username', 'email', 'password', 'password_confirmation',
+            'first_name', 'last_name', 'phone_number', 'address',
+            'company', 'department', 'date_hired', 'salary',
+        )
+
+    def validate(self, data):
+        if data['password'] != data['password_confirmation']:
+            raise serializers.ValidationError("Passwords do not match")
+        return data
+
+
+company_values = ValuesReadSerializer(CompanySerializer)
+department_values = ValuesReadSerializer(DepartmentSerializer)
+employee_values = ValuesReadSerializer(EmployeeReadSerializer)
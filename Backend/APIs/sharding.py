@@ -0,0 +1,319 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Count
+from rest_framework.exceptions import APIException
+from .models import Company, CompanyShard, Department, Employee, PayrollSummary
+from .routers import current_shard, is_sharded_model, shard_aliases, use_shard
+
+# Company keyed sharding. With DATABASE_SHARDS set, the departments, employees and payroll
+# summary rows of every company live on one shard database (shard1, shard2, ...) picked
+# when the company is created and recorded in the CompanyShard map. default stays the
+# directory: companies, users, sessions, jobs, audit records and the search index, plus the
+# rows of the companies that were never placed on a shard. Every shard keeps a copy of its
+# companies and of their employees' users so the joined queries still run on one database.
+# Views resolve the shard from the company id and select it with use_shard(), requests
+# spanning every company query the shards in parallel with fan_out() and merge the rows.
+# Each shard numbers its departments and employees from its own range of ids, so an id is
+# unique across the shards and a row keeps its id when its company is moved.
+
+DIRECTORY = "default"
+ID_RANGE = 10 ** 12
+
+
+class CompanyMoving(APIException):
+    status_code = 503
+    default_detail = "The company is being moved to another database, try again in a moment."
+    default_code = "company_moving"
+
+
+def is_sharded():
+    return bool(shard_aliases())
+
+
+# every database that can hold the rows of a company
+def shards():
+    return [DIRECTORY, *shard_aliases()]
+
+
+# the rows of the queryset are on several databases and no shard was selected
+def spans_shards(queryset):
+    return is_sharded() and is_sharded_model(queryset.model) and current_shard() is None
+
+
+def as_company_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# {company id: shard} of the given companies, default ones are left out. With for_write
+# a company being moved raises CompanyMoving
+def company_shards(company_ids=None, for_write=False):
+    if not is_sharded():
+        return {}
+    rows = CompanyShard.objects.using(DIRECTORY).values_list("company_id", "alias", "moving")
+    if company_ids is not None:
+        rows = rows.filter(company_id__in={as_company_id(value) for value in company_ids} - {None})
+    rows = list(rows)
+    if for_write and any(moving for _, _, moving in rows):
+        raise CompanyMoving
+    return {company_id: alias for company_id, alias, _ in rows}
+
+
+def shard_of(company_id, for_write=False):
+    return company_shards([company_id], for_write).get(as_company_id(company_id), DIRECTORY)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.SHARD_FANOUT_WORKERS, thread_name_prefix="shard-fan-out")
+        return _executor
+
+
+def _run_on(alias, function):
+    try:
+        with use_shard(alias):
+            return function(alias)
+    finally:
+        close_old_connections()
+
+
+# function(alias) with that shard selected for every shard (or the given ones), on the
+# fan-out thread pool when there are several. Returns the results in the same order
+def fan_out(function, aliases=None):
+    aliases = shards() if aliases is None else list(aliases)
+    if len(aliases) == 1:
+        with use_shard(aliases[0]):
+            return [function(aliases[0])]
+    futures = [
+        _pool().submit(contextvars.copy_context().run, _run_on, alias, function) for alias in aliases
+    ]
+    return [future.result() for future in futures]
+
+
+# shard of the company of the department / employee matching lookups (e.g. pk=3), found
+# by asking every shard at once. default when no shard has it
+def locate(model, for_write=False, **lookups):
+    if not is_sharded():
+        return DIRECTORY
+    found = fan_out(lambda alias: model.objects.filter(**lookups).values_list("company_id", flat=True).first())
+    company_ids = [company_id for company_id in found if company_id is not None]
+    return shard_of(company_ids[0], for_write) if company_ids else DIRECTORY
+
+
+# {pk: company id} of the given departments / employees, wherever they are
+def locate_many(model, pks):
+    pks = set(pks)
+    if not pks:
+        return {}
+    located = {}
+    for rows in fan_out(lambda alias: list(model.objects.filter(pk__in=pks).values_list("pk", "company_id"))):
+        located.update(rows)
+    return located
+
+
+# insert copies of rows (same ids and timestamps) on another database, without signals
+def copy_rows(model, rows, alias):
+    fields = model._meta.concrete_fields
+    copies = [model(**{field.attname: getattr(row, field.attname) for field in fields}) for row in rows]
+    if not copies:
+        return 0
+    if model is User:
+        # only joined for the names, the password stays on default
+        for copy in copies:
+            copy.password = "!"
+    # bulk_create stamps the auto_now(_add) fields, put the original values back
+    stamped = [field.attname for field in fields if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)]
+    timestamps = [[getattr(copy, name) for name in stamped] for copy in copies]
+    model.objects.using(alias).bulk_create(copies)
+    if stamped:
+        for copy, values in zip(copies, timestamps):
+            for name, value in zip(stamped, values):
+                setattr(copy, name, value)
+        model.objects.using(alias).bulk_update(copies, stamped)
+    return len(copies)
+
+
+# delete rows by id without loading them or sending signals (copies, moved rows)
+def delete_rows(alias, model, pks, batch_size=500):
+    pks = list(pks)
+    connection = connections[alias]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+    return len(pks)
+
+
+# copies of the users of the employees about to be created on a shard
+def copy_users(users, alias):
+    if alias == DIRECTORY:
+        return
+    users = list(users)
+    present = set(User.objects.using(alias).filter(pk__in=[user.pk for user in users]).values_list("pk", flat=True))
+    copy_rows(User, [user for user in users if user.pk not in present], alias)
+
+
+def delete_user_copies(alias, user_ids):
+    if alias != DIRECTORY:
+        delete_rows(alias, User, user_ids)
+
+
+# places new companies on the shard holding the fewest companies, with their copy
+def place_companies(companies):
+    if not is_sharded():
+        return
+    targets = shard_aliases()
+    counts = dict.fromkeys(targets, 0)
+    counts.update(
+        CompanyShard.objects.using(DIRECTORY).filter(alias__in=targets).values_list("alias").annotate(Count("pk"))
+    )
+    placements = []
+    for company in companies:
+        alias = min(targets, key=counts.__getitem__)
+        counts[alias] += 1
+        placements.append(CompanyShard(company_id=company.pk, alias=alias))
+        copy_rows(Company, [company], alias)
+    CompanyShard.objects.using(DIRECTORY).bulk_create(placements)
+
+
+# brings the shard copies of updated companies up to date
+def sync_companies(companies):
+    companies = list(companies)
+    placed = company_shards([company.pk for company in companies])
+    for company in companies:
+        if company.pk in placed:
+            fields = {field.attname: getattr(company, field.attname) for field in Company._meta.concrete_fields}
+            Company.objects.using(placed[company.pk]).filter(pk=company.pk).update(**fields)
+
+
+# the shard rows of a company being deleted from default, the deletes of its departments
+# and employees go through the ORM so their signals are sent as usual
+def delete_company_rows(company_id):
+    alias = shard_of(company_id)
+    if alias == DIRECTORY:
+        return
+    with use_shard(alias), transaction.atomic(using=alias):
+        employees = Employee.objects.filter(company_id=company_id) | Employee.objects.filter(department__company_id=company_id)
+        user_ids = list(employees.values_list("user_id", flat=True))
+        Department.objects.filter(company_id=company_id).delete()
+        Employee.objects.filter(company_id=company_id).delete()
+        PayrollSummary.objects.filter(company_id=company_id).delete()
+        delete_user_copies(alias, user_ids)
+        delete_rows(alias, Company, [company_id])
+
+
+# first id of the departments and employees created on a shard: shardN starts at N * ID_RANGE
+def reserve_id_range(alias):
+    if alias not in shard_aliases():
+        return
+    start = int(alias.removeprefix("shard")) * ID_RANGE
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in (Department, Employee):
+            table = model._meta.db_table
+            if connection.vendor == "sqlite":
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start])
+                elif row[0] < start:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start, table])
+            elif connection.vendor == "postgresql":
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                    [table, start],
+                )
+
+
+def _clear(alias, company_id, batch_size):
+    employees = Employee.objects.using(alias).filter(company_id=company_id)
+    user_ids = list(employees.values_list("user_id", flat=True))
+    delete_rows(alias, Employee, list(employees.values_list("pk", flat=True)), batch_size)
+    delete_rows(alias, PayrollSummary, list(
+        PayrollSummary.objects.using(alias).filter(company_id=company_id).values_list("pk", flat=True)
+    ), batch_size)
+    delete_rows(alias, Department, list(
+        Department.objects.using(alias).filter(company_id=company_id).values_list("pk", flat=True)
+    ), batch_size)
+    if alias != DIRECTORY:
+        delete_rows(alias, User, user_ids, batch_size)
+        delete_rows(alias, Company, [company_id])
+
+
+def _batches(queryset, batch_size):
+    batch = []
+    for row in queryset.order_by("pk").iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy(source, target, company_id, batch_size):
+    copied = 0
+    with transaction.atomic(using=target):
+        if target != DIRECTORY:
+            copy_rows(Company, Company.objects.using(DIRECTORY).filter(pk=company_id), target)
+        for batch in _batches(Department.objects.using(source).filter(company_id=company_id), batch_size):
+            copied += copy_rows(Department, batch, target)
+    for batch in _batches(Employee.objects.using(source).filter(company_id=company_id), batch_size):
+        with transaction.atomic(using=target):
+            if target != DIRECTORY:
+                copy_rows(User, User.objects.using(DIRECTORY).filter(pk__in=[row.user_id for row in batch]), target)
+            copied += copy_rows(Employee, batch, target)
+    with transaction.atomic(using=target):
+        copied += copy_rows(PayrollSummary, PayrollSummary.objects.using(source).filter(company_id=company_id), target)
+    return copied
+
+
+# moves the departments, employees and payroll rows of a company to another shard: writes
+# to the company are refused, the writes already past that check get grace seconds to
+# finish, the rows are copied with their ids and timestamps, the shard map is switched and
+# the rows are removed from the old shard. Returns the number of rows moved
+def move_company(company_id, target, batch_size=1000, grace=5):
+    if target not in shards():
+        raise ValueError(f"Unknown shard {target}, expected one of {', '.join(shards())}")
+    if not Company.objects.using(DIRECTORY).filter(pk=company_id).exists():
+        raise ValueError(f"No company {company_id}")
+    source = shard_of(company_id)
+    if source == target:
+        return 0
+    employees = Employee.objects.using(source).filter(company_id=company_id) | Employee.objects.using(source).filter(
+        department__company_id=company_id
+    )
+    if employees.exclude(company_id=company_id, department__company_id=company_id).exists():
+        raise ValueError(
+            f"Company {company_id} shares employees with the departments of other companies, they cannot be moved apart"
+        )
+
+    CompanyShard.objects.using(DIRECTORY).update_or_create(
+        company_id=company_id, defaults={"alias": source, "moving": True}
+    )
+    try:
+        time.sleep(grace)
+        # leftovers of an interrupted move
+        _clear(target, company_id, batch_size)
+        copied = _copy(source, target, company_id, batch_size)
+    except BaseException:
+        CompanyShard.objects.using(DIRECTORY).filter(company_id=company_id).update(moving=False)
+        raise
+    CompanyShard.objects.using(DIRECTORY).filter(company_id=company_id).update(alias=target, moving=False)
+    _clear(source, company_id, batch_size)
+    return copied
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
+from django.db import transaction
+from django.dispatch import receiver
+from . import audit, events, search, sharding
+from .analytics import refresh_payroll_summary
+from .cache import invalidate
+from .models import Company, Department, Employee
+
+
+# a new company is placed on a shard, the shard copy of the others follows their changes
+@receiver(post_save, sender=Company)
+def place_company(sender, instance, created, **kwargs):
+    if created:
+        sharding.place_companies([instance])
+    else:
+        sharding.sync_companies([instance])
+
+
+# the departments and employees of a company on a shard are not reached by the cascade
+@receiver(pre_delete, sender=Company)
+def delete_company_shard_rows(sender, instance, **kwargs):
+    sharding.delete_company_rows(instance.pk)
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using, **kwargs):
+    if sender.name == "APIs":
+        sharding.reserve_id_range(using)
+
+
+# cascaded deletes go through the collector which sends post_delete for every
+# department removed along with its company, so those are invalidated as well
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_cached_responses(sender, instance, using, **kwargs):
+    # once committed, a GET running before the commit would cache the old row again
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate(sender, pk), using=using)
+
+
+# remember the group an employee is leaving so both summary rows get refreshed. The
+# summary rows are on the database the employee is written to, whether or not its shard
+# was selected with use_shard()
+@receiver(pre_save, sender=Employee)
+def remember_payroll_group(sender, instance, using, **kwargs):
+    if not settings.PAYROLL_SUMMARY_ENABLED or instance.pk is None:
+        return
+    with sharding.use_shard(using):
+        instance._previous_payroll_group = (
+            Employee.objects.filter(pk=instance.pk).values_list("company_id", "department_id").first()
+        )
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def refresh_payroll_group(sender, instance, using, **kwargs):
+    if not settings.PAYROLL_SUMMARY_ENABLED:
+        return
+    groups = [(instance.company_id, instance.department_id)]
+    previous = getattr(instance, "_previous_payroll_group", None)
+    if previous:
+        groups.append(previous)
+    with sharding.use_shard(using):
+        refresh_payroll_summary(groups)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Employee)
+def index_search_document(sender, instance, using, **kwargs):
+    search.index_objects([instance], using)
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Employee)
+def remove_search_document(sender, instance, using, **kwargs):
+    search.remove_objects(sender, [instance.pk], using)
+
+
+# the email of an employee is part of its document, logins only touch last_login
+@receiver(post_save, sender=User)
+def reindex_employee_email(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "email" not in update_fields):
+        return
+    alias = sharding.locate(Employee, user_id=instance.pk)
+    if alias != sharding.DIRECTORY:
+        User.objects.using(alias).filter(pk=instance.pk).update(username=instance.username, email=instance.email)
+    with sharding.use_shard(alias):
+        search.index_objects(Employee.objects.filter(user=instance).select_related("user"))
+
+
+# change feed of /api/events/, sent once the transaction commits
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Employee)
+def publish_change(sender, instance, created, **kwargs):
+    events.publish_on_commit(instance, "created" if created else "updated")
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Employee)
+def publish_deletion(sender, instance, **kwargs):
+    events.publish_on_commit(instance, "deleted")
+
+
+# audit history, buffered by APIs.audit and written in batches
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Employee)
+def audit_change(sender, instance, created, **kwargs):
+    audit.record([instance], "created" if created else "updated")
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Employee)
+def audit_deletion(sender, instance, **kwargs):
+    audit.record([instance], "deleted")
+
+
+# sent once the response went out, so writing the batch does not delay it
+@receiver(request_finished)
+def flush_audit_records(sender, **kwargs):
+    if audit.buffer.due():
+        audit.buffer.flush()
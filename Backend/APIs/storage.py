@@ -0,0 +1,41 @@
+import gzip
+from pathlib import Path
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    # optional, "pip install brotli" adds the .br variants
+    brotli = None
+
+# file types worth compressing and the size below which it is not worth it
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html", ".xml", ".ico"}
+COMPRESS_MIN_SIZE = 512
+
+
+def compressed_variants(data):
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    return {suffix: variant for suffix, variant in variants.items() if len(variant) < len(data)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # fingerprints the files like ManifestStaticFilesStorage (main.css -> main.<hash>.css),
+    # then writes the .gz / .br variant of every compressible file next to it at
+    # collectstatic time, served by APIs.frontend.serve_static
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if Path(name).suffix.lower() not in COMPRESSIBLE_SUFFIXES or not self.exists(name):
+                continue
+            path = Path(self.path(name))
+            data = path.read_bytes()
+            if len(data) < COMPRESS_MIN_SIZE:
+                continue
+            for suffix, variant in compressed_variants(data).items():
+                path.with_name(path.name + suffix).write_bytes(variant)
@@ -1,3 +1,1238 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipIf
+from urllib.parse import quote, urlencode
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, router, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from . import hashing, search
+from .audit import as_of, buffer, snapshot, write
+from .authentication import issue_token
+from .cache import detail_key, get_cache, stats, store
+from .events import Event, Subscription, broker
+from .frontend import get_shell
+from .jobs import claim_next_job, run_job
+from .metrics import registry
+from .middleware import ReadReplicaMiddleware
+from .models import AuditRecord, Company, CompanyShard, DeletionJob, Department, Employee, PayrollSummary
+from .renderers import FastJSONRenderer, orjson
+from .routers import read_from_replicas, use_shard
+from .serializers import CompanySerializer, DepartmentSerializer, EmployeeReadSerializer
+from .serializers import company_values, department_values, employee_values
+from .sharding import ID_RANGE, reserve_id_range
+from .throttling import take_token
 
-# Create your tests here.
+
+# rows the tests start from, the fields a test does not look at get valid defaults
+def create_company(name="Acme", **fields):
+    return Company.objects.create(name=name, **{"address": "Cairo", "email": "acme@example.com", **fields})
+
+
+def create_department(company, name="HR", **fields):
+    return Department.objects.create(company=company, name=name, **{"description": "", **fields})
+
+
+def create_employee(department, username, password=None, email="", **fields):
+    fields = {
+        "first_name": "First", "last_name": "Last", "phone_number": "0100", "address": "Street",
+        "date_hired": "2024-01-01", "salary": "1000.00", **fields,
+    }
+    user = User.objects.create_user(username, email=email, password=password)
+    return Employee.objects.create(user=user, company_id=department.company_id, department=department, **fields)
+
+
+# the cursor query parameter of a page starting after position
+def cursor(position, reverse=False):
+    return base64.b64encode(urlencode({"p": position, "r": int(reverse)}).encode()).decode()
+
+
+# self.client signed in as the "admin" user
+class AdminClientMixin:
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.admin = User.objects.create_user("admin", password="secret")
+        self.client.force_authenticate(self.admin)
+
+
+# and the company most API tests work on
+class CompanyTestCase(AdminClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.company = create_company()
+
+
+class CursorPaginationTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            create_department(self.company, f"Dept {i}")
+
+    def test_department_list_walks_every_row_once(self):
+        seen = []
+        url = "/api/department/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(seen, list(Department.objects.order_by("creation_time", "id").values_list("id", flat=True)))
+
+    def test_cursor_of_the_sharded_pages_is_refused(self):
+        response = self.client.get("/api/department/", {"cursor": cursor("2024-01-01T00:00:00+00:00|1")})
+        self.assertEqual(response.status_code, 404)
+
+    def test_company_list_is_paginated(self):
+        response = self.client.get("/api/company/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(response.data["results"][0]["name"], "Acme")
+
+
+class BulkEmployeeRegistrationTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.department = create_department(self.company)
+
+    def row(self, username, **overrides):
+        row = {
+            "username": username, "email": f"{username}@example.com",
+            "password": "pass1234", "password_confirmation": "pass1234",
+            "first_name": "First", "last_name": "Last", "phone_number": "0100",
+            "address": "Street", "company": self.company.pk, "department": self.department.pk,
+            "date_hired": "2024-01-01", "salary": "1000.00",
+        }
+        row.update(overrides)
+        return row
+
+    def test_ndjson_upload_reports_per_row_errors(self):
+        rows = [self.row("alice"), self.row("bob", department=999), self.row("alice"), self.row("carol")]
+        body = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+        response = self.client.post("/api/register/bulk/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3, 5])
+        alice = User.objects.get(username="alice")
+        self.assertTrue(alice.check_password("pass1234"))
+        self.assertEqual(alice.employee.department, self.department)
+
+    def test_rows_that_are_not_utf8_are_reported(self):
+        lines = [json.dumps(self.row("alice")).encode(), json.dumps(self.row("b\xe9b"), ensure_ascii=False).encode("latin-1")]
+        response = self.client.post("/api/register/bulk/", b"\n".join(lines) + b"\n", content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"], [{"row": 2, "errors": {"non_field_errors": ["The row is not valid UTF-8."]}}])
+
+        header = ",".join(self.row("x")).encode()
+        rows = [",".join(str(value) for value in self.row(name).values()).encode("latin-1") for name in ("d\xe1n", "eve")]
+        response = self.client.post("/api/register/bulk/", b"\n".join([header, *rows]) + b"\n", content_type="text/csv")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [1])
+        self.assertTrue(User.objects.filter(username="eve").exists())
+
+    def test_csv_upload(self):
+        header = list(self.row("x"))
+        lines = [",".join(header)] + [",".join(str(value) for value in self.row(name).values()) for name in ("dan", "eve")]
+        response = self.client.post("/api/register/bulk/", "\n".join(lines) + "\n", content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Employee.objects.filter(user__username__in=["dan", "eve"]).count(), 2)
+
+
+class ReadThroughCacheTests(CompanyTestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        stats.reset()
+        super().setUp()
+        self.department = create_department(self.company)
+
+    def test_detail_is_served_from_cache_until_updated(self):
+        url = f"/api/company/{self.company.pk}/"
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data["name"], "Acme")
+        self.assertEqual(stats.snapshot()["hits"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(url, {"name": "Acme 2", "address": "Cairo", "email": "acme@example.com"})
+        self.assertEqual(self.client.get(url).data["name"], "Acme 2")
+
+    def test_invalidated_once_the_write_commits(self):
+        url = f"/api/company/{self.company.pk}/"
+        self.client.get(url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.company.name = "Acme 2"
+            self.company.save()
+            # a read racing the open transaction must not evict and refill the entry early
+            self.assertEqual(self.client.get(url).data["name"], "Acme")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).data["name"], "Acme 2")
+
+    def test_detail_loaded_before_the_write_committed_is_not_served(self):
+        url = f"/api/company/{self.company.pk}/"
+        # a request misses and loads the row, the write commits before it stores the row
+        key = detail_key(Company, self.company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.name = "Acme 2"
+            self.company.save()
+        store(key, {"validators": ('"stale"', None), "data": {"name": "Acme"}})
+        self.assertEqual(self.client.get(url).data["name"], "Acme 2")
+
+    def test_misses_are_loaded_from_default(self):
+        # the replica does not exist, a miss loaded from it would fail
+        with override_settings(REPLICA_DATABASES=["replica1"]):
+            self.assertEqual(self.client.get(f"/api/company/{self.company.pk}/").data["name"], "Acme")
+            self.assertEqual(len(self.client.get("/api/department/").data["results"]), 1)
+
+    def test_cascade_delete_invalidates_departments(self):
+        self.assertEqual(len(self.client.get("/api/department/").data["results"]), 1)
+        self.assertEqual(self.client.get(f"/api/department/{self.department.pk}/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.delete()
+        self.assertEqual(self.client.get("/api/department/").data["results"], [])
+        self.assertEqual(self.client.get(f"/api/department/{self.department.pk}/").status_code, 404)
+
+
+class EmployeeQueryTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.company = create_company()
+        self.department = create_department(self.company)
+        for i in range(3):
+            create_employee(
+                self.department, f"employee{i}", password="secret", last_name=f"Last {i}", date_hired=f"2024-0{i + 1}-01"
+            )
+
+    def test_login_loads_employee_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post("/api/login/", {"username": "employee0", "password": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["company"], response.data["department"]), ("Acme", "HR"))
+        employee_queries = [query for query in context.captured_queries if '"APIs_employee"' in query["sql"]]
+        self.assertEqual(len(employee_queries), 1)
+
+    def test_employee_list_query_count_does_not_grow_with_rows(self):
+        self.client.force_authenticate(User.objects.get(username="employee0"))
+        # the ETag aggregate and the page itself
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/employee/?company={self.company.pk}&hired_after=2024-02-01")
+        self.assertEqual([row["last_name"] for row in response.data["results"]], ["Last 1", "Last 2"])
+        self.assertEqual(response.data["results"][0]["department_name"], "HR")
+
+    def test_employee_list_rejects_invalid_filters(self):
+        self.client.force_authenticate(User.objects.get(username="employee0"))
+        self.assertEqual(self.client.get("/api/employee/?hired_after=yesterday").status_code, 400)
+
+
+class AnalyticsTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.hr = create_department(self.company, "HR")
+        self.it = create_department(self.company, "IT")
+        create_company("Empty", address="Giza", email="empty@example.com")
+        salaries = [(self.hr, "1000.00", "2024-01-05"), (self.hr, "3000.00", "2024-01-20"),
+                    (self.it, "2000.00", "2024-03-01"), (self.it, "4000.00", "2024-03-02")]
+        for i, (department, salary, date_hired) in enumerate(salaries):
+            create_employee(department, f"employee{i}", date_hired=date_hired, salary=salary)
+
+    def test_live_statistics(self):
+        response = self.client.get("/api/analytics/?percentiles=50,100")
+        self.assertEqual(response.status_code, 200)
+        acme, empty = response.data["companies"]
+        self.assertEqual((acme["headcount"], acme["salary_total"], acme["salary_avg"]), (4, "10000.00", "2500.00"))
+        self.assertEqual(acme["salary_percentiles"], {"50": "2000.00", "100": "4000.00"})
+        self.assertEqual((empty["headcount"], empty["salary_total"], empty["salary_min"]), (0, "0.00", None))
+        hr = response.data["departments"][0]
+        self.assertEqual((hr["salary_min"], hr["salary_max"], hr["salary_percentiles"]["50"]), ("1000.00", "3000.00", "1000.00"))
+        self.assertEqual([(m["month"], m["hires"]) for m in response.data["hiring_by_month"]], [("2024-01", 2), ("2024-03", 2)])
+
+    def test_invalid_percentiles(self):
+        self.assertEqual(self.client.get("/api/analytics/?percentiles=0").status_code, 400)
+
+    def test_summary_is_refreshed_incrementally(self):
+        with override_settings(PAYROLL_SUMMARY_ENABLED=True):
+            call_command("refresh_payroll_summary", stdout=open("/dev/null", "w"))
+            employee = Employee.objects.get(user__username="employee0")
+            employee.department = self.it
+            employee.save()
+            response = self.client.get("/api/analytics/?source=summary")
+            hr, it = response.data["departments"]
+            self.assertEqual((hr["headcount"], it["headcount"], it["salary_min"]), (1, 3, "1000.00"))
+            self.it.delete()
+            response = self.client.get("/api/analytics/?source=summary")
+            self.assertEqual([d["name"] for d in response.data["departments"]], ["HR"])
+            self.assertEqual(response.data["companies"][0]["salary_total"], "3000.00")
+
+
+class AsyncAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.company = create_company()
+        self.department = create_department(self.company)
+
+    def registration(self, username):
+        return {
+            "username": username, "email": f"{username}@example.com",
+            "password": "pass1234", "password_confirmation": "pass1234",
+            "first_name": "First", "last_name": "Last", "phone_number": "0100",
+            "address": "Street", "company": self.company.pk, "department": self.department.pk,
+            "date_hired": "2024-01-01", "salary": "1000.00",
+        }
+
+    async def test_register_then_login(self):
+        client = AsyncClient()
+        response = await client.post("/api/async/register/", self.registration("alice"), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        response = await client.post("/api/async/register/", self.registration("alice"), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+        response = await client.post("/api/async/login/", {"username": "alice", "password": "wrong"}, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        response = await client.post("/api/async/login/", {"username": "alice", "password": "pass1234"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["company"], response.json()["salary"]), ("Acme", "1000.00"))
+        self.assertIn("sessionid", response.cookies)
+
+    async def test_login_upgrades_outdated_hash(self):
+        user = await User.objects.acreate(username="bob", password=make_password("pass1234", hasher="pbkdf2_sha1"))
+        await Employee.objects.acreate(
+            user=user, first_name="First", last_name="Last", phone_number="0100", address="Street",
+            company=self.company, department=self.department, date_hired="2024-01-01", salary="1000.00",
+        )
+        response = await AsyncClient().post("/api/async/login/", {"username": "bob", "password": "pass1234"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        await user.arefresh_from_db()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
+
+
+class DepartmentConstraintTests(CompanyTestCase):
+
+    def test_department_names_are_unique_per_company(self):
+        department = {"name": "HR", "description": "People", "company": self.company.pk}
+        self.assertEqual(self.client.post("/api/department/", department).status_code, 201)
+        self.assertEqual(self.client.post("/api/department/", department).status_code, 400)
+        self.assertEqual(self.client.post("/api/department/", [department], format="json").status_code, 400)
+
+
+class ReadReplicaRoutingTests(TestCase):
+
+    def route(self, method):
+        seen = {}
+
+        def view(request):
+            seen["read"] = router.db_for_read(Company)
+            seen["write"] = router.db_for_write(Company)
+            return HttpResponse()
+
+        with override_settings(REPLICA_DATABASES=["replica1"]):
+            ReadReplicaMiddleware(view)(RequestFactory().generic(method, "/api/company/"))
+        return seen
+
+    def test_get_requests_read_from_replicas(self):
+        self.assertEqual(self.route("GET"), {"read": "replica1", "write": "default"})
+
+    def test_other_requests_stay_on_default(self):
+        self.assertEqual(self.route("POST"), {"read": "default", "write": "default"})
+
+    def test_sessions_and_users_are_read_from_default(self):
+        with override_settings(REPLICA_DATABASES=["replica1"]), read_from_replicas():
+            self.assertEqual([router.db_for_read(model) for model in (Session, User, DeletionJob)], ["default"] * 3)
+
+
+class ConditionalRequestTests(CompanyTestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        super().setUp()
+
+    def test_detail_not_modified(self):
+        url = f"/api/company/{self.company.pk}/"
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+        get_cache().clear()
+        for _ in range(2):  # cache miss then cache hit
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.put(url, {"name": "Acme 2", "address": "Cairo", "email": "acme@example.com"})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_changes_with_rows(self):
+        etag = self.client.get("/api/company/")["ETag"]
+        self.assertEqual(self.client.get("/api/company/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_company("Other", address="Giza", email="other@example.com")
+        self.assertEqual(self.client.get("/api/company/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_has_no_last_modified(self):
+        other = create_company("Other", address="Giza", email="other@example.com")
+        self.assertNotIn("Last-Modified", self.client.get("/api/company/"))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        # the deletion leaves max(last_updated) as it was, If-Modified-Since alone must not 304
+        response = self.client.get("/api/company/", HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual((response.status_code, len(response.data["results"])), (200, 1))
+
+    def test_put_if_match(self):
+        url = f"/api/company/{self.company.pk}/"
+        etag = self.client.get(url)["ETag"]
+        data = {"name": "Acme 2", "address": "Cairo", "email": "acme@example.com"}
+        response = self.client.put(url, data, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.client.put(url, data, HTTP_IF_MATCH=etag).status_code, 412)
+
+    def test_employee_etag_follows_department_name(self):
+        department = create_department(self.company, description="People")
+        employee = create_employee(department, "employee")
+        url = f"/api/employee/{employee.pk}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        department.name = "People"
+        department.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class MetricsTests(CompanyTestCase):
+
+    def setUp(self):
+        registry.reset()
+        super().setUp()
+
+    def test_requests_are_recorded_per_route(self):
+        response = self.client.get("/api/employee/")
+        self.assertRegex(response["Server-Timing"], r'^db;desc="2 queries";dur=[\d.]+, serialize;dur=[\d.]+, total;dur=[\d.]+$')
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn('api_request_duration_seconds_count{route="list_employee"} 1', text)
+        self.assertIn('api_db_queries_total{route="list_employee"} 2', text)
+
+    async def test_queries_of_async_views_are_counted(self):
+        response = await AsyncClient().post(
+            "/api/async/login/", {"username": "admin", "password": "wrong"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertRegex(response["Server-Timing"], r'^db;desc="1 queries"')
+
+    def test_sampling_and_slow_query_log(self):
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            self.assertNotIn("Server-Timing", self.client.get("/api/employee/"))
+        with override_settings(METRICS_SLOW_QUERY_MS=0), self.assertLogs("APIs.metrics", "WARNING"):
+            self.client.get("/api/employee/")
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_data(self):
+        call_command("seed_data", companies=2, departments=3, employees=4, stdout=open("/dev/null", "w"))
+        self.assertEqual((Company.objects.count(), Department.objects.count(), Employee.objects.count()), (2, 6, 24))
+        employee = Employee.objects.select_related("department").first()
+        self.assertEqual(employee.company_id, employee.department.company_id)
+
+    def test_benchmark_run_is_rolled_back_and_compared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f"{directory}/results.json"
+            call_command(
+                "benchmark_api", scenarios="company_list,company_update,company_delete", requests=2, warmup=0,
+                output=output, stdout=open("/dev/null", "w"),
+            )
+            self.assertEqual(Company.objects.count(), 0)
+            with open(output) as results_file:
+                results = json.load(results_file)
+            self.assertEqual(results["scenarios"]["company_update"]["errors"], 0)
+
+            results["scenarios"]["company_list"]["p95_ms"] /= 100
+            with open(output, "w") as baseline_file:
+                json.dump(results, baseline_file)
+            with self.assertRaisesMessage(CommandError, "company_list: p95"):
+                call_command(
+                    "benchmark_api", scenarios="company_list", requests=2, warmup=0,
+                    baseline=output, stdout=open("/dev/null", "w"),
+                )
+
+
+class FastSerializerParityTests(TestCase):
+
+    def setUp(self):
+        names = ["Acme", "Ünïcødé ✓", "quote \" and \\ backslash", "line\u2028separator\u2029", "emoji 🚀"]
+        for i, name in enumerate(names):
+            company = create_company(name, address=f"Street {i}", email=f"c{i}@example.com")
+            department = create_department(company, name[:30], description=f"{name}\nmultiline")
+            create_employee(
+                department, f"employee{i}", email=f"e{i}@example.com", first_name=name[:30],
+                phone_number="+20 100", date_hired=f"2024-0{i + 1}-1{i}", salary=f"{i}1234.5",
+            )
+
+    def assert_parity(self, serializer_class, values, queryset):
+        legacy = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        fast = FastJSONRenderer().render(values.many(values.values(queryset)))
+        self.assertEqual(fast, legacy)
+        instance = queryset.first()
+        legacy = JSONRenderer().render(serializer_class(instance).data)
+        fast = FastJSONRenderer().render(values.to_representation(values.values(queryset.filter(pk=instance.pk)).get()))
+        self.assertEqual(fast, legacy)
+
+    def test_company(self):
+        self.assert_parity(CompanySerializer, company_values, Company.objects.order_by("id"))
+
+    def test_department(self):
+        self.assert_parity(DepartmentSerializer, department_values, Department.objects.order_by("id"))
+
+    def test_employee(self):
+        self.assert_parity(EmployeeReadSerializer, employee_values, Employee.objects.order_by("id"))
+
+    def test_renderer_matches_json_renderer_on_other_types(self):
+        data = {
+            "datetime": datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            "date": datetime.date(2024, 1, 2), "time": datetime.time(3, 4, 5),
+            "decimal": decimal.Decimal("1.10"), "uuid": uuid.UUID(int=1), "nested": [{"a": None, "b": True}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @skipIf(orjson is None, "orjson is not installed")
+    def test_renderer_float_differences(self):
+        self.assertEqual(FastJSONRenderer().render([0.5, 1.0, 1e15]), JSONRenderer().render([0.5, 1.0, 1e15]))
+        self.assertEqual((FastJSONRenderer().render([1e16]), JSONRenderer().render([1e16])), (b"[1e16]", b"[1e+16]"))
+        self.assertEqual(FastJSONRenderer().render([float("nan"), float("inf")]), b"[null,null]")
+        with self.assertRaises(ValueError):
+            JSONRenderer().render([float("nan")])
+
+
+class ExportTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # a name the CSV writer has to quote
+        self.company.name = "Acme, Inc."
+        self.company.save()
+        self.department = create_department(self.company, description="People")
+        for i in range(3):
+            create_employee(self.department, f"employee{i}", first_name=f"First{i}", salary="1000.50")
+
+    def export(self, query):
+        response = self.client.get(f"/api/export/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv_with_joined_names(self):
+        _, content = self.export("resource=employees&output=csv")
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual((rows[0]["company_name"], rows[0]["department_name"], rows[0]["salary"]), ("Acme, Inc.", "HR", "1000.50"))
+
+    async def test_streamed_chunk_by_chunk_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.admin)
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            response = await client.get("/api/export/?resource=employees&output=ndjson")
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual([len(chunk.decode().splitlines()) for chunk in chunks], [2, 1])
+
+    @override_settings(EXPORT_SINCE_OVERLAP=0)
+    def test_incremental_ndjson(self):
+        response, content = self.export("output=ndjson")
+        watermark = response["X-Export-Watermark"]
+        self.assertEqual(len(content.splitlines()), 3)
+
+        employee = Employee.objects.get(first_name="First1")
+        employee.salary = "2000.00"
+        employee.save()
+        response, content = self.export(f"output=ndjson&since={watermark}")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row["first_name"], row["salary"]) for row in rows], [("First1", "2000.00")])
+
+        response, content = self.export(f"output=ndjson&since={response['X-Export-Watermark']}")
+        self.assertEqual(content, "")
+
+    def test_row_committed_after_the_watermark_is_in_the_overlap(self):
+        response, _ = self.export("output=ndjson")
+        watermark = Employee.objects.latest("last_updated").last_updated
+        # saved before the export's watermark by a transaction that committed after the export
+        employee = create_employee(self.department, "late", first_name="Late")
+        Employee.objects.filter(pk=employee.pk).update(last_updated=watermark - timedelta(seconds=1))
+
+        with override_settings(EXPORT_SINCE_OVERLAP=0):
+            _, content = self.export(f"output=ndjson&since={response['X-Export-Watermark']}")
+        self.assertEqual(content, "")
+        response, content = self.export(f"output=ndjson&since={response['X-Export-Watermark']}")
+        self.assertIn("Late", [json.loads(line)["first_name"] for line in content.splitlines()])
+        # the window only held rows of the overlap, the watermark does not move back
+        self.assertEqual(response["X-Export-Watermark"], self.export("output=ndjson")[0]["X-Export-Watermark"])
+
+    def test_columnar_chunks(self):
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            _, content = self.export("resource=companies&output=columnar")
+        self.assertEqual(content.splitlines()[:3], ["# chunk 0", f"id,{self.company.pk}", 'name,"Acme, Inc."'])
+
+
+class BackgroundDeletionTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.departments = [create_department(self.company, f"Dept {i}", description="People") for i in range(2)]
+        for i in range(5):
+            create_employee(self.departments[i % 2], f"employee{i}", first_name=f"First{i}")
+
+    def test_async_company_delete(self):
+        response = self.client.delete(f"/api/company/{self.company.pk}/?async=1")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data["status"], response.data["total"]), ("pending", 13))
+        self.assertEqual(response["Location"], f"/api/jobs/{response.data['id']}/")
+        # asking again does not schedule a second job
+        again = self.client.delete(f"/api/company/{self.company.pk}/", HTTP_PREFER="respond-async")
+        self.assertEqual(again.data["id"], response.data["id"])
+        self.assertTrue(Company.objects.filter(pk=self.company.pk).exists())
+
+        job = claim_next_job()
+        self.assertIsNone(claim_next_job())
+        self.assertTrue(run_job(job, batch_size=2))
+        self.assertFalse(Company.objects.exists() or Department.objects.exists() or Employee.objects.exists())
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["admin"])
+
+        status = self.client.get(response["Location"]).data
+        self.assertEqual((status["status"], status["deleted"], status["progress"]), ("done", 13, 1.0))
+
+    def test_async_department_delete_keeps_company(self):
+        response = self.client.delete(f"/api/department/{self.departments[0].pk}/?async=1")
+        self.assertEqual(response.data["total"], 7)
+        call_command("run_deletion_worker", once=True, stdout=io.StringIO())
+        self.assertEqual(DeletionJob.objects.get().status, DeletionJob.Status.DONE)
+        self.assertEqual(list(Department.objects.all()), [self.departments[1]])
+        self.assertEqual(Employee.objects.count(), 2)
+
+    def test_synchronous_delete_is_default(self):
+        response = self.client.delete(f"/api/department/{self.departments[0].pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(DeletionJob.objects.exists())
+
+
+class SearchTests(AdminClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.company = create_company("Globex Corporation", address="Alexandria", email="globex@example.com")
+        self.department = create_department(self.company, "Engineering", description="Builds things")
+        self.employee = create_employee(
+            self.department, "jsmith", email="john.smith@example.com", first_name="John", last_name="Smith",
+            phone_number="01001234",
+        )
+
+    def search(self, query):
+        response = self.client.get(f"/api/search/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_search_over_every_type(self):
+        self.assertEqual(self.search("q=glob")["results"][0]["id"], self.company.pk)
+        self.assertEqual(self.search("q=engin")["results"][0]["type"], "department")
+        results = self.search("q=smi jo")["results"]
+        self.assertEqual([(row["type"], row["id"], row["title"]) for row in results], [("employee", self.employee.pk, "John Smith")])
+        self.assertEqual(self.search("q=0100")["results"][0]["id"], self.employee.pk)
+
+    def test_typo_tolerance(self):
+        data = self.search("q=enginering")
+        self.assertTrue(data["corrected"])
+        self.assertEqual(data["results"][0]["id"], self.department.pk)
+
+    def test_index_follows_changes(self):
+        self.employee.user.email = "jane@example.com"
+        self.employee.user.save()
+        self.assertEqual(self.search("q=jane&type=employee")["results"][0]["id"], self.employee.pk)
+        self.company.delete()
+        self.assertEqual(self.search("q=globex engineering john")["results"], [])
+
+    def test_ranked_pages(self):
+        platform = create_department(self.company, "Platform", description="Engineering team")
+        for i in range(2):
+            create_department(self.company, f"Engineering {i}")
+        first = self.search("q=engineering&page_size=2")
+        self.assertEqual(len(first["results"]), 2)
+        second = self.client.get(first["next"]).data
+        self.assertIsNone(second["next"])
+        # a match in the name ranks above a match in the description only
+        self.assertEqual([row["id"] for row in second["results"]][-1], platform.pk)
+        self.assertEqual(len(first["results"] + second["results"]), 4)
+        self.assertEqual(self.search("q=engineering&type=company")["results"], [])
+
+
+class TokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("admin", password="secret")
+
+    def test_bearer_token_needs_no_session_or_user_query(self):
+        response = self.client.post("/api/token/", {"username": "admin", "password": "secret"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.client.get("/api/cache/stats/")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/cache/stats/").status_code, 200)
+
+    def test_rejected_tokens(self):
+        token, _ = issue_token(self.user)
+        expired, _ = issue_token(self.user, lifetime=-1)
+        for header in (f"Bearer {token[:-2]}", f"Bearer {expired}", "Bearer a.b.c"):
+            self.client.credentials(HTTP_AUTHORIZATION=header)
+            self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+        with override_settings(API_TOKEN_SECRET="another secret"):
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+        self.client.credentials()
+        self.assertEqual(self.client.post("/api/token/", {"username": "admin", "password": "wrong"}).status_code, 401)
+
+
+class SessionBackendTests(TestCase):
+
+    def test_purge_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f"expired{i}", session_data="", expire_date=now - timedelta(days=1)) for i in range(5)]
+            + [Session(session_key="active", session_data="", expire_date=now + timedelta(days=1))]
+        )
+        out = io.StringIO()
+        call_command("purge_expired_sessions", batch_size=2, stdout=out)
+        self.assertIn("purged 5 expired sessions", out.getvalue())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["active"])
+
+    def test_signed_cookie_sessions(self):
+        create_employee(create_department(create_company()), "admin", password="secret")
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies"):
+            client = APIClient()
+            self.assertEqual(client.post("/api/login/", {"username": "admin", "password": "secret"}).status_code, 200)
+            self.assertEqual(client.get("/api/cache/stats/").status_code, 200)
+            self.assertFalse(Session.objects.exists())
+
+
+class BatchWriteTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.departments = [create_department(self.company, f"Dept {i}", description="People") for i in range(3)]
+
+    def patch(self, resource, items, mode=""):
+        return self.client.patch(f"/api/{resource}/batch/?mode={mode or 'atomic'}", items, format="json")
+
+    def test_updates_and_upserts_in_one_transaction(self):
+        items = [
+            {"id": self.departments[0].pk, "description": "Renamed team"},
+            {"id": self.departments[1].pk, "name": "Platform"},
+            {"company": self.company.pk, "name": "Dept 2", "description": "Upserted"},
+            {"company": self.company.pk, "name": "Research", "description": "New"},
+        ]
+        # one query per step whatever the batch size
+        with self.assertNumQueries(8):
+            response = self.patch("department", items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row["status"], row["id"]) for row in response.data["results"]],
+            [
+                ("updated", self.departments[0].pk),
+                ("updated", self.departments[1].pk),
+                ("updated", self.departments[2].pk),
+                ("created", Department.objects.get(name="Research").pk),
+            ],
+        )
+        self.assertEqual(
+            list(Department.objects.order_by("pk").values_list("name", "description")),
+            [("Dept 0", "Renamed team"), ("Platform", "People"), ("Dept 2", "Upserted"), ("Research", "New")],
+        )
+        # the cached responses and the search index follow the bulk writes
+        self.assertEqual(self.client.get(f"/api/department/{self.departments[1].pk}/").data["name"], "Platform")
+        self.assertEqual(self.client.get("/api/search/?q=platform").data["results"][0]["id"], self.departments[1].pk)
+
+    def test_atomic_and_best_effort(self):
+        items = [
+            {"id": self.departments[0].pk, "name": "Dept 1"},
+            {"id": 999999, "name": "Ghost"},
+            {"company": 999999, "name": "Orphan", "description": "None"},
+            {"id": self.departments[2].pk, "description": "Kept"},
+        ]
+        response = self.patch("department", items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row["status"] for row in response.data["results"]], ["error", "error", "error", "skipped"])
+        self.assertEqual(Department.objects.get(pk=self.departments[2].pk).description, "People")
+
+        response = self.patch("department", items, mode="best_effort")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([row["status"] for row in response.data["results"]], ["error", "error", "error", "updated"])
+        self.assertEqual(Department.objects.get(pk=self.departments[2].pk).description, "Kept")
+
+    def test_company_batch(self):
+        response = self.patch("company", [
+            {"id": self.company.pk, "email": "contact@acme.example.com"},
+            {"name": "Initech", "address": "Giza", "email": "initech@example.com"},
+            {"name": "Invalid", "address": "Giza", "email": "not an email"},
+        ], mode="best_effort")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([row["status"] for row in response.data["results"]], ["updated", "created", "error"])
+        self.assertIn("email", response.data["results"][2]["errors"])
+        self.assertEqual(Company.objects.get(pk=self.company.pk).email, "contact@acme.example.com")
+        self.assertEqual(self.patch("company", {"name": "Not a list"}).status_code, 400)
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        caches["throttle"].clear()
+        self.addCleanup(caches["throttle"].clear)
+        registry.reset()
+        self.client = APIClient()
+        User.objects.create_user("admin", password="secret")
+
+    def login(self, username, password="wrong"):
+        return self.client.post("/api/login/", {"username": username, "password": password})
+
+    def test_username_bucket(self):
+        rates = {"login_ip": "100/min", "login_username": "2/min"}
+        with override_settings(THROTTLE_RATES=rates):
+            self.assertEqual([self.login("admin").status_code for _ in range(2)], [401, 401])
+            response = self.login("Admin", "secret")
+            self.assertEqual(response.status_code, 429)
+            # one token every 30 seconds, part of it already refilled by the slow hashing
+            self.assertIn(int(response["Retry-After"]), range(1, 31))
+            self.assertEqual(self.login("someone").status_code, 401)
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn('api_throttled_requests_total{scope="login_username"} 1', metrics)
+
+    def test_ip_bucket_covers_the_async_views(self):
+        with override_settings(THROTTLE_RATES={"registration_ip": "1/hour"}):
+            self.assertEqual(self.client.post("/api/register/", {}).status_code, 400)
+            self.assertEqual(self.client.post("/api/register/", {}).status_code, 429)
+            response = self.client.post("/api/async/register/", {}, format="json")
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response["Retry-After"], "3600")
+
+    def test_concurrent_takes_share_one_bucket(self):
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: take_token("bucket", 5, 5 / 60)[0], range(20)))
+        self.assertEqual(results.count(True), 5)
+        allowed, wait = take_token("bucket", 5, 5 / 60)
+        self.assertFalse(allowed)
+        self.assertLessEqual(wait, 12)
+        # refilled to capacity, not beyond, after a long pause
+        later = time.time() + 120
+        with mock.patch("time.time", return_value=later):
+            self.assertEqual([take_token("bucket", 5, 5 / 60)[0] for _ in range(6)], [True] * 5 + [False])
+
+    def test_hashing_cap(self):
+        with mock.patch.object(hashing, "_slots", threading.BoundedSemaphore(1)):
+            with hashing.hashing_slot():
+                response = self.login("admin", "secret")
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response["Retry-After"], "1")
+                response = self.client.post("/api/async/login/", {"username": "admin", "password": "secret"}, format="json")
+                self.assertEqual(response.status_code, 429)
+            self.assertEqual(self.login("admin").status_code, 401)
+        self.assertIn('api_throttled_requests_total{scope="password_hashing"} 2', self.client.get("/metrics").content.decode())
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("admin", password="secret")
+        self.addCleanup(buffer.clear)
+
+    async def open_stream(self, path, headers=None):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(path, headers=headers)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        return lambda: asyncio.wait_for(anext(stream), 5)
+
+    def commit_company(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_company()
+
+    async def test_changes_are_streamed_after_commit(self):
+        next_message = await self.open_stream("/api/events/?models=company")
+        company = await sync_to_async(self.commit_company)()
+        lines = (await next_message()).decode().splitlines()
+        self.assertEqual(lines[1], "event: company")
+        payload = json.loads(lines[2].removeprefix("data: "))
+        self.assertEqual((payload["action"], payload["pk"], payload["data"]["name"]), ("created", company.pk, "Acme"))
+
+    async def test_resume_from_last_event_id(self):
+        first = broker.publish("company", "created", 1, {"id": 1})
+        second = broker.publish("department", "deleted", 2)
+        next_message = await self.open_stream("/api/events/", headers={"Last-Event-ID": str(first.id - 1)})
+        self.assertEqual(await next_message(), first.encode().encode())
+        self.assertEqual(await next_message(), second.encode().encode())
+
+        # too old to be in the history: the client has to reload its lists
+        next_message = await self.open_stream("/api/events/", headers={"Last-Event-ID": "1"})
+        self.assertEqual(await next_message(), f"id: {second.id}\nevent: reset\ndata: {{}}\n\n".encode())
+
+    def test_slow_subscriber_is_cut_off(self):
+        queue = asyncio.Queue()
+        subscription = Subscription(None, queue, {"company"}, limit=2)
+        for i in range(4):
+            subscription.deliver(Event(i, "company", "updated", 1, {}))
+        self.assertEqual([queue.get_nowait().id, queue.get_nowait().id, queue.get_nowait()], [0, 1, None])
+        self.assertTrue(queue.empty())
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get("/api/events/").status_code, 403)
+
+    def test_refused_under_wsgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/events/").status_code, 501)
+
+
+class FrontendTests(TestCase):
+
+    def setUp(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        settings_override = override_settings(STATIC_ROOT=static_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        get_shell.cache_clear()
+        self.addCleanup(get_shell.cache_clear)
+
+    def test_shell_is_precompressed_and_points_to_fingerprinted_assets(self):
+        response = self.client.get("/dashboard", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual((response["Content-Encoding"], response["Cache-Control"]), ("gzip", "no-cache"))
+        shell = gzip.decompress(response.content).decode()
+        self.assertRegex(shell, r'src="/static/js/main\.90679472\.[0-9a-f]{12}\.js"')
+        self.assertEqual(self.client.get("/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        script = re.search(r'src="(/static/js/[^"]+)"', shell).group(1)
+        response = self.client.get(script, HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Disposition"], f'inline; filename="{script.rpartition("/")[2]}"')
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        compressed = b"".join(response.streaming_content)
+
+        response = self.client.get(script)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(gzip.decompress(compressed), b"".join(response.streaming_content))
+
+    @override_settings(DEBUG=True)
+    def test_shell_is_rendered_again_with_debug_when_the_template_changes(self):
+        with mock.patch("APIs.frontend.render_to_string", wraps=render_to_string) as render:
+            etag = self.client.get("/").headers["ETag"]
+            self.assertEqual(self.client.get("/dashboard").headers["ETag"], etag)
+            self.assertEqual(render.call_count, 1)
+            with mock.patch("APIs.frontend.os.stat") as stat:
+                stat.return_value.st_mtime_ns = 1
+                self.client.get("/")
+            self.assertEqual(render.call_count, 2)
+
+    def test_unfingerprinted_files_are_revalidated(self):
+        response = self.client.get("/static/admin/css/base.css")
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+        response.close()
+        self.assertEqual(self.client.get("/static/js/missing.js").status_code, 404)
+
+
+class AuditHistoryTests(AdminClientMixin, TestCase):
+
+    def setUp(self):
+        buffer.clear()
+        self.addCleanup(buffer.clear)
+        super().setUp()
+        # written to the history on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company = create_company()
+            self.hr = create_department(self.company, "HR", description="People")
+            self.it = create_department(self.company, "IT", description="Computers")
+            self.employee = create_employee(self.hr, "mona", first_name="Mona", last_name="Adel", address="Cairo")
+
+    def change(self, instance, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in fields.items():
+                setattr(instance, name, value)
+            instance.save()
+        return timezone.now()
+
+    def test_changes_are_buffered_and_written_in_batches(self):
+        # written on commit by default
+        self.assertEqual((AuditRecord.objects.count(), len(buffer)), (4, 0))
+        with override_settings(AUDIT_BUFFER_SIZE=2):
+            self.change(self.employee, salary="1500")
+            self.assertEqual((AuditRecord.objects.count(), len(buffer)), (4, 1))
+            # a save without changes is not kept
+            self.change(self.employee)
+            self.assertEqual((AuditRecord.objects.count(), len(buffer)), (5, 0))
+
+        response = self.client.get(f"/api/employee/{self.employee.pk}/history/")
+        self.assertEqual(response.status_code, 200)
+        created, raised = response.data["results"]
+        self.assertEqual(created["action"], "created")
+        self.assertEqual(created["changes"]["salary"], [None, "1000.00"])
+        self.assertEqual(raised["action"], "updated")
+        self.assertEqual(raised["changes"], {"salary": ["1000.00", "1500.00"]})
+        self.assertEqual(raised["state"]["department"], self.hr.pk)
+
+    def test_history_is_flushed_and_read_on_default_during_read_only_requests(self):
+        # the replica does not exist, any read routed to it would fail
+        with override_settings(REPLICA_DATABASES=["replica1"]):
+            response = self.client.get(f"/api/employee/{self.employee.pk}/history/")
+            self.assertEqual([record["action"] for record in response.data["results"]], ["created"])
+            response = self.client.get(f"/api/employee/{self.employee.pk}/as-of/", {"at": self.change(self.employee).isoformat()})
+            self.assertEqual(response.status_code, 200)
+
+    def test_flushes_arriving_out_of_order(self):
+        def record(salary, at):
+            self.employee.salary = salary
+            return AuditRecord(
+                model="employee", object_id=self.employee.pk, action="updated", recorded_at=at, state=snapshot(self.employee)
+            )
+        now = timezone.now()
+        # another process flushes the later raise first
+        write([record("300", now + timezone.timedelta(seconds=2))])
+        write([record("200", now + timezone.timedelta(seconds=1))])
+        response = self.client.get(f"/api/employee/{self.employee.pk}/history/?fields=salary")
+        self.assertEqual(
+            [record["changes"]["salary"] for record in response.data["results"]],
+            [[None, "1000.00"], ["1000.00", "200.00"], ["200.00", "300.00"]],
+        )
+
+    def test_salary_and_department_history(self):
+        self.change(self.employee, salary="1200")
+        self.change(self.employee, address="Giza")
+        self.change(self.employee, department=self.it)
+        response = self.client.get(f"/api/employee/{self.employee.pk}/history/?fields=salary,department")
+        self.assertEqual(
+            [record["changes"].get("salary") or record["changes"]["department"] for record in response.data["results"]],
+            [[None, "1000.00"], ["1000.00", "1200.00"], [self.hr.pk, self.it.pk]],
+        )
+        response = self.client.get(f"/api/employee/{self.employee.pk}/history/?fields=bonus")
+        self.assertEqual(response.status_code, 400)
+
+    def test_state_as_of_a_date(self):
+        before = self.employee.creation_time - timezone.timedelta(seconds=1)
+        hired = self.change(self.employee, salary="1200")
+        moved = self.change(self.employee, salary="2000", department=self.it)
+
+        pk = self.employee.pk
+
+        def state(at):
+            return self.client.get(f"/api/employee/{pk}/as-of/?at={quote(at.isoformat())}")
+
+        self.assertEqual(state(before).status_code, 404)
+        self.assertEqual((state(hired).data["state"]["salary"], state(hired).data["state"]["department"]), ("1200.00", self.hr.pk))
+        self.assertEqual((state(moved).data["state"]["salary"], state(moved).data["state"]["department"]), ("2000.00", self.it.pk))
+        # the latest record before the date, one index seek
+        with self.assertNumQueries(1):
+            as_of(Employee, pk, hired)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.delete()
+        self.assertEqual(state(timezone.now()).status_code, 404)
+        self.assertEqual(state(moved).status_code, 200)
+
+    def test_department_put_and_batch_writes_are_audited(self):
+        renamed = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f"/api/department/{self.hr.pk}/",
+                {"name": "People", "description": "People", "company": self.company.pk},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+            renamed = timezone.now()
+            response = self.client.patch(
+                "/api/department/batch/",
+                [{"company": self.company.pk, "name": "People", "description": "Humans"}],
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(f"/api/department/{self.hr.pk}/history/")
+        self.assertEqual(
+            [(record["action"], record["changes"]) for record in response.data["results"][1:]],
+            [("updated", {"name": ["HR", "People"]}), ("updated", {"description": ["People", "Humans"]})],
+        )
+        response = self.client.get(f"/api/department/{self.hr.pk}/as-of/", {"at": renamed.isoformat()})
+        self.assertEqual(response.data["state"], {"name": "People", "description": "People", "company": self.company.pk})
+
+
+@override_settings(SHARD_DATABASES=["shard1", "shard2"])
+class ShardingTests(AdminClientMixin, TransactionTestCase):
+    # the two spare shards the settings declare for the test runs
+    databases = {"default", "shard1", "shard2"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # migrated before the override, so without their id ranges
+        for alias in ("shard1", "shard2"):
+            reserve_id_range(alias)
+
+    def setUp(self):
+        get_cache().clear()
+        caches["throttle"].clear()
+        buffer.clear()
+        self.addCleanup(buffer.clear)
+        # the search table is not emptied with the models' tables between the tests
+        search.rebuild()
+        super().setUp()
+        self.acme = self.client.post("/api/company/", {"name": "Acme", "address": "Cairo", "email": "a@example.com"}).data["id"]
+        self.nile = self.client.post("/api/company/", {"name": "Nile", "address": "Giza", "email": "n@example.com"}).data["id"]
+
+    def department(self, company, name):
+        response = self.client.post("/api/department/", {"name": name, "description": name, "company": company})
+        self.assertEqual(response.status_code, 201)
+        return response.data["id"]
+
+    def register(self, company, department, username):
+        response = APIClient().post("/api/register/", {
+            "username": username, "email": f"{username}@example.com", "password": "Secret-pass-123",
+            "password_confirmation": "Secret-pass-123", "first_name": "Mona", "last_name": "Adel",
+            "phone_number": "0100", "address": "Cairo", "company": company, "department": department,
+            "date_hired": "2020-01-01", "salary": "1000",
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        return Employee.objects.using(self.shard(company)).get(user__username=username)
+
+    def shard(self, company):
+        return CompanyShard.objects.get(company_id=company).alias
+
+    def test_rows_are_kept_on_the_shard_of_their_company(self):
+        self.assertEqual({self.shard(self.acme), self.shard(self.nile)}, {"shard1", "shard2"})
+        alias = self.shard(self.acme)
+        hr = self.department(self.acme, "HR")
+        self.assertFalse(Department.objects.using("default").filter(pk=hr).exists())
+        self.assertTrue(Department.objects.using(alias).filter(pk=hr).exists())
+        self.assertEqual(hr // ID_RANGE, int(alias.removeprefix("shard")))
+
+        employee = self.register(self.acme, hr, "mona")
+        self.assertEqual(self.client.get(f"/api/department/{hr}/").data["name"], "HR")
+        self.assertEqual(self.client.get(f"/api/employee/{employee.pk}/").data["department_name"], "HR")
+        response = APIClient().post("/api/login/", {"username": "mona", "password": "Secret-pass-123"})
+        self.assertEqual((response.status_code, response.data["company"]), (200, "Acme"))
+
+        response = self.client.put(f"/api/department/{hr}/", {"name": "HR", "description": "HR", "company": self.nile})
+        self.assertEqual(response.status_code, 400)
+
+    def test_registration_is_refused_while_the_company_moves(self):
+        hr = self.department(self.acme, "HR")
+        CompanyShard.objects.filter(company_id=self.acme).update(moving=True)
+        response = APIClient().post("/api/register/", {
+            "username": "mona", "email": "mona@example.com", "password": "Secret-pass-123",
+            "password_confirmation": "Secret-pass-123", "first_name": "Mona", "last_name": "Adel",
+            "phone_number": "0100", "address": "Cairo", "company": self.acme, "department": hr,
+            "date_hired": "2020-01-01", "salary": "1000",
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(username="mona").exists())
+
+    def test_failed_registration_leaves_no_user_or_document(self):
+        hr = self.department(self.acme, "HR")
+        with mock.patch("APIs.views.EmployeeSerializer.save", side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            self.register(self.acme, hr, "mona")
+        self.assertFalse(User.objects.filter(username="mona").exists())
+        self.assertFalse(User.objects.using(self.shard(self.acme)).filter(username="mona").exists())
+
+        # indexed once the shard's transaction commits, not when the row is saved
+        with self.assertRaises(RuntimeError), use_shard(self.shard(self.acme)):
+            with transaction.atomic(using=self.shard(self.acme)):
+                create_department(Company.objects.get(pk=self.acme), "Ghost")
+                raise RuntimeError
+        self.assertEqual(self.client.get("/api/search/?q=ghost").data["results"], [])
+        self.assertEqual(self.client.get("/api/search/?q=hr").data["results"][0]["id"], hr)
+
+    def test_payroll_summary_follows_the_database_of_the_saved_employee(self):
+        alias = self.shard(self.acme)
+        hr = self.department(self.acme, "HR")
+        with override_settings(PAYROLL_SUMMARY_ENABLED=True):
+            employee = self.register(self.acme, hr, "mona")
+            # loaded and saved without selecting the shard, as in the admin or a shell
+            employee.salary = 2000
+            employee.save()
+        self.assertEqual(PayrollSummary.objects.using(alias).get(department_id=hr).salary_total, 2000)
+        self.assertFalse(PayrollSummary.objects.using("default").exists())
+
+    def test_lists_merge_the_shards(self):
+        created = [self.department(company, f"Dept {i}") for i in range(3) for company in (self.acme, self.nile)]
+        seen, url = [], "/api/department/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            seen += [row["id"] for row in response.data["results"]]
+            url, previous = response.data["next"], response.data["previous"]
+        self.assertEqual(seen, created)
+        response = self.client.get(previous)
+        self.assertEqual([row["id"] for row in response.data["results"]], created[2:4])
+
+        departments = self.client.get("/api/analytics/").data["departments"]
+        self.assertEqual([row["id"] for row in departments], sorted(created))
+        self.assertEqual(self.client.get("/api/employee/").data["results"], [])
+        self.assertFalse(Department.objects.using("default").exists())
+
+    def test_cursor_of_the_unsharded_pages_is_refused(self):
+        self.department(self.acme, "HR")
+        for position in ("2024-01-01 00:00:00+00:00", "2024-13-01T00:00:00+00:00|1", "2024-01-01T00:00:00+00:00|x"):
+            response = self.client.get("/api/department/", {"cursor": cursor(position)})
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/department/", {"cursor": cursor("2000-01-01T00:00:00+00:00|1")})
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_batch_writes_are_split_per_shard(self):
+        hr = self.department(self.acme, "HR")
+        response = self.client.patch("/api/department/batch/", [
+            {"id": hr, "description": "People"},
+            {"company": self.nile, "name": "IT", "description": "Computers"},
+        ], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["updated", "created"])
+        self.assertEqual(Department.objects.using(self.shard(self.acme)).get(pk=hr).description, "People")
+        self.assertTrue(Department.objects.using(self.shard(self.nile)).filter(name="IT").exists())
+
+        response = self.client.patch("/api/department/batch/", [{"id": hr, "company": self.nile}], format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_move_and_delete_a_company(self):
+        source = self.shard(self.acme)
+        target = "shard2" if source == "shard1" else "shard1"
+        hr = self.department(self.acme, "HR")
+        employee = self.register(self.acme, hr, "mona")
+
+        call_command("move_company", self.acme, target, "--grace", "0", stdout=io.StringIO())
+        self.assertEqual(self.shard(self.acme), target)
+        self.assertFalse(Employee.objects.using(source).filter(pk=employee.pk).exists())
+        self.assertFalse(User.objects.using(source).filter(pk=employee.user_id).exists())
+        self.assertEqual(Employee.objects.using(target).get(pk=employee.pk).creation_time, employee.creation_time)
+        self.assertEqual(self.client.get(f"/api/department/{hr}/").status_code, 200)
+
+        self.assertEqual(self.client.delete(f"/api/company/{self.acme}/").status_code, 204)
+        self.assertFalse(Department.objects.using(target).filter(pk=hr).exists())
+        self.assertFalse(Company.objects.using(target).filter(pk=self.acme).exists())
+        self.assertFalse(CompanyShard.objects.filter(company_id=self.acme).exists())
@@ -0,0 +1,119 @@
+import hashlib
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+from .metrics import registry as metrics_registry
+
+# Token bucket rate limits of the unauthenticated, password hashing endpoints.
+# A "N/period" rate from THROTTLE_RATES is a bucket of N tokens refilled at N per
+# period: a burst of N requests passes, then one more every period / N. Buckets live
+# in the THROTTLE_CACHE_ALIAS cache, local memory by default which limits every process
+# on its own, several workers need a shared cache (THROTTLE_CACHE_BACKEND) to share them.
+# A bucket is kept as the time (ms) it will be full again, moved only
+# with the cache's atomic add / incr / decr so no lock is held across cache round trips.
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0]]
+
+
+# takes one token from a bucket, returns (allowed, seconds until the next token)
+def take_token(key, capacity, per_second):
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    interval = math.ceil(1000 / per_second)
+    burst = capacity * interval
+    # idle buckets are full, they expire once refilled and are added again
+    timeout = math.ceil(burst / 1000) + 1
+    now = int(time.time() * 1000)
+    if cache.add(key, now + interval, timeout):
+        return True, None
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        # expired between add and incr, so full again
+        cache.add(key, now + interval, timeout)
+        return True, None
+    previous = full_at - interval
+    if previous < now:
+        # full since before now, start counting from now. Concurrent requests
+        # may both catch up, which only makes the bucket emptier than it should be
+        cache.incr(key, now - previous)
+    elif full_at - now > burst:
+        cache.decr(key, interval)
+        return False, (full_at - burst - now) / 1000
+    cache.touch(key, timeout)
+    return True, None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    # identity the bucket belongs to, None to not limit the request
+    def get_key(self, request, payload):
+        raise NotImplementedError
+
+    # usable outside DRF (the async views) with the already parsed body
+    def check(self, request, payload):
+        rate = settings.THROTTLE_RATES.get(self.scope)
+        key = self.get_key(request, payload) if rate else None
+        if key is None:
+            return True
+        capacity, period = parse_rate(rate)
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        allowed, self.retry_after = take_token(f"throttle:{self.scope}:{digest}", capacity, capacity / period)
+        if not allowed:
+            metrics_registry.record_throttled(self.scope)
+        return allowed
+
+    def allow_request(self, request, view):
+        return self.check(request, request.data)
+
+    def wait(self):
+        return self.retry_after
+
+
+class ClientIPThrottle(TokenBucketThrottle):
+
+    def get_key(self, request, payload):
+        return self.get_ident(request)
+
+
+class UsernameThrottle(TokenBucketThrottle):
+
+    def get_key(self, request, payload):
+        username = payload.get("username") if hasattr(payload, "get") else None
+        return username.lower() if isinstance(username, str) and username else None
+
+
+class LoginIPThrottle(ClientIPThrottle):
+    scope = "login_ip"
+
+
+class LoginUsernameThrottle(UsernameThrottle):
+    scope = "login_username"
+
+
+class RegistrationIPThrottle(ClientIPThrottle):
+    scope = "registration_ip"
+
+
+LOGIN_THROTTLES = [LoginIPThrottle, LoginUsernameThrottle]
+REGISTRATION_THROTTLES = [RegistrationIPThrottle]
+
+
+# seconds to wait before retrying when one of the throttles refuses the request, else None
+def throttle_wait(throttle_classes, request, payload):
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.check(request, payload):
+            waits.append(throttle.wait())
+    return max(waits) if waits else None
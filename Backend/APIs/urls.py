@@ -1,16 +1,42 @@
 from django.urls import path
-from .views import EmployeeRegistrationView
+from .views import EmployeeRegistrationView, BulkEmployeeRegistrationView
 from .views import CompanyListCreateView, CompanySingleView
 from .views import DepartmentListCreateView, DepartmentSingleView
-from .views import employee_login_view, logout_view
+from .views import CompanyBatchView, DepartmentBatchView
+from .views import employee_login_view, logout_view, token_view
+from .views import EmployeeListView, EmployeeSingleView
+from .views import CompanyHistoryView, DepartmentHistoryView, EmployeeHistoryView
+from .views import CompanyAsOfView, DepartmentAsOfView, EmployeeAsOfView
+from .views import AnalyticsView, ExportView, DeletionJobView, SearchView, cache_stats_view
+from .views import async_employee_login_view, async_employee_registration_view, event_stream_view
 
 
 urlpatterns = [
     path('register/', EmployeeRegistrationView.as_view(), name="create_new_employee"),
+    path('register/bulk/', BulkEmployeeRegistrationView.as_view(), name="bulk_create_employees"),
     path('company/', CompanyListCreateView.as_view(), name="create_list_company"),
     path('company/<int:pk>/', CompanySingleView.as_view(), name="company_details"),
+    path('company/<int:pk>/history/', CompanyHistoryView.as_view(), name="company_history"),
+    path('company/<int:pk>/as-of/', CompanyAsOfView.as_view(), name="company_as_of"),
+    path('company/batch/', CompanyBatchView.as_view(), name="company_batch"),
     path('department/', DepartmentListCreateView.as_view(), name="list_create_department"),
     path('department/<int:pk>/', DepartmentSingleView.as_view(), name="department_details"),
+    path('department/<int:pk>/history/', DepartmentHistoryView.as_view(), name="department_history"),
+    path('department/<int:pk>/as-of/', DepartmentAsOfView.as_view(), name="department_as_of"),
+    path('department/batch/', DepartmentBatchView.as_view(), name="department_batch"),
+    path('employee/', EmployeeListView.as_view(), name="list_employee"),
+    path('employee/<int:pk>/', EmployeeSingleView.as_view(), name="employee_details"),
+    path('employee/<int:pk>/history/', EmployeeHistoryView.as_view(), name="employee_history"),
+    path('employee/<int:pk>/as-of/', EmployeeAsOfView.as_view(), name="employee_as_of"),
+    path('jobs/<int:pk>/', DeletionJobView.as_view(), name="deletion_job"),
+    path('events/', event_stream_view, name="events"),
+    path('search/', SearchView.as_view(), name="search"),
+    path('export/', ExportView.as_view(), name="export"),
+    path('analytics/', AnalyticsView.as_view(), name="analytics"),
     path('login/', employee_login_view, name="employee_login_view"),
+    path('token/', token_view, name="token"),
     path('logout/', logout_view, name="logout_view"),
+    path('async/register/', async_employee_registration_view, name="async_create_new_employee"),
+    path('async/login/', async_employee_login_view, name="async_employee_login_view"),
+    path('cache/stats/', cache_stats_view, name="cache_stats"),
 ]
\ No newline at end of file
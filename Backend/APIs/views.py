@@ -4,15 +4,54 @@ from rest_framework import status
 from django.contrib.auth.models import User
 from .serializers import UserRegistrationSerializer, EmployeeSerializer
 from .serializers import CompanySerializer, DepartmentSerializer
-from .models import Employee, Company, Department
+from .serializers import EmployeeFilterSerializer, ExportQuerySerializer, DeletionJobSerializer
+from .serializers import company_values, department_values, employee_values
+from .models import Employee, Company, Department, DeletionJob, AuditRecord
 from django.shortcuts import get_object_or_404
-from django.contrib.auth import authenticate, login, logout
-from django.http import HttpRequest
-from rest_framework.decorators import api_view
-from django.contrib.sessions.models import Session
+from django.urls import reverse
+from django.contrib.auth import authenticate, login, logout, alogin
+from django.contrib.auth.hashers import make_password
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.db import IntegrityError, transaction
+from functools import cache
+from asgiref.sync import sync_to_async
+import asyncio
+from collections.abc import Mapping
+import json
+import math
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
+from .pagination import CreationTimeCursorPagination, AuditCursorPagination
+from .bulk import iter_rows, iter_chunks, register_chunk, CSV_CONTENT_TYPE, NDJSON_CONTENT_TYPES
+from .bulk import validate_chunk, insert_chunk
+from .hashing import run_hashing, verify_password, hashing_slot, HashingBusy
+from .throttling import LOGIN_THROTTLES, REGISTRATION_THROTTLES, throttle_wait
+from django.conf import settings
+from .cache import detail_key, list_key, stats as cache_stats
+from .conditional import conditional_cached_response, conditional_response, precondition_response
+from .conditional import detail_validators, list_validators, instance_validators, add_validator_headers
+from .serializers import AnalyticsQuerySerializer, CompanyAnalyticsSerializer, SearchQuerySerializer
+from .serializers import AuditRecordSerializer, AuditHistoryQuerySerializer, AsOfQuerySerializer
+from .serializers import DepartmentAnalyticsSerializer, HiringMonthSerializer
+from . import analytics, audit, search, sharding
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from .jobs import schedule_deletion
+from .batch import batch_write, MODES as BATCH_MODES
+from .authentication import issue_token, decode_token
+from .events import broker as event_broker, MODEL_NAMES as EVENT_MODELS
+from rest_framework.exceptions import AuthenticationFailed
+from .export import Export, CONTENT_TYPES as EXPORT_CONTENT_TYPES, format_value as format_export_value
+from .metrics import registry as metrics_registry
+from .routers import read_from_default
 
 class EmployeeRegistrationView(APIView):
+
+    # rate limited per client IP, hashing the password takes one of the hashing slots
+    throttle_classes = REGISTRATION_THROTTLES
+
     def post(self, request):
         # Extract data related to the user from the request
         username = request.data.get("username")
@@ -29,7 +68,10 @@ class EmployeeRegistrationView(APIView):
         # Validate the extracted data using the custom User serializer created then save the user
         user_serializer = UserRegistrationSerializer(data=user_data)
         if user_serializer.is_valid():
-            user = user_serializer.save()
+            # refuse a company being moved before its employee's user is created
+            alias = sharding.shard_of(request.data.get("company"), for_write=True)
+            with hashing_slot():
+                user = user_serializer.save()
 
             # Extract employee-specific data
             first_name = request.data.get("first_name")
@@ -54,27 +96,79 @@ class EmployeeRegistrationView(APIView):
                 "salary": salary,
             }
 
-            # Validate and save the employee
-            employee_serializer = EmployeeSerializer(data=employee_data)
-            if employee_serializer.is_valid():
-                employee_serializer.save()
+            # Validate and save the employee on the database of its company. The user was
+            # created on default, outside this transaction: delete it if the employee is
+            # invalid or could not be saved
+            saved = False
+            try:
+                with sharding.use_shard(alias), transaction.atomic(using=alias):
+                    employee_serializer = EmployeeSerializer(data=employee_data)
+                    if employee_serializer.is_valid():
+                        sharding.copy_users([user], alias)
+                        employee_serializer.save()
+                        saved = True
+            finally:
+                if not saved:
+                    user.delete()
+            if saved:
                 return Response({"message": "Employee registered successfully"}, status=status.HTTP_201_CREATED)
-            else:
-                # Delete the user if employee data is invalid
-                user.delete()
-                return Response(employee_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response(employee_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkEmployeeRegistrationView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # registers many employees from a CSV or NDJSON body, one row per employee with the
+    # same fields as the single registration endpoint. The body is consumed as a stream
+    # and every chunk of rows is validated and inserted in its own transaction
+    def post(self, request):
+        content_type = request.content_type.split(";")[0].strip()
+        if content_type != CSV_CONTENT_TYPE and content_type not in NDJSON_CONTENT_TYPES:
+            return Response(
+                {"message": f"Unsupported media type \"{content_type}\", send text/csv or application/x-ndjson"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+
+        chunk_size = settings.BULK_REGISTRATION_CHUNK_SIZE
+        created = 0
+        errors = []
+        rows = iter_rows(request.stream or [], content_type)
+        for index, chunk in enumerate(iter_chunks(rows, chunk_size)):
+            chunk_created, chunk_errors = register_chunk(chunk, first_row=index * chunk_size + 1)
+            created += chunk_created
+            errors += chunk_errors
+
+        response_status = status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED
+        return Response({"created": created, "errors": errors}, status=response_status)
+
+def wants_async(request):
+    return (
+        request.query_params.get("async") in ("1", "true")
+        or "respond-async" in request.headers.get("Prefer", "")
+    )
+
+def deletion_job_accepted(job):
+    return Response(
+        DeletionJobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": reverse("deletion_job", args=[job.pk])},
+    )
+
 class CompanyListCreateView(APIView):
 
     permission_classes = [IsAuthenticated]
 
-    # retreive all records of the Company table from database
+    # retreive one cursor page of records of the Company table from the cache or the database
     def get(self, request):
-        companies = Company.objects.all()
-        serializer = CompanySerializer(companies, many=True)
-        return Response(serializer.data)
+        def load_page():
+            paginator = CreationTimeCursorPagination()
+            companies = paginator.paginate_queryset(company_values.values(Company.objects.all()), request, view=self)
+            return paginator.get_paginated_response(company_values.many(companies)).data
+        return conditional_cached_response(
+            request, list_key(Company, request), lambda: list_validators(Company.objects.all()), load_page
+        )
 
     #creates a new Company and stores it in the database
     def post(self, request):
@@ -88,41 +182,110 @@ class CompanySingleView(APIView):
 
     permission_classes = [IsAuthenticated]
 
-    # handle GET calls for a single Company object to retrieve it
+    # handle GET calls for a single Company object to retrieve it from the cache or the database
     def get(self, request, pk):
-        company = get_object_or_404(Company, pk=pk)
-        serializer = CompanySerializer(company)
-        return Response(serializer.data)
+        def load_company():
+            company = company_values.values(Company.objects.filter(pk=pk)).first()
+            if company is None:
+                raise Http404
+            return company_values.to_representation(company)
+        return conditional_cached_response(
+            request, detail_key(Company, pk), lambda: detail_validators(Company.objects.all(), pk), load_company
+        )
 
-    # handle PUT call to udpate any company instance
+    # handle PUT call to udpate any company instance, send If-Match with the ETag of the
+    # version being edited to get a 412 instead of overwriting someone else's change
     def put(self, request, pk):
-        company = get_object_or_404(Company, pk=pk)
-        serializer = CompanySerializer(company, data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+        # the row stays locked between the If-Match check and the save
+        with transaction.atomic():
+            company = get_object_or_404(Company.objects.select_for_update(), pk=pk)
+            precondition_failed = precondition_response(request, instance_validators(company))
+            if precondition_failed is not None:
+                return precondition_failed
+            serializer = CompanySerializer(company, data=request.data)
+            if serializer.is_valid():
+                company = serializer.save()
+                return add_validator_headers(Response(serializer.data), instance_validators(company))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # handles deleting a company from the database with a certain primary key
+    # handles deleting a company from the database with a certain primary key,
+    # with ?async=1 (or Prefer: respond-async) it is deleted by the background worker
     def delete(self, request, pk):
         company = get_object_or_404(Company, pk=pk)
+        if wants_async(request):
+            return deletion_job_accepted(schedule_deletion(company))
         company.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class BatchWriteView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    model = None
+
+    # PATCH a JSON list of partial updates (items with an id) and new rows (items without
+    # one, departments are upserted on company + name) applied in a single transaction.
+    # ?mode=atomic (default) writes nothing when an item is invalid, ?mode=best_effort
+    # writes the valid ones. The response has the result of every item
+    def patch(self, request):
+        mode = request.query_params.get("mode", "atomic")
+        if mode not in BATCH_MODES:
+            return Response({"mode": [f"Expected one of {', '.join(BATCH_MODES)}"]}, status=status.HTTP_400_BAD_REQUEST)
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"message": "Expected a JSON list of items"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BATCH_WRITE_MAX_ITEMS:
+            return Response(
+                {"message": f"At most {settings.BATCH_WRITE_MAX_ITEMS} items per batch"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        batch = batch_write(self.model, items)
+        try:
+            results = batch.run(mode)
+        except IntegrityError:
+            return Response(
+                {"message": "The batch conflicts with a concurrent change, nothing was written"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if not batch.errors:
+            response_status = status.HTTP_200_OK
+        elif mode == "atomic":
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({"results": results}, status=response_status)
+
+
+class CompanyBatchView(BatchWriteView):
+    model = Company
+
+
+class DepartmentBatchView(BatchWriteView):
+    model = Department
+
+
 class DepartmentListCreateView(APIView):
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        departments = Department.objects.all()
-        serializer = DepartmentSerializer(departments, many=True)
-        return Response(serializer.data)
+        def load_page():
+            paginator = CreationTimeCursorPagination()
+            departments = paginator.paginate_queryset(department_values.values(Department.objects.all()), request, view=self)
+            return paginator.get_paginated_response(department_values.many(departments)).data
+        return conditional_cached_response(
+            request, list_key(Department, request), lambda: list_validators(Department.objects.all()), load_page
+        )
 
+    # the department is created on the database of its company
     def post(self, request):
-        serializer = DepartmentSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        company = request.data.get("company") if isinstance(request.data, Mapping) else None
+        alias = sharding.shard_of(company, for_write=True)
+        with sharding.use_shard(alias), transaction.atomic(using=alias):
+            serializer = DepartmentSerializer(data=request.data)
+            if serializer.is_valid():
+                serializer.save()
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class DepartmentSingleView(APIView):
@@ -130,51 +293,319 @@ class DepartmentSingleView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        department = get_object_or_404(Department, pk=pk)
-        serializer = DepartmentSerializer(department)
-        return Response(serializer.data)
+        # the shard is only looked up on a cache miss, and once
+        shard = cache(lambda: sharding.locate(Department, pk=pk))
+
+        def load_validators():
+            with sharding.use_shard(shard()):
+                return detail_validators(Department.objects.all(), pk)
+
+        def load_department():
+            with sharding.use_shard(shard()):
+                department = department_values.values(Department.objects.filter(pk=pk)).first()
+            if department is None:
+                raise Http404
+            return department_values.to_representation(department)
+        return conditional_cached_response(request, detail_key(Department, pk), load_validators, load_department)
 
     def put(self, request, pk):
-        department = get_object_or_404(Department, pk=pk)
-        serializer = DepartmentSerializer(department, data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+        alias = sharding.locate(Department, for_write=True, pk=pk)
+        # the row stays locked between the If-Match check and the save
+        with sharding.use_shard(alias), transaction.atomic(using=alias):
+            department = get_object_or_404(Department.objects.select_for_update(), pk=pk)
+            precondition_failed = precondition_response(request, instance_validators(department))
+            if precondition_failed is not None:
+                return precondition_failed
+            serializer = DepartmentSerializer(department, data=request.data)
+            if serializer.is_valid():
+                company = serializer.validated_data["company"]
+                if sharding.shard_of(company.pk, for_write=True) != alias:
+                    return Response(
+                        {"company": ["A department cannot be moved to a company kept on another database."]},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                department = serializer.save()
+                return add_validator_headers(Response(serializer.data), instance_validators(department))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, pk):
-        department = get_object_or_404(Department, pk=pk)
-        department.delete()
+        alias = sharding.locate(Department, for_write=True, pk=pk)
+        with sharding.use_shard(alias):
+            department = get_object_or_404(Department, pk=pk)
+            if wants_async(request):
+                return deletion_job_accepted(schedule_deletion(department))
+            department.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+# an employee is rendered with the names of its company and department
+EMPLOYEE_RELATED_VALIDATORS = ("company", "department")
+
+class EmployeeListView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # retreive one cursor page of employees, optionally filtered by
+    # ?company=, ?department=, ?hired_after= and ?hired_before=
+    def get(self, request):
+        filters = EmployeeFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        employees = Employee.objects.filter(**filters.lookups())
+        # the employees of one company are on its shard, the others on every shard
+        company = filters.validated_data.get("company")
+        alias = sharding.shard_of(company) if company is not None else None
+
+        def load_page():
+            paginator = CreationTimeCursorPagination()
+            with sharding.use_shard(alias):
+                page = paginator.paginate_queryset(employee_values.values(employees), request, view=self)
+            return paginator.get_paginated_response(employee_values.many(page)).data
+        with sharding.use_shard(alias):
+            validators = list_validators(employees, related=EMPLOYEE_RELATED_VALIDATORS)
+        return conditional_response(request, validators, load_page)
+
+class EmployeeSingleView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        alias = sharding.locate(Employee, pk=pk)
+
+        def load_employee():
+            with sharding.use_shard(alias):
+                employee = employee_values.values(Employee.objects.filter(pk=pk)).first()
+            if employee is None:
+                raise Http404
+            return employee_values.to_representation(employee)
+        with sharding.use_shard(alias):
+            validators = detail_validators(Employee.objects.all(), pk, related=EMPLOYEE_RELATED_VALIDATORS)
+        return conditional_response(request, validators, load_employee)
+
+
+class DeletionJobView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # status and progress of a background deletion
+    def get(self, request, pk):
+        job = get_object_or_404(DeletionJob, pk=pk)
+        return Response(DeletionJobSerializer(job).data)
+
+
+class AuditHistoryView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    model = None
+
+    # append-only history of one row, oldest change first, one cursor page at a time.
+    # Every record has the full state after the change and the changed fields as
+    # {field: [old, new]}, ?fields=salary,department keeps the ones changing these fields
+    def get(self, request, pk):
+        query = AuditHistoryQuerySerializer(
+            data=request.query_params, context={"tracked_fields": audit.tracked_fields(self.model)}
+        )
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        # the changes of this process still waiting in the buffer are part of the history,
+        # they are read back from default where they were just written
+        with read_from_default():
+            audit.buffer.flush()
+            records = audit.history(self.model, pk, **query.validated_data)
+            paginator = AuditCursorPagination()
+            page = paginator.paginate_queryset(records, request, view=self)
+        return paginator.get_paginated_response(AuditRecordSerializer(page, many=True).data)
+
+
+class AsOfView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    model = None
+
+    # state of one row at ?at= (ISO 8601 date and time), read from the latest audit
+    # record before it with a single index seek
+    def get(self, request, pk):
+        query = AsOfQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        at = query.validated_data["at"]
+        with read_from_default():
+            audit.buffer.flush()
+            record = audit.as_of(self.model, pk, at)
+        if record is None or record.action == AuditRecord.Action.DELETED:
+            return Response(
+                {"message": f"No {self.model._meta.verbose_name} {pk} at {at.isoformat()}"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response({"id": pk, "at": at, "recorded_at": record.recorded_at, "state": record.state})
+
+
+class CompanyHistoryView(AuditHistoryView):
+    model = Company
+
+
+class DepartmentHistoryView(AuditHistoryView):
+    model = Department
+
+
+class EmployeeHistoryView(AuditHistoryView):
+    model = Employee
+
+
+class CompanyAsOfView(AsOfView):
+    model = Company
+
+
+class DepartmentAsOfView(AsOfView):
+    model = Department
+
+
+class EmployeeAsOfView(AsOfView):
+    model = Employee
+
+
+class ExportView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # streams a whole table as CSV, NDJSON or column-wise CSV chunks with memory usage
+    # independent of its size. Pass the X-Export-Watermark of the previous export as
+    # ?since= to only get the rows created or updated after it (and in the overlap before it)
+    def get(self, request):
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        resource = query.validated_data["resource"]
+        output_format = query.validated_data["output"]
+        export = Export(resource, since=query.validated_data.get("since"))
+
+        if isinstance(request._request, ASGIRequest):
+            content = export.astream(output_format, settings.EXPORT_CHUNK_SIZE)
+        else:
+            content = export.stream(output_format, settings.EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[output_format])
+        extension = "ndjson" if output_format == "ndjson" else "csv"
+        response.headers["Content-Disposition"] = f'attachment; filename="{resource}.{extension}"'
+        if export.watermark is not None:
+            response.headers["X-Export-Watermark"] = format_export_value(export.watermark)
+        elif "since" in query.validated_data:
+            # nothing changed, the next export keeps the same starting point
+            response.headers["X-Export-Watermark"] = format_export_value(query.validated_data["since"])
+        return response
+
+
+class SearchView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # ranked prefix search over employees, companies and departments backed by the
+    # full-text index, misspelled words are replaced by the closest indexed ones
+    def get(self, request):
+        query = SearchQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        page, page_size = query.validated_data["page"], query.validated_data["page_size"]
+        results, corrected = search.search(
+            query.validated_data["q"],
+            kinds=query.validated_data.get("type"),
+            limit=page_size + 1,
+            offset=(page - 1) * page_size,
+        )
+
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, "page", page + 1) if len(results) > page_size else None
+        previous_url = None
+        if page > 2:
+            previous_url = replace_query_param(url, "page", page - 1)
+        elif page == 2:
+            previous_url = remove_query_param(url, "page")
+        return Response({
+            "next": next_url,
+            "previous": previous_url,
+            "corrected": corrected,
+            "results": results[:page_size],
+        })
+
+
+class AnalyticsView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    # headcount and salary statistics per company and department plus a monthly hiring
+    # histogram, every figure is computed by the database with grouped aggregates
+    def get(self, request):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if query.validated_data["source"] == "summary":
+            if not settings.PAYROLL_SUMMARY_ENABLED:
+                return Response(
+                    {"message": "The materialized payroll summary is disabled"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            def load():
+                return (*analytics.summary_salary_stats(), analytics.hiring_histogram())
+        else:
+            percentiles = query.validated_data.get("percentiles", analytics.DEFAULT_PERCENTILES)
+
+            def load():
+                return (
+                    analytics.company_salary_stats(percentiles),
+                    analytics.department_salary_stats(percentiles),
+                    analytics.hiring_histogram(),
+                )
+        companies, departments, hiring = analytics.across_shards(load)
+
+        return Response({
+            "companies": CompanyAnalyticsSerializer(companies, many=True).data,
+            "departments": DepartmentAnalyticsSerializer(departments, many=True).data,
+            "hiring_by_month": HiringMonthSerializer(hiring, many=True).data,
+        })
+
+
+# columns loaded by the login views, the related names come from the same joined query
+EMPLOYEE_LOGIN_FIELDS = (
+    "first_name", "last_name", "phone_number", "address", "date_hired", "salary",
+    "user", "company__name", "department__name",
+)
+
+def employee_login_queryset():
+    return Employee.objects.select_related("company", "department").only(*EMPLOYEE_LOGIN_FIELDS)
+
+def employee_login_data(user, employee):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": employee.first_name,
+        "last_name": employee.last_name,
+        "email": user.email,
+        "phone_number": employee.phone_number,
+        "address": employee.address,
+        "company": employee.company.name,
+        "department": employee.department.name,
+        "date_hired": employee.date_hired,
+        "salary": str(employee.salary),  # Convert Decimal to string for JSON serialization
+    }
+
 @api_view(["POST"])
+@throttle_classes(LOGIN_THROTTLES)
 def employee_login_view(request: HttpRequest):
     if request.method == "POST":
         username = request.data.get("username")
         password = request.data.get("password")
-        user = authenticate(request=request, username=username, password=password)
+        with hashing_slot():
+            user = authenticate(request=request, username=username, password=password)
 
         if user is not None:
             login(request, user)
 
             # Get additional employee data
             try:
-                employee = Employee.objects.get(user=user)
-                employee_data = {
-                    "id": user.id,
-                    "username": user.username,
-                    "first_name": employee.first_name,
-                    "last_name": employee.last_name,
-                    "email": user.email,
-                    "phone_number": employee.phone_number,
-                    "address": employee.address,
-                    "company": employee.company.name,
-                    "department": employee.department.name,
-                    "date_hired": employee.date_hired,
-                    "salary": str(employee.salary),  # Convert Decimal to string for JSON serialization
-                }
-                return Response(employee_data)
+                # one joined query instead of lazily loading the company and department
+                with sharding.use_shard(sharding.locate(Employee, user_id=user.pk)):
+                    employee = employee_login_queryset().get(user=user)
+                return Response(employee_login_data(user, employee))
             except Employee.DoesNotExist:
                 return Response(
                     {"message": "Employee profile does not exist"},
@@ -186,9 +617,207 @@ def employee_login_view(request: HttpRequest):
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
+# issues a bearer token for the stateless token authentication, see APIs/authentication.py
+@api_view(["POST"])
+@throttle_classes(LOGIN_THROTTLES)
+def token_view(request: HttpRequest):
+    with hashing_slot():
+        user = authenticate(request=request, username=request.data.get("username"), password=request.data.get("password"))
+    if user is None:
+        return Response(
+            {"message": "Username or password is incorrect"},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+    token, claims = issue_token(user)
+    return Response({"access": token, "token_type": "Bearer", "expires_in": claims["exp"] - claims["iat"]})
+
 @api_view(["POST"])
 def logout_view(request: HttpRequest):
+    # logout() flushes the session, which also deletes it from the session store
     logout(request)
-    Session.objects.filter(session_key=request.session.session_key).delete()
 
-    return Response({"message": "successfully loged out !!!"})
\ No newline at end of file
+    return Response({"message": "successfully loged out !!!"})
+
+
+# Prometheus scrape endpoint with the per route metrics of this process
+@require_GET
+def metrics_view(request):
+    return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def cache_stats_view(request: HttpRequest):
+    return Response(cache_stats.snapshot())
+
+
+# Async variants of the login and registration endpoints for ASGI deployments
+# (managementsystem.asgi). Database access stays on Django's async ORM while the
+# password hashing runs on the bounded hashing pool, so a worker keeps serving
+# other requests while hashes are computed on every core.
+
+def _request_payload(request):
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+    return request.POST.dict()
+
+# same 429 as DRF's throttling for the plain Django async views
+def _too_many_requests(wait):
+    response = JsonResponse({"detail": "Request was throttled."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response.headers["Retry-After"] = str(math.ceil(wait))
+    return response
+
+@csrf_exempt
+@require_POST
+async def async_employee_login_view(request):
+    payload = _request_payload(request)
+    if not isinstance(payload, dict):
+        return JsonResponse({"message": "Malformed request body"}, status=status.HTTP_400_BAD_REQUEST)
+    wait = await sync_to_async(throttle_wait, thread_sensitive=False)(LOGIN_THROTTLES, request, payload)
+    if wait is not None:
+        return _too_many_requests(wait)
+    username = payload.get("username")
+    password = payload.get("password")
+
+    user = await User.objects.filter(username=username).afirst() if username and password else None
+    try:
+        with hashing_slot():
+            if user is None:
+                # hash anyway so unknown usernames take as long as wrong passwords, like ModelBackend
+                if password:
+                    await run_hashing(make_password, password)
+                valid = False
+            else:
+                valid, outdated = await run_hashing(verify_password, password, user.password)
+                valid = valid and user.is_active
+                if valid and outdated:
+                    # transparent upgrade to the configured hasher profile / cost
+                    user.password = await run_hashing(make_password, password)
+                    await user.asave(update_fields=["password"])
+    except HashingBusy as busy:
+        return _too_many_requests(busy.wait)
+
+    if not valid:
+        return JsonResponse(
+            {"message": "Username or password is incorrect"},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    user.backend = settings.AUTHENTICATION_BACKENDS[0]
+    await alogin(request, user)
+    alias = await sync_to_async(sharding.locate)(Employee, user_id=user.pk) if sharding.is_sharded() else None
+    try:
+        with sharding.use_shard(alias):
+            employee = await employee_login_queryset().aget(user=user)
+    except Employee.DoesNotExist:
+        return JsonResponse(
+            {"message": "Employee profile does not exist"},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    return JsonResponse(employee_login_data(user, employee))
+
+@csrf_exempt
+@require_POST
+async def async_employee_registration_view(request):
+    payload = _request_payload(request)
+    if not isinstance(payload, dict):
+        return JsonResponse({"message": "Malformed request body"}, status=status.HTTP_400_BAD_REQUEST)
+    wait = await sync_to_async(throttle_wait, thread_sensitive=False)(REGISTRATION_THROTTLES, request, payload)
+    if wait is not None:
+        return _too_many_requests(wait)
+
+    accepted, errors = await sync_to_async(validate_chunk)([payload], first_row=1)
+    if errors:
+        return JsonResponse(errors[0]["errors"], status=status.HTTP_400_BAD_REQUEST)
+    try:
+        with hashing_slot():
+            password_hash = await run_hashing(make_password, accepted[0]["password"])
+    except HashingBusy as busy:
+        return _too_many_requests(busy.wait)
+    try:
+        await sync_to_async(insert_chunk)(accepted, [password_hash])
+    except sharding.CompanyMoving as moving:
+        return JsonResponse({"message": moving.detail}, status=moving.status_code)
+    except IntegrityError:
+        # lost a race with another registration of the same username
+        return JsonResponse(
+            {"username": [User._meta.get_field("username").error_messages["unique"]]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return JsonResponse({"message": "Employee registered successfully"}, status=status.HTTP_201_CREATED)
+
+
+# Server-Sent Events stream of the company / department / employee changes, meant for
+# ASGI servers (managementsystem.asgi) where an open stream costs no worker thread.
+# ?models=company,department picks the models. A reconnecting EventSource sends its
+# Last-Event-ID and gets the events it missed, or a "reset" event asking it to reload
+# its lists when they are no longer in the history
+@require_GET
+async def event_stream_view(request):
+    if not await _stream_authenticated(request):
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=status.HTTP_403_FORBIDDEN
+        )
+    # under WSGI the endless stream would be buffered in full on a throwaway event loop,
+    # holding a worker forever without ever delivering an event
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"message": "The change feed needs an ASGI server (managementsystem.asgi)"},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+    known = set(EVENT_MODELS.values())
+    models = {name for name in request.GET.get("models", "").split(",") if name} or known
+    if not models <= known:
+        return JsonResponse(
+            {"models": [f"Expected a comma separated list of {', '.join(sorted(known))}"]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID") or request.GET["last_event_id"])
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    subscription, missed, latest = event_broker.subscribe(
+        asyncio.get_running_loop(), asyncio.Queue(), models, last_event_id
+    )
+    response = StreamingHttpResponse(_event_stream(subscription, missed, latest), content_type="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # keeps nginx from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+async def _stream_authenticated(request):
+    auth = request.headers.get("Authorization", "").split()
+    if len(auth) == 2 and auth[0].lower() == "bearer":
+        try:
+            decode_token(auth[1])
+        except AuthenticationFailed:
+            return False
+        return True
+    return (await request.auser()).is_authenticated
+
+async def _event_stream(subscription, missed, latest):
+    try:
+        yield f"retry: {settings.EVENT_RETRY_MS}\n\n"
+        if missed is None:
+            yield f"id: {latest}\nevent: reset\ndata: {{}}\n\n"
+            missed = []
+        for event in missed:
+            yield event.encode()
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # comment line keeping proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                # fell too far behind, the EventSource reconnects and resumes
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            yield event.encode()
+    finally:
+        event_broker.unsubscribe(subscription)
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve it with an ASGI server (e.g. ``uvicorn managementsystem.asgi:application``)
+to run the async login / registration endpoints under /api/async/ natively and
+to serve the /api/events/ change feed, whose open streams then cost no thread.
 """
 
 import os
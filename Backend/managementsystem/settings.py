@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,7 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'APIs.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'APIs.middleware.ReadReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -76,13 +80,289 @@ WSGI_APPLICATION = 'managementsystem.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment, SQLite in the project directory by default:
+#   DATABASE_ENGINE         e.g. django.db.backends.postgresql
+#   DATABASE_NAME           database name, or the file path for SQLite (relative to BASE_DIR)
+#   DATABASE_USER / DATABASE_PASSWORD / DATABASE_HOST / DATABASE_PORT
+#   DATABASE_CONN_MAX_AGE   seconds to keep server connections open (persistent connections)
+#   DATABASE_POOL=1         use the driver connection pool (PostgreSQL + psycopg 3)
+#   DATABASE_REPLICAS       comma separated replica hosts (or SQLite files) that serve
+#                           GET requests, except the sessions, users, deletion jobs, audit
+#                           history and the cache misses of the company and department
+#                           endpoints, see APIs.routers.ReadReplicaRouter
+#   DATABASE_SHARDS         comma separated hosts (or SQLite files) of the shards holding the
+#                           departments and employees of the companies placed on them, run
+#                           "manage.py migrate --database shardN" for each, see APIs.sharding
+#   DATABASE_WAL=0          keep SQLite files in rollback journal mode. Write-ahead logging is
+#                           on by default so readers run concurrently with the writer, but
+#                           the mode is stored in the file and -wal / -shm files are left
+#                           next to it: set DATABASE_WAL=0 to keep a committed development
+#                           database untouched
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'django.db.backends.sqlite3')
+DATABASE_REPLICAS = [name for name in os.environ.get('DATABASE_REPLICAS', '').split(',') if name]
+DATABASE_SHARDS = [name for name in os.environ.get('DATABASE_SHARDS', '').split(',') if name]
+DATABASE_WAL = os.environ.get('DATABASE_WAL', '1') == '1'
+
+if DATABASE_ENGINE == 'django.db.backends.sqlite3':
+    def sqlite_database(name):
+        return {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': BASE_DIR / name,
+            'OPTIONS': {
+                # wait for the write lock instead of failing with "database is locked"
+                'timeout': int(os.environ.get('DATABASE_BUSY_TIMEOUT', 20)),
+                # in WAL mode take the write lock when the transaction starts so a
+                # transaction never has to upgrade its read lock, which SQLite cannot wait
+                # for. The rollback journal keeps deferred transactions, so only the
+                # transactions that write take the lock
+                'transaction_mode': 'IMMEDIATE' if DATABASE_WAL else 'DEFERRED',
+                # WAL lets readers run concurrently with the writer, synchronous=NORMAL is
+                # only safe against power loss in WAL mode
+                'init_command': (
+                    ('PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' if DATABASE_WAL else '')
+                    + 'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+            },
+        }
+
+    DATABASES = {'default': sqlite_database(os.environ.get('DATABASE_NAME', 'db.sqlite3'))}
+    for index, name in enumerate(DATABASE_REPLICAS, start=1):
+        DATABASES[f'replica{index}'] = sqlite_database(name)
+    for index, name in enumerate(DATABASE_SHARDS, start=1):
+        DATABASES[f'shard{index}'] = sqlite_database(name)
+else:
+    def server_database(host):
+        database = {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.environ.get('DATABASE_NAME', 'managementsystem'),
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+        if os.environ.get('DATABASE_POOL') == '1':
+            # the pool owns the connections, persistent connections must be off
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS'] = {'pool': True}
+        return database
+
+    DATABASES = {'default': server_database(os.environ.get('DATABASE_HOST', ''))}
+    for index, host in enumerate(DATABASE_REPLICAS, start=1):
+        DATABASES[f'replica{index}'] = server_database(host)
+    for index, host in enumerate(DATABASE_SHARDS, start=1):
+        DATABASES[f'shard{index}'] = server_database(host)
+
+# aliases of the replicas and of the shards, see APIs.routers
+REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith('replica')]
+SHARD_DATABASES = [alias for alias in DATABASES if alias.startswith('shard')]
+
+# two spare shards for the sharding tests, created and migrated by the test runner like
+# default and only used by the tests enabling them with override_settings(SHARD_DATABASES=...)
+if sys.argv[1:2] == ['test']:
+    for alias in ('shard1', 'shard2'):
+        if alias not in DATABASES:
+            DATABASES[alias] = copy.deepcopy(DATABASES['default'])
+            if DATABASE_ENGINE != 'django.db.backends.sqlite3':
+                DATABASES[alias]['TEST'] = {'NAME': f"test_{DATABASES[alias]['NAME']}_{alias}"}
+
+# replicas share the default test database
+for alias in DATABASES:
+    if alias.startswith('replica'):
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['APIs.routers.ShardRouter', 'APIs.routers.ReadReplicaRouter']
+
+# threads querying the shards in parallel for the requests spanning every company
+SHARD_FANOUT_WORKERS = int(os.environ.get('SHARD_FANOUT_WORKERS', 8))
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'APIs.pagination.CreationTimeCursorPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'APIs.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # default number of rows per page for the cursor paginated list endpoints,
+    # clients can ask for a different size with ?page_size=
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    # sessions as before, plus stateless "Authorization: Bearer" tokens from /api/token/
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'APIs.authentication.JWTAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+# signing key and lifetime (seconds) of the API tokens, they cannot be revoked
+API_TOKEN_SECRET = os.environ.get('API_TOKEN_SECRET', SECRET_KEY)
+API_TOKEN_LIFETIME = int(os.environ.get('API_TOKEN_LIFETIME', 900))
+
+
+# Request metrics
+# share of the requests measured by APIs.middleware.MetricsMiddleware (0 - 1) and the
+# duration above which a SQL query is logged to the "APIs.metrics" logger
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+METRICS_SLOW_QUERY_MS = float(os.environ.get('METRICS_SLOW_QUERY_MS', 200))
+
+
+# Bulk employee onboarding
+# rows validated and inserted per transaction by /api/register/bulk/
+BULK_REGISTRATION_CHUNK_SIZE = int(os.environ.get('BULK_REGISTRATION_CHUNK_SIZE', 500))
+
+# threads used to hash passwords in parallel, PBKDF2 releases the GIL
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+
+# logins / registrations hashing at once per process, the next ones get a 429 asking
+# to come back after PASSWORD_HASHING_RETRY_AFTER seconds instead of piling up
+PASSWORD_HASHING_MAX_IN_FLIGHT = int(os.environ.get('PASSWORD_HASHING_MAX_IN_FLIGHT', PASSWORD_HASHING_WORKERS * 4))
+PASSWORD_HASHING_RETRY_AFTER = int(os.environ.get('PASSWORD_HASHING_RETRY_AFTER', 1))
+
+
+# Rate limiting
+# token buckets of the login (per client IP and per username) and registration (per
+# client IP) endpoints, "N/period" allows bursts of N and N per period on average.
+# Behind a reverse proxy set NUM_PROXIES in REST_FRAMEWORK so X-Forwarded-For is used.
+# Leave a rate empty to disable it.
+THROTTLE_RATES = {
+    'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '30/min'),
+    'login_username': os.environ.get('THROTTLE_LOGIN_USERNAME', '10/min'),
+    'registration_ip': os.environ.get('THROTTLE_REGISTRATION_IP', '20/min'),
+}
+# cache holding the buckets, local memory limits every process on its own so set
+# THROTTLE_CACHE_BACKEND to a shared cache (redis, memcached, ...) with several workers
+THROTTLE_CACHE_ALIAS = 'throttle'
+
+
+# Batch writes
+# largest list accepted by PATCH /api/company/batch/ and /api/department/batch/ and the
+# rows written per bulk statement
+BATCH_WRITE_MAX_ITEMS = int(os.environ.get('BATCH_WRITE_MAX_ITEMS', 1000))
+BATCH_WRITE_CHUNK_SIZE = int(os.environ.get('BATCH_WRITE_CHUNK_SIZE', 500))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# local memory by default, point CACHE_BACKEND / CACHE_LOCATION at a shared
+# cache (redis, memcached, ...) when running several processes
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    'throttle': {
+        'BACKEND': os.environ.get('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttle'),
+    },
+    'sessions': {
+        'BACKEND': os.environ.get('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', 'sessions'),
+    },
 }
 
+# cache alias and timeout (seconds) of the company / department read-through cache
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.1/topics/http/sessions/
+# SESSION_BACKEND picks where login sessions live:
+#   db              one session query on every authenticated request
+#   cached_db       read through the "sessions" cache, written through to the database
+#   cache           "sessions" cache only, use a shared persistent cache in production
+#   signed_cookies  kept in the signed cookie itself, nothing stored on the server
+# run "manage.py purge_expired_sessions" periodically with the database backends
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'db')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = 'sessions'
+
+
+# Change feed
+# events kept to resume reconnecting /api/events/ clients, events queued per client
+# before a slow client is disconnected, keepalive interval and reconnection delay
+EVENT_HISTORY_SIZE = int(os.environ.get('EVENT_HISTORY_SIZE', 1000))
+EVENT_CLIENT_QUEUE_SIZE = int(os.environ.get('EVENT_CLIENT_QUEUE_SIZE', 100))
+EVENT_KEEPALIVE_SECONDS = float(os.environ.get('EVENT_KEEPALIVE_SECONDS', 15))
+EVENT_RETRY_MS = int(os.environ.get('EVENT_RETRY_MS', 3000))
+
+
+# Background deletes
+# rows removed per transaction by "manage.py run_deletion_worker", how often an idle
+# worker looks for new jobs and after how long a running job without progress is retried
+DELETION_BATCH_SIZE = int(os.environ.get('DELETION_BATCH_SIZE', 500))
+DELETION_WORKER_POLL_SECONDS = float(os.environ.get('DELETION_WORKER_POLL_SECONDS', 2))
+DELETION_JOB_STALE_SECONDS = int(os.environ.get('DELETION_JOB_STALE_SECONDS', 300))
+
+
+# Audit history
+# every change of a company, department or employee is kept in the AuditRecord table.
+# Records are written when their transaction commits. AUDIT_BUFFER_SIZE > 1 buffers
+# them per process and writes them together once that many are pending, or after the
+# first request finishing AUDIT_FLUSH_SECONDS later; buffered records are lost if the
+# process is killed
+AUDIT_ENABLED = os.environ.get('AUDIT_ENABLED', '1') == '1'
+AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', 1))
+AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', 1))
+
+
+# Data export
+# rows fetched per database round trip by the streaming /api/export/ endpoint
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+# an export with ?since= also sends the rows updated up to this many seconds before it,
+# so rows whose transaction committed after the previous export are not missed
+EXPORT_SINCE_OVERLAP = float(os.environ.get('EXPORT_SINCE_OVERLAP', 60))
+
+
+# Payroll analytics
+# keep the materialized PayrollSummary table up to date on every Employee write so
+# /api/analytics/?source=summary can be served without scanning the employees,
+# run "manage.py refresh_payroll_summary" after turning it on
+PAYROLL_SUMMARY_ENABLED = os.environ.get('PAYROLL_SUMMARY_ENABLED', '') == '1'
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+# PASSWORD_HASHER_PROFILE picks the hasher used for new passwords, the other ones stay
+# listed so older hashes still verify and are upgraded on the next successful login.
+# argon2 needs "pip install argon2-cffi" and bcrypt needs "pip install bcrypt".
+# Leaving a cost setting at 0 keeps Django's default for that hasher.
+
+PASSWORD_HASHER_PROFILES = {
+    'pbkdf2': 'APIs.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'APIs.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'APIs.hashers.TunedBCryptSHA256PasswordHasher',
+}
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', 'pbkdf2')
+
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]] + [
+    hasher for profile, hasher in PASSWORD_HASHER_PROFILES.items() if profile != PASSWORD_HASHER_PROFILE
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 0))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 0))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 0))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 0))
+PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 0))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -124,6 +404,20 @@ STATICFILES_DIRS = [
     BASE_DIR  / 'templates/static',
 ]
 
+# "manage.py collectstatic" copies the assets here, fingerprinted and with their
+# gzip / brotli (when the brotli package is installed) variants, which APIs.frontend
+# serves to the clients accepting them. Fingerprinted files are cached for a year.
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+STATIC_IMMUTABLE_MAX_AGE = int(os.environ.get('STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'APIs.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
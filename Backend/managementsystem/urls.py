@@ -17,11 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from django.views.generic import TemplateView
+from APIs.frontend import SPAShellView, serve_static
+from APIs.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('APIs.urls')),
-    path('', TemplateView.as_view(template_name="index.html")),
-    path('<path:path>', TemplateView.as_view(template_name="index.html")),
+    path('metrics', metrics_view, name="metrics"),
+    path('static/<path:path>', serve_static, name="static"),
+    path('', SPAShellView.as_view()),
+    path('<path:path>', SPAShellView.as_view()),
 ]
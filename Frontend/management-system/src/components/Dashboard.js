@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Container, Row, Col, Button, Form, Table } from 'react-bootstrap';
 import axios from 'axios';
 
@@ -21,26 +21,70 @@ function Dashboard() {
     fetchDepartments();
   }, []);
 
+  // true while the change feed is connected, the lists are re-fetched after every change otherwise
+  const feedLive = useRef(false);
+
+  // Keep both lists current with the change feed instead of re-fetching them
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return undefined;
+    const applyChange = (setRows) => (message) => {
+      const { action, pk, data } = JSON.parse(message.data);
+      setRows(rows => {
+        if (action === 'deleted') return rows.filter(row => row.id !== pk);
+        if (rows.some(row => row.id === pk)) return rows.map(row => (row.id === pk ? data : row));
+        return [...rows, data];
+      });
+    };
+    const source = new EventSource('/api/events/?models=company,department');
+    source.addEventListener('company', applyChange(setCompanies));
+    source.addEventListener('department', applyChange(setDepartments));
+    source.onopen = () => {
+      feedLive.current = true;
+    };
+    // disconnected, or refused when the server is not running under ASGI: catch up from the lists
+    source.onerror = () => {
+      feedLive.current = false;
+      fetchCompanies();
+      fetchDepartments();
+    };
+    // missed too many changes while disconnected, start over from the lists
+    source.addEventListener('reset', () => {
+      fetchCompanies();
+      fetchDepartments();
+    });
+    return () => {
+      feedLive.current = false;
+      source.close();
+    };
+  }, []);
+
+  // the lists are cursor paginated, follow `next` until the last page
+  const fetchAllPages = async (url) => {
+    const rows = [];
+    while (url) {
+      const response = await axios.get(url);
+      rows.push(...response.data.results);
+      url = response.data.next;
+    }
+    return rows;
+  };
+
   const fetchCompanies = () => {
-    axios.get('/api/company/')
-      .then(response => {
-        setCompanies(response.data);
-      })
+    fetchAllPages('/api/company/')
+      .then(setCompanies)
       .catch(error => console.error('There was an error fetching companies!', error));
   };
 
   const fetchDepartments = () => {
-    axios.get('/api/department/')
-      .then(response => {
-        setDepartments(response.data);
-      })
+    fetchAllPages('/api/department/')
+      .then(setDepartments)
       .catch(error => console.error('There was an error fetching departments!', error));
   };
 
   const handleAddCompany = () => {
     axios.post('/api/company/', { name: companyName, address: companyAddress, email: companyEmail })
       .then(() => {
-        fetchCompanies();
+        if (!feedLive.current) fetchCompanies();
         setCompanyName('');
         setCompanyAddress('');
         setCompanyEmail('');
@@ -48,16 +92,19 @@ function Dashboard() {
       .catch(error => console.error('There was an error adding the company!', error));
   };
 
+  // the change feed removes the row from the list when it is connected
   const handleDeleteCompany = (id) => {
     axios.delete(`/api/company/${id}/`)
-      .then(() => fetchCompanies())
+      .then(() => {
+        if (!feedLive.current) fetchCompanies();
+      })
       .catch(error => console.error('There was an error deleting the company!', error));
   };
 
   const handleAddDepartment = () => {
     axios.post('/api/department/', { name: departmentName, description: departmentDescription, company: selectedCompanyId })
       .then(() => {
-        fetchDepartments();
+        if (!feedLive.current) fetchDepartments();
         setDepartmentName('');
         setDepartmentDescription('');
       })
@@ -66,7 +113,9 @@ function Dashboard() {
 
   const handleDeleteDepartment = (id) => {
     axios.delete(`/api/department/${id}/`)
-      .then(() => fetchDepartments())
+      .then(() => {
+        if (!feedLive.current) fetchDepartments();
+      })
       .catch(error => console.error('There was an error deleting the department!', error));
   };
 